@@ -0,0 +1,293 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import torch
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import PlainTextResponse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.training_evaluation import (
+    embed_waveforms,
+    init_pinecone,
+    init_preprocess_worker,
+    preprocess_audio_bytes,
+    preprocess_options,
+    preprocessing_signature,
+)
+from models.embedding_cache import get_embedding_cache
+from models.metrics import get_metrics, record_audio, record_failure, replay
+from models.model_registry import warmup
+from models.verification import get_verifier
+
+# HTTP service for enroll / verify / identify.
+#
+#   uvicorn app.app:app --host 0.0.0.0 --port 8000
+#
+# Uploads are decoded, denoised and VAD-trimmed in a process pool. Finished
+# waveforms queue up for the encoder, and one batcher task runs whatever
+# arrived within MAX_BATCH_WAIT_MS (at most MAX_BATCH_SIZE items) through a
+# single batched forward pass. Index calls run on a thread pool, so the
+# event loop only ever awaits. GET /metrics reports latency percentiles and
+# per-stage pipeline metrics; GET /metrics/prometheus exposes the latter in
+# Prometheus text format.
+
+MAX_BATCH_SIZE = int(os.environ.get("VB_MAX_BATCH_SIZE", 16))
+MAX_BATCH_WAIT_MS = float(os.environ.get("VB_MAX_BATCH_WAIT_MS", 5))
+PREPROCESS_WORKERS = int(os.environ.get("VB_PREPROCESS_WORKERS", 0)) or os.cpu_count() or 1
+IO_WORKERS = 8
+IDENTIFY_TOP_K = 5
+# Latency percentiles are computed over the most recent requests per route.
+LATENCY_WINDOW = 10000
+
+
+class LatencyTracker:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, error=False):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+                self._counts[name] = [0, 0]
+            self._samples[name].append(seconds)
+            self._counts[name][0] += 1
+            self._counts[name][1] += int(error)
+
+    def summary(self):
+        with self._lock:
+            snapshot = {name: (np.array(samples), self._counts[name]) for name, samples in self._samples.items()}
+        summary = {}
+        for name, (samples, (count, errors)) in snapshot.items():
+            p50, p90, p99 = np.percentile(samples, [50, 90, 99]) * 1000
+            summary[name] = {
+                "count": count,
+                "errors": errors,
+                "p50_ms": float(p50),
+                "p90_ms": float(p90),
+                "p99_ms": float(p99),
+                "max_ms": float(samples.max() * 1000),
+            }
+        return summary
+
+
+class MicroBatcher:
+    # Dynamic batching for the encoder: the first waiting request opens a
+    # batch, which closes after max_wait_ms or max_batch_size requests.
+    # Requests that arrive while a batch is running make up the next one, so
+    # batches grow with load and a lone request waits at most max_wait_ms.
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS, latencies=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.latencies = latencies
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self._queue = None
+        self._task = None
+        # A single inference thread: batches never compete for the cores.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown()
+
+    async def embed(self, waveform):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((waveform, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            waveforms = [torch.from_numpy(waveform) for waveform, _ in batch]
+            start = time.perf_counter()
+            try:
+                embeddings = await loop.run_in_executor(self._executor, embed_waveforms, waveforms, len(waveforms))
+            except Exception as e:
+                print(f"[❌ ERROR] batch of {len(batch)}: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            if self.latencies is not None:
+                self.latencies.record("stage:embed_batch", time.perf_counter() - start)
+            self.batch_sizes.append(len(batch))
+            for (_, future), embedding in zip(batch, embeddings):
+                # Skip requests whose client went away meanwhile.
+                if not future.done():
+                    future.set_result(embedding)
+
+    def stats(self):
+        sizes = np.array(self.batch_sizes) if self.batch_sizes else np.zeros(1)
+        return {
+            "batches": len(self.batch_sizes),
+            "mean_batch_size": float(sizes.mean()),
+            "max_batch_size": int(sizes.max()),
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+
+latencies = LatencyTracker()
+batcher = MicroBatcher(latencies=latencies)
+pools = {}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    loop = asyncio.get_running_loop()
+    pools["io"] = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    pools["preprocess"] = ProcessPoolExecutor(
+        max_workers=PREPROCESS_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_preprocess_worker,
+    )
+    # Load the encoder and the index, and start the preprocessing workers,
+    # before the first request rather than during it.
+    await loop.run_in_executor(pools["io"], warmup)
+    await loop.run_in_executor(pools["io"], get_verifier)
+    await asyncio.gather(*[
+        loop.run_in_executor(pools["preprocess"], init_preprocess_worker) for _ in range(PREPROCESS_WORKERS)
+    ])
+    batcher.start()
+    print(f"✅ Ready: {PREPROCESS_WORKERS} preprocessing workers, batches of up to {batcher.max_batch_size} "
+          f"within {MAX_BATCH_WAIT_MS:g} ms")
+    yield
+    await batcher.stop()
+    pools["preprocess"].shutdown()
+    pools["io"].shutdown()
+
+
+app = FastAPI(title="Voice Biometrics", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        latencies.record(request.url.path, time.perf_counter() - start, error=True)
+        raise
+    latencies.record(request.url.path, time.perf_counter() - start, error=response.status_code >= 500)
+    return response
+
+
+async def run_io(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(pools["io"], func, *args)
+
+
+async def embed_upload(file):
+    data = await file.read()
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty audio file.")
+
+    extension = os.path.splitext(file.filename or "")[1].lstrip(".").lower() or None
+    start = time.perf_counter()
+    try:
+        waveform, key, cached, events, audio_seconds = await asyncio.get_running_loop().run_in_executor(
+            pools["preprocess"], preprocess_audio_bytes, data, extension, preprocessing_signature(), preprocess_options()
+        )
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Could not process audio: {record_failure(e, 'preprocess')}")
+    replay(events)
+    preprocess_seconds = time.perf_counter() - start
+    latencies.record("stage:preprocess", preprocess_seconds)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    try:
+        embedding = await batcher.embed(waveform)
+    except Exception as e:
+        record_failure(e, "encode")
+        raise
+    latencies.record("stage:queue_and_embed", time.perf_counter() - start)
+    record_audio(audio_seconds, preprocess_seconds + time.perf_counter() - start)
+    cache = get_embedding_cache()
+    if cache and key:
+        await run_io(cache.put, key, embedding)
+    return embedding
+
+
+@app.post("/enroll")
+async def enroll(user_id: str = Form(...), file: UploadFile = File(...)):
+    embedding = await embed_upload(file)
+    await run_io(get_verifier().enroll, user_id, embedding, {"source": "api", "file": file.filename})
+    return {"user_id": user_id, "enrolled": True}
+
+
+@app.post("/verify")
+async def verify(user_id: str = Form(...), file: UploadFile = File(...)):
+    embedding = await embed_upload(file)
+    return await run_io(get_verifier().score, user_id, embedding)
+
+
+@app.post("/identify")
+async def identify(file: UploadFile = File(...), top_k: int = Form(IDENTIFY_TOP_K)):
+    embedding = await embed_upload(file)
+    result = await run_io(
+        lambda: init_pinecone().query(vector=embedding.tolist(), top_k=top_k, include_metadata=True)
+    )
+    return {
+        "matches": [
+            {"id": match["id"], "score": float(match["score"]), "metadata": match.get("metadata")}
+            for match in result["matches"]
+        ]
+    }
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    sink = get_metrics()
+    pipeline = sink.snapshot() if hasattr(sink, "snapshot") else {}
+    return {"latency": latencies.summary(), "batching": batcher.stats(), "pipeline": pipeline}
+
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    sink = get_metrics()
+    if not hasattr(sink, "prometheus_text"):
+        raise HTTPException(status_code=404, detail="The configured metrics sink has no Prometheus exporter.")
+    return PlainTextResponse(sink.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
@@ -1,7 +1,10 @@
 import sys
 import streamlit as st
 import os
+import time
+import uuid
 import datetime
+from collections import deque
 from faker import Faker
 from streamlit_webrtc import webrtc_streamer, AudioProcessorBase, WebRtcMode
 import av
@@ -10,11 +13,19 @@ import scipy.io.wavfile as wav
 
 # Custom imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from models.training_evaluation import audio_to_embedding_enhanced, init_pinecone
+from models.training_evaluation import waveform_to_embedding
+from models.verification import get_verifier
+from models.streaming import StreamingVerification
+from models.model_registry import warmup
+from models.quality import QualityMeter, assess_quality, describe
 
 # -------------------- Setup --------------------
 RECORDINGS_DIR = "data/recordings"
 USER_INPUT = "data/user_input"
+# WebRTC delivers 20 ms frames; keep at most this much of a registration.
+MAX_RECORDING_SECONDS = 60
+# How often the transfer page reruns while listening, to show an early decision.
+POLL_SECONDS = 0.5
 fake = Faker()
 
 for d in [RECORDINGS_DIR, USER_INPUT]:
@@ -23,24 +34,59 @@ for d in [RECORDINGS_DIR, USER_INPUT]:
 st.set_page_config(page_title="Voice Biometrics", layout="centered")
 st.title("🔊 Voice Biometrics")
 
+# Load the speaker encoder once per server process, not on every rerun.
+@st.cache_resource(show_spinner="Loading voice model...")
+def load_voice_model():
+    return warmup()
+
+load_voice_model()
+
 # -------------------- Navigation --------------------
 page = st.sidebar.radio("Navigation", ["Register", "Money Transfer"])
 user_id = st.text_input("Enter Your User ID")
 
 # -------------------- WebRTC Audio Processor --------------------
+def frame_to_samples(frame):
+    samples = frame.to_ndarray()
+    if not frame.format.is_planar:
+        samples = samples.reshape(-1, len(frame.layout.channels)).T
+    return samples
+
 class AudioProcessor(AudioProcessorBase):
     def __init__(self):
-        self.frames = []
+        self.frames = deque(maxlen=MAX_RECORDING_SECONDS * 50)
+        self.sample_rate = 16000
 
     def recv_audio(self, frame: av.AudioFrame) -> av.AudioFrame:
-        self.frames.append(frame.to_ndarray())
+        self.frames.append(frame_to_samples(frame))
+        self.sample_rate = frame.sample_rate
         return frame
 
-# -------------------- Helper: Save Audio --------------------
-def save_audio_frames(frames, filename, fs=16000):
+# Verifies while the user speaks: frames go straight into a bounded
+# streaming session instead of being kept until "Stop & Verify". The
+# quality meter only keeps frame statistics of the raw capture.
+class StreamingAudioProcessor(AudioProcessorBase):
+    def __init__(self, user_id):
+        self.session = StreamingVerification(user_id, get_verifier())
+        self.quality = QualityMeter()
+
+    def recv_audio(self, frame: av.AudioFrame) -> av.AudioFrame:
+        samples = frame_to_samples(frame)
+        self.quality.add(samples, frame.sample_rate)
+        self.session.feed(samples, frame.sample_rate)
+        return frame
+
+# -------------------- Helper: Frames to PCM --------------------
+def frames_to_pcm(frames):
     if frames:
-        audio = np.concatenate(frames, axis=0).astype(np.int16)
-        wav.write(filename, fs, audio)
+        return np.concatenate(frames, axis=1).astype(np.int16)
+    else:
+        return None
+
+# -------------------- Helper: Save Audio --------------------
+def save_audio_frames(audio, filename, fs=16000):
+    if audio is not None:
+        wav.write(filename, fs, audio.T)
         return filename
     else:
         return None
@@ -65,27 +111,36 @@ if page == "Register":
             st.info("🎙️ Recording... speak into your microphone.")
 
             if st.button("✅ Stop & Save Recording"):
-                frames = ctx.audio_processor.frames
-                filename = os.path.join(RECORDINGS_DIR, f"{user_id}.wav")
-                saved_file = save_audio_frames(frames, filename)
+                audio = frames_to_pcm(ctx.audio_processor.frames)
+                fs = ctx.audio_processor.sample_rate
+                # Checked before anything is saved or embedded, so a bad take
+                # can be re-recorded right away.
+                quality = assess_quality(audio, fs) if audio is not None else None
+                if quality is not None and not quality.accepted:
+                    st.error(f"🎙️ Please record again: {describe(quality)}.")
+                    saved_file = None
+                else:
+                    if quality is not None and quality.warnings:
+                        st.warning(f"⚠️ {describe(quality).capitalize()}. Registering anyway.")
+                    filename = os.path.join(RECORDINGS_DIR, f"{user_id}.wav")
+                    saved_file = save_audio_frames(audio, filename, fs)
                 if saved_file:
                     st.success(f"🎧 Audio recorded and saved: {saved_file}")
                     st.audio(saved_file, format="audio/wav")
 
                     # Generate embedding and store in Pinecone
                     try:
-                        index = init_pinecone()
-                        embedding = audio_to_embedding_enhanced(saved_file)
+                        embedding = waveform_to_embedding(audio, fs)
                         if embedding is not None:
-                            index.upsert([
-                                (user_id, embedding.tolist(), {"source": "registration", "file": f"{user_id}.wav"})
-                            ])
+                            get_verifier().enroll(
+                                user_id, embedding, {"source": "registration", "file": f"{user_id}.wav"}
+                            )
                             st.success("✅ Voice registered and stored in Pinecone.")
                         else:
                             st.error("❌ Failed to extract voice embedding.")
                     except Exception as e:
                         st.error(f"💥 Error during registration: {e}")
-                else:
+                elif audio is None:
                     st.error("❌ No audio frames captured. Please try again.")
     else:
         st.warning("⚠️ Please enter a User ID.")
@@ -94,60 +149,78 @@ if page == "Register":
 elif page == "Money Transfer":
     st.subheader("💸 Money Transfer with Voice Verification")
 
+    # One streaming session per transfer: the widget key and the phrase stay
+    # the same across reruns until the user starts a new transfer.
+    def new_transfer():
+        st.session_state.transfer_id = uuid.uuid4().hex[:8]
+        st.session_state.transfer_phrase = fake.sentence()
+        st.session_state.transfer_result = None
+
+    if "transfer_id" not in st.session_state:
+        new_transfer()
+
     recipient = st.selectbox("Send Money To", ["John", "Alice", "Bob", "Emily"])
     amount = st.number_input("Amount to Transfer ($)", min_value=1.0, step=1.0)
     note = st.text_input("Note (optional)", placeholder="e.g., for rent")
-    phrase = fake.sentence()
-    st.markdown(f"### 🗣 Please say this phrase:\n> **\"{phrase}\"**")
+    st.markdown(f"### 🗣 Please say this phrase:\n> **\"{st.session_state.transfer_phrase}\"**")
 
     if user_id:
         reference_file = os.path.join(RECORDINGS_DIR, f"{user_id}.wav")
         if os.path.exists(reference_file):
-            if "transfer_frames" not in st.session_state:
-                st.session_state.transfer_frames = []
-
             ctx = webrtc_streamer(
-                key=f"transfer-{user_id}-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
+                key=f"transfer-{user_id}-{st.session_state.transfer_id}",
                 mode=WebRtcMode.SENDRECV,
-                audio_processor_factory=AudioProcessor,
+                audio_processor_factory=lambda: StreamingAudioProcessor(user_id),
                 media_stream_constraints={"audio": True, "video": False},
             )
 
-            if ctx.audio_processor:
-                st.info("🎙️ Recording... speak the phrase now.")
-
-                if st.button("✅ Stop & Verify Recording"):
-                    frames = ctx.audio_processor.frames
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    test_path = os.path.join(USER_INPUT, f"{user_id}_test_{timestamp}.wav")
-                    saved_file = save_audio_frames(frames, test_path)
-                    if saved_file:
-                        st.success(f"🎧 Audio recorded and saved: {saved_file}")
-                        st.audio(saved_file, format="audio/wav")
-
-                        # Generate embedding and query Pinecone
-                        try:
-                            index = init_pinecone()
-                            query_embedding = audio_to_embedding_enhanced(saved_file)
-                            if query_embedding is not None:
-                                matches = index.query(vector=query_embedding.tolist(), top_k=1, include_metadata=True)
-                                if matches and matches['matches']:
-                                    match = matches['matches'][0]
-                                    st.write(f"🔍 Match Found: **{match['id']}** | Score: `{match['score']:.4f}`")
-
-                                    if match['id'] == user_id:
-                                        st.success(f"✅ Voice verified. ${int(amount)} sent to {recipient}.")
-                                        st.balloons()
-                                    else:
-                                        st.error("❌ Voice mismatch. Transaction blocked.")
-                                else:
-                                    st.warning("⚠️ No match found.")
-                            else:
-                                st.error("❌ Failed to extract embedding from test audio.")
-                        except Exception as e:
-                            st.error(f"💥 Verification failed: {e}")
+            if ctx.audio_processor and st.session_state.transfer_result is None:
+                session = ctx.audio_processor.session
+                stop = st.button("✅ Stop & Verify Recording")
+                if session.decision is not None or stop:
+                    try:
+                        result = session.finish()
+                        quality = ctx.audio_processor.quality.report()
+                        if not quality.accepted:
+                            # Whatever was scored, a bad recording does not
+                            # authorise a transfer.
+                            result = dict(result, accepted=False, reason="poor_quality", quality=describe(quality))
+                        saved_file = None
+                        speech = session.speech_audio()
+                        if len(speech):
+                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                            test_path = os.path.join(USER_INPUT, f"{user_id}_test_{timestamp}.wav")
+                            saved_file = save_audio_frames((speech * 32767).astype(np.int16), test_path, 16000)
+                        st.session_state.transfer_result = (result, saved_file)
+                        if result.get("accepted"):
+                            st.balloons()
+                    except Exception as e:
+                        st.error(f"💥 Verification failed: {e}")
+                elif ctx.state.playing:
+                    st.info("🎙️ Recording... speak the phrase now.")
+                    time.sleep(POLL_SECONDS)
+                    st.rerun()
+
+            if st.session_state.transfer_result is not None:
+                result, saved_file = st.session_state.transfer_result
+                if saved_file:
+                    st.audio(saved_file, format="audio/wav")
+                if result["reason"] == "poor_quality":
+                    st.error(f"🎙️ Please record again: {result['quality']}.")
+                elif result["reason"] == "no_speech":
+                    st.error("❌ No speech captured. Please try again.")
+                elif result["reason"] == "not_enrolled":
+                    st.warning("⚠️ No match found.")
+                else:
+                    st.write(
+                        f"🔍 Score: `{result['score']:.4f}` | Threshold: `{result['threshold']:.4f}` | "
+                        f"{result['windows']} windows, {result['speech_seconds']:.1f}s of speech"
+                    )
+                    if result["accepted"]:
+                        st.success(f"✅ Voice verified. ${int(amount)} sent to {recipient}.")
                     else:
-                        st.error("❌ No audio frames captured. Please try again.")
+                        st.error("❌ Voice mismatch. Transaction blocked.")
+                st.button("🔁 New transfer", on_click=new_transfer)
         else:
             st.error(f"🚫 No registered voice found for '{user_id}'.")
     else:
@@ -0,0 +1,439 @@
+import os
+import json
+import time
+import uuid
+import argparse
+
+import numpy as np
+
+from models.training_evaluation import EMBEDDING_DIM
+from models.vector_store import LocalVectorStore, Response
+
+# Approximate nearest-neighbour search for 1:N identification over large
+# enrolled populations, as a drop-in vector store (VB_VECTOR_STORE=ann).
+#
+# AnnVectorStore keeps everything LocalVectorStore does (float32 rows in a
+# memory-mapped file, the upsert/delete log, cross-process locking) and
+# adds an IVF index with int8 codes:
+#
+#   1. unit-normalised vectors are optionally reduced with PCA (pca_dim),
+#   2. assigned to the nearest of n_lists k-means centroids (the inverted
+#      lists), and
+#   3. the residual from that centroid is stored as one int8 per dimension.
+#
+# A query scores the rows of the nprobe lists nearest to it from their
+# codes alone, then re-ranks the best `rerank` candidates with exact cosine
+# against the float rows. Only the codes (one byte per dimension plus an
+# 8-byte row number per vector) are held in memory; the float rows are only read for the
+# re-ranked candidates.
+#
+# The quantizer is trained on a sample of the stored vectors, automatically
+# once min_train vectors are stored, or with train(). Until then queries are
+# exact. New rows are encoded as they arrive and deleted rows are skipped at
+# query time, so there is no rebuild after add or delete; retrain after the
+# population has changed a lot. Codes are persisted next to the rows and
+# shared by every handle on the directory:
+#
+#   ann_model.npz   PCA mean and components, centroids, code scales
+#   ann_codes.i8    int8 codes, one row per store row
+#   ann_lists.i32   inverted-list id per store row
+#   ann.json        model id and the log the codes line up with
+#
+#   python -m models.ann_index data/ann_index --import-store data/embeddings --train
+#   python -m models.ann_index --synthetic 200000 --report
+
+ANN_INDEX_PATH = "data/ann_index"
+# PCA is off by default: it saves memory but caps recall when speakers
+# differ in many directions.
+ANN_PCA_DIM = int(os.environ.get("VB_ANN_PCA_DIM", 0)) or None
+ANN_NPROBE = int(os.environ.get("VB_ANN_NPROBE", 4))
+ANN_RERANK = int(os.environ.get("VB_ANN_RERANK", 100))
+# Below this many vectors exact search is already fast.
+ANN_MIN_TRAIN = int(os.environ.get("VB_ANN_MIN_TRAIN", 20000))
+ANN_MAX_LISTS = 4096
+TRAIN_POINTS_PER_LIST = 64
+KMEANS_ITERATIONS = 15
+# Rows scored per block when assigning vectors to centroids.
+ASSIGN_BLOCK = 65536
+REPORT_NPROBES = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _unit(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def _nearest(points, centroids):
+    # Index of the nearest centroid for each point, one block at a time.
+    squared = (centroids * centroids).sum(axis=1)
+    nearest = np.empty(len(points), dtype=np.int32)
+    for start in range(0, len(points), ASSIGN_BLOCK):
+        block = points[start:start + ASSIGN_BLOCK]
+        nearest[start:start + len(block)] = np.argmin(squared - 2 * block @ centroids.T, axis=1)
+    return nearest
+
+
+def kmeans(points, k, iterations=KMEANS_ITERATIONS, seed=0):
+    # Lloyd's algorithm from k random points; empty clusters are re-seeded
+    # from random points.
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(points, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = points[rng.choice(len(points), int(empty.sum()))]
+    return centroids
+
+
+class AnnVectorStore(LocalVectorStore):
+    def __init__(self, path, dimension=EMBEDDING_DIM, pca_dim=ANN_PCA_DIM, nprobe=ANN_NPROBE, rerank=ANN_RERANK,
+                 min_train=ANN_MIN_TRAIN):
+        self.pca_dim = pca_dim if pca_dim and pca_dim < dimension else None
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.min_train = min_train
+        self._model_path = os.path.join(path, "ann_model.npz")
+        self._codes_path = os.path.join(path, "ann_codes.i8")
+        self._lists_path = os.path.join(path, "ann_lists.i32")
+        self._state_path = os.path.join(path, "ann.json")
+        super().__init__(path, dimension)
+
+    # -------------------- State --------------------
+
+    def _state_stamp(self):
+        try:
+            stat = os.stat(self._state_path)
+            return stat.st_ino, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        self._stamp = self._state_stamp()
+        self._model = None
+        self._codes_log_inode = None
+        if self._stamp is not None:
+            with open(self._state_path) as f:
+                state = json.load(f)
+            with np.load(self._model_path) as model:
+                self._model = {name: model[name] for name in model.files}
+            self._model["id"] = state["model_id"]
+            self._codes_log_inode = state["log_inode"]
+        self._reset_codes()
+        super()._load()
+
+    def _reset_codes(self):
+        # Rows and codes are held per inverted list, so a probe scans one
+        # contiguous block of codes.
+        width = self._code_width()
+        self._n_coded = 0
+        n_lists = len(self._model["centroids"]) if self._model else 0
+        self._postings = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._list_codes = [np.empty((0, width), dtype=np.int8) for _ in range(n_lists)]
+        self._pending = [[] for _ in range(n_lists)]
+
+    def _code_width(self):
+        if self._model is None:
+            return 0
+        return self._model["centroids"].shape[1]
+
+    def _sync(self):
+        # A retrain by another handle replaces ann.json: start over with the
+        # new model.
+        if self._state_stamp() != self._stamp:
+            self._load()
+            return
+        super()._sync()
+
+    def _apply(self, records):
+        super()._apply(records)
+        if self._model is not None and self._n_rows > self._n_coded:
+            self._extend_codes()
+
+    # -------------------- Codes --------------------
+
+    def _on_disk(self):
+        # Rows whose codes and list ids are both on disk and belong to the
+        # current log. List ids are written after codes.
+        if self._log_inode != self._codes_log_inode or not os.path.exists(self._lists_path):
+            return 0
+        width = self._code_width()
+        return min(os.path.getsize(self._lists_path) // 4, os.path.getsize(self._codes_path) // width)
+
+    def _project(self, unit_vectors):
+        if "components" not in self._model:
+            return unit_vectors
+        return (unit_vectors - self._model["mean"]) @ self._model["components"].T
+
+    def _encode(self, rows):
+        unit = np.asarray(self._matrix[rows], dtype=np.float32) * self._inv_norms[rows, None]
+        projected = self._project(unit)
+        lists = _nearest(projected, self._model["centroids"])
+        residual = (projected - self._model["centroids"][lists]) / self._model["scale"]
+        return np.clip(np.round(residual), -127, 127).astype(np.int8), lists
+
+    def _extend_codes(self):
+        start, stop = self._n_coded, self._n_rows
+        width = self._code_width()
+        on_disk = min(self._on_disk(), stop)
+        codes = np.empty((stop - start, width), dtype=np.int8)
+        lists = np.empty(stop - start, dtype=np.int32)
+        if on_disk > start:
+            n = on_disk - start
+            codes[:n] = np.fromfile(self._codes_path, dtype=np.int8, count=n * width,
+                                    offset=start * width).reshape(n, width)
+            lists[:n] = np.fromfile(self._lists_path, dtype=np.int32, count=n, offset=start * 4)
+        # Encoded a block at a time, so a rebuild never holds every float row.
+        for block in range(max(start, on_disk), stop, ASSIGN_BLOCK):
+            block_stop = min(stop, block + ASSIGN_BLOCK)
+            new_codes, new_lists = self._encode(np.arange(block, block_stop))
+            codes[block - start:block_stop - start] = new_codes
+            lists[block - start:block_stop - start] = new_lists
+            if self._log_inode == self._codes_log_inode:
+                # Rows have fixed positions, so handles that encode the same
+                # rows write the same bytes.
+                self._write_at(self._codes_path, block * width, new_codes)
+                self._write_at(self._lists_path, block * 4, new_lists)
+        self._n_coded = stop
+        self._add_postings(np.arange(start, stop), lists, codes)
+
+    @staticmethod
+    def _write_at(path, offset, array):
+        mode = "r+b" if os.path.exists(path) else "wb"
+        with open(path, mode) as f:
+            f.seek(offset)
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    def _add_postings(self, rows, lists, codes):
+        order = np.argsort(lists, kind="stable")
+        ids, starts = np.unique(lists[order], return_index=True)
+        for list_id, group in zip(ids, np.split(order, starts[1:])):
+            self._pending[list_id].append((rows[group], codes[group]))
+
+    def _posting(self, list_id):
+        # Rows of one inverted list and their codes, merged on first use.
+        pending = self._pending[list_id]
+        if pending:
+            self._postings[list_id] = np.concatenate([self._postings[list_id]] + [rows for rows, _ in pending])
+            self._list_codes[list_id] = np.concatenate([self._list_codes[list_id]] + [codes for _, codes in pending])
+            self._pending[list_id] = []
+        return self._postings[list_id], self._list_codes[list_id]
+
+    # -------------------- Training --------------------
+
+    @property
+    def trained(self):
+        return self._model is not None
+
+    def train(self, n_lists=None, sample_size=None, seed=0):
+        # Fits PCA, the inverted lists and the code scales on a sample of the
+        # stored vectors, then re-encodes every row.
+        with self._locked(exclusive=True):
+            self._sync()
+            alive = np.flatnonzero(self._alive)
+            if len(alive) == 0:
+                raise ValueError("Cannot train an empty index.")
+            n_lists = n_lists or int(np.clip(np.sqrt(len(alive)), 1, ANN_MAX_LISTS))
+            n_lists = min(n_lists, len(alive))
+            sample_size = min(len(alive), sample_size or max(TRAIN_POINTS_PER_LIST * n_lists, 10000))
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(alive, sample_size, replace=False))
+            unit = np.asarray(self._matrix[sample], dtype=np.float32) * self._inv_norms[sample, None]
+
+            model = {}
+            if self.pca_dim:
+                model["mean"] = unit.mean(axis=0)
+                _, _, vt = np.linalg.svd(unit - model["mean"], full_matrices=False)
+                model["components"] = vt[:self.pca_dim].astype(np.float32)
+            self._model = model
+            projected = self._project(unit)
+            model["centroids"] = kmeans(projected, n_lists, seed=seed).astype(np.float32)
+            residual = projected - model["centroids"][_nearest(projected, model["centroids"])]
+            # 127 steps cover all but the largest 0.1% of residuals.
+            model["scale"] = np.maximum(np.percentile(np.abs(residual), 99.9, axis=0) / 127, 1e-8).astype(np.float32)
+
+            np.savez(self._model_path + ".tmp.npz", **model)
+            os.replace(self._model_path + ".tmp.npz", self._model_path)
+            model["id"] = uuid.uuid4().hex
+            self._rebuild_codes()
+
+    def _rebuild_codes(self):
+        # Re-encodes every row with the current model; ann.json is written
+        # last, which tells other handles to reload.
+        self._codes_log_inode = self._log_inode
+        self._reset_codes()
+        for path in (self._codes_path, self._lists_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._extend_codes()
+        with open(self._state_path + ".tmp", "w") as f:
+            json.dump({"model_id": self._model["id"], "log_inode": self._log_inode,
+                       "n_lists": len(self._model["centroids"]), "pca_dim": self.pca_dim}, f)
+        os.replace(self._state_path + ".tmp", self._state_path)
+        self._stamp = self._state_stamp()
+
+    def upsert(self, vectors, **kwargs):
+        response = super().upsert(vectors, **kwargs)
+        if self._model is None and len(self._rows) >= self.min_train:
+            self.train()
+        return response
+
+    def compact(self):
+        # Row numbers change, so every row is re-encoded with the same model.
+        super().compact()
+        with self._locked(exclusive=True):
+            self._sync()
+            if self._model is not None:
+                self._rebuild_codes()
+
+    # -------------------- Search --------------------
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, nprobe=None, rerank=None,
+              **kwargs):
+        with self._locked(exclusive=False):
+            self._sync()
+            if self._model is not None:
+                query = np.asarray(vector, dtype=np.float32).reshape(-1)
+                norm = float(np.linalg.norm(query))
+                if len(self._rows) == 0 or top_k <= 0 or norm == 0:
+                    return Response(matches=[])
+                rows, scores = self._search(query / norm, top_k, nprobe or self.nprobe, rerank or self.rerank)
+
+                matches = []
+                for row, score in zip(rows, scores):
+                    vector_id = self._row_ids[row]
+                    match = Response(id=vector_id, score=float(score))
+                    if include_metadata:
+                        match["metadata"] = self._metadata.get(vector_id)
+                    if include_values:
+                        match["values"] = self._matrix[row].tolist()
+                    matches.append(match)
+                return Response(matches=matches)
+        # Untrained: exact search, which takes its own lock.
+        return super().query(vector, top_k, include_metadata, include_values)
+
+    def _search(self, unit_query, top_k, nprobe, rerank):
+        model = self._model
+        projected = self._project(unit_query[None, :])[0]
+        centroids = model["centroids"]
+        distance = (centroids * centroids).sum(axis=1) - 2 * centroids @ projected
+        probe = np.argpartition(distance, min(nprobe, len(centroids)) - 1)[:nprobe]
+
+        # Cosine from the codes: unit x ~ mean + W^T (centroid + code * scale).
+        # mean . query is the same for every row, so it is left out.
+        direction = model["components"] @ unit_query if "components" in model else unit_query
+        scaled = model["scale"] * direction
+        rows, approximate = [], []
+        for list_id in probe:
+            list_rows, codes = self._posting(list_id)
+            rows.append(list_rows)
+            approximate.append(float(centroids[list_id] @ direction) + codes.astype(np.float32) @ scaled)
+        rows, approximate = np.concatenate(rows), np.concatenate(approximate)
+        alive = self._alive[rows]
+        rows, approximate = rows[alive], approximate[alive]
+        if len(rows) == 0:
+            return [], []
+
+        rerank = max(rerank, top_k)
+        if len(rows) > rerank:
+            rows = rows[np.argpartition(-approximate, rerank - 1)[:rerank]]
+        rows = np.sort(rows)
+        exact = (np.asarray(self._matrix[rows], dtype=np.float32) @ unit_query) * self._inv_norms[rows]
+        best = np.argsort(-exact)[:top_k]
+        return rows[best], exact[best]
+
+    def exact_query(self, vector, top_k=10, **kwargs):
+        return LocalVectorStore.query(self, vector, top_k, **kwargs)
+
+
+def recall_report(index, queries, k=10, nprobes=REPORT_NPROBES, rerank=None):
+    # recall@k against exact search and per-query latency, for each nprobe.
+    exact = [{match["id"] for match in index.exact_query(q, top_k=k)["matches"]} for q in queries]
+    start = time.perf_counter()
+    for q in queries:
+        index.exact_query(q, top_k=k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    rows = []
+    for nprobe in nprobes:
+        latencies, hits = [], 0
+        for q, truth in zip(queries, exact):
+            start = time.perf_counter()
+            matches = index.query(q, top_k=k, nprobe=nprobe, rerank=rerank)["matches"]
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(truth & {match["id"] for match in matches})
+        rows.append({
+            "nprobe": nprobe,
+            f"recall@{k}": hits / (k * len(queries)),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "exact_ms": exact_ms,
+        })
+    return rows
+
+
+def perturbed_queries(index, n, noise=0.5, seed=0):
+    # Stored vectors plus noise of the given norm relative to the vector:
+    # another utterance of an enrolled speaker.
+    rng = np.random.default_rng(seed)
+    alive = np.flatnonzero(index._alive)
+    rows = rng.choice(alive, min(n, len(alive)), replace=False)
+    vectors = _unit(np.asarray(index._matrix[rows], dtype=np.float32))
+    jitter = _unit(rng.standard_normal(vectors.shape).astype(np.float32)) * noise
+    return vectors + jitter
+
+
+def synthetic_speakers(n, dim=EMBEDDING_DIM, clusters=1000, spread=0.6, seed=0):
+    # Clustered unit vectors, roughly how speaker embeddings spread.
+    rng = np.random.default_rng(seed)
+    centres = _unit(rng.standard_normal((clusters, dim)).astype(np.float32))
+    labels = rng.integers(0, clusters, n)
+    return _unit(centres[labels] + spread * _unit(rng.standard_normal((n, dim)).astype(np.float32)))
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Build, train and measure the ANN identification index.")
+    parser.add_argument("path", nargs="?", default=ANN_INDEX_PATH)
+    parser.add_argument("--import-store", help="add every row of a binary embedding store")
+    parser.add_argument("--synthetic", type=int, help="measure on this many synthetic vectors in a temp dir")
+    parser.add_argument("--train", action="store_true")
+    parser.add_argument("--lists", type=int)
+    parser.add_argument("--pca-dim", type=int, default=ANN_PCA_DIM or 0, help="0 keeps full dimensions")
+    parser.add_argument("--report", action="store_true", help="recall@k and latency against exact search")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--rerank", type=int)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix="vb-ann-") if args.synthetic else args.path
+    index = AnnVectorStore(path, pca_dim=args.pca_dim, min_train=float("inf"))
+    chunk = 50000
+    if args.synthetic:
+        vectors = synthetic_speakers(args.synthetic)
+        for start in range(0, len(vectors), chunk):
+            index.upsert([(f"syn-{i}", vectors[i], None) for i in range(start, min(len(vectors), start + chunk))])
+    if args.import_store:
+        from models.embedding_store import read_embeddings
+        matrix, ids, metadata = read_embeddings(args.import_store)
+        for start in range(0, len(ids), chunk):
+            rows = np.asarray(matrix[start:start + chunk], dtype=np.float32)
+            index.upsert(list(zip(ids[start:start + chunk], rows, metadata[start:start + chunk])))
+    if args.train or (args.synthetic and not index.trained):
+        start = time.perf_counter()
+        index.train(n_lists=args.lists)
+        print(f"✅ Trained on {len(index._rows)} vectors in {time.perf_counter() - start:.1f}s")
+    print(f"📦 {path}: {len(index._rows)} vectors, {'trained' if index.trained else 'untrained (exact search)'}")
+    if args.report:
+        if not index.trained:
+            parser.error("the index is not trained; add --train")
+        report = recall_report(index, perturbed_queries(index, args.queries), args.k, rerank=args.rerank)
+        print(f"| nprobe | recall@{args.k} | p50 ms | p95 ms | exact ms |")
+        print("|---|---|---|---|---|")
+        for row in report:
+            print(f"| {row['nprobe']} | {row[f'recall@{args.k}']:.3f} | {row['p50_ms']:.2f} | "
+                  f"{row['p95_ms']:.2f} | {row['exact_ms']:.2f} |")
@@ -0,0 +1,368 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+import numpy as np
+
+from models import embedding_cache
+from models.model_registry import active_model, configure_threads, set_active_model, thread_settings
+from models.training_evaluation import (
+    AUDIO_EXTENSIONS,
+    EMBEDDING_DIM,
+    embed_waveforms,
+    load_audio,
+    preprocess_options,
+    preprocess_waveform,
+    waveform_to_embedding,
+)
+
+# Offline, CPU-only benchmark suite over the bundled recordings.
+#
+#   python -m models.benchmark --output benchmark.json
+#   python -m models.benchmark --baseline data/benchmark_baseline.json
+#   python -m models.benchmark --save-baseline data/benchmark_baseline.json
+#
+# Every result is one number in a flat dict, and the unit is in the name.
+# Names ending in _per_s are better when higher; everything else (_ms,
+# _mb) is better when lower. Against a baseline, a metric that is worse by
+# more than the tolerance is a regression, and the CLI exits with 1.
+#
+# The embedding cache is disabled throughout, so every run embeds.
+# Baselines are per machine: save one on the box that will run the
+# comparison. Thread counts (--intra-op / VB_INTRA_OP_THREADS), the model,
+# preprocessing and the benchmark set are recorded with the results, and
+# the CLI warns when they differ from the baseline's.
+
+AUDIO_DIRS = ("data/recordings", "data/user_input")
+DEFAULT_OUTPUT = "benchmark.json"
+WARM_REPEATS = 5
+BATCH_SIZES = (1, 4, 8, 16)
+BATCH_UTTERANCES = 16
+INDEX_FILLER = 10000
+INGEST_COPIES = 4
+TOLERANCE = 0.15
+
+
+def audio_paths(dirs=AUDIO_DIRS):
+    return sorted(
+        os.path.join(d, f) for d in dirs if os.path.isdir(d) for f in os.listdir(d)
+        if f.lower().endswith(AUDIO_EXTENSIONS)
+    )
+
+
+def _ms(seconds):
+    return [s * 1000 for s in seconds]
+
+
+def _percentiles(prefix, samples_ms):
+    p50, p95 = np.percentile(samples_ms, [50, 95])
+    return {f"{prefix}_p50_ms": float(p50), f"{prefix}_p95_ms": float(p95)}
+
+
+def _rss_mb(usage):
+    # ru_maxrss is in kilobytes on Linux.
+    return usage.ru_maxrss / 1024
+
+
+@contextmanager
+def _cache_disabled():
+    # In this process and in spawned ingest workers.
+    previous, previous_env = embedding_cache.CACHE_ENABLED, os.environ.get("VB_EMBEDDING_CACHE")
+    embedding_cache.CACHE_ENABLED = False
+    os.environ["VB_EMBEDDING_CACHE"] = "0"
+    try:
+        yield
+    finally:
+        embedding_cache.CACHE_ENABLED = previous
+        if previous_env is None:
+            os.environ.pop("VB_EMBEDDING_CACHE", None)
+        else:
+            os.environ["VB_EMBEDDING_CACHE"] = previous_env
+
+
+# -------------------- Benchmarks --------------------
+
+# Runs in a fresh interpreter so the import is measured from scratch.
+COLD_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import models.training_evaluation as training_evaluation
+from models.model_registry import get_model
+imported = time.perf_counter()
+get_model()
+loaded = time.perf_counter()
+embedding = training_evaluation.audio_to_embedding_enhanced(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "model_load_ms": (loaded - imported) * 1000,
+    "first_embedding_ms": (done - loaded) * 1000,
+    "embedded": embedding is not None,
+}))
+"""
+
+
+def bench_cold(path, model_name=None):
+    # A fresh interpreter: import, model load and the first embedding.
+    env = dict(os.environ, VB_EMBEDDING_CACHE="0")
+    if model_name:
+        env["VB_MODEL_BACKEND"] = model_name
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", COLD_PROBE, path],
+                            cwd=os.getcwd(), env=env, capture_output=True, text=True, check=True)
+    total = time.perf_counter() - start
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    if not probe["embedded"]:
+        raise RuntimeError(f"Cold probe could not embed {path}")
+    return {
+        "cold.import_ms": probe["import_ms"],
+        "cold.model_load_ms": probe["model_load_ms"],
+        "cold.first_embedding_ms": probe["first_embedding_ms"],
+        "cold.process_total_ms": total * 1000,
+        "cold.peak_rss_mb": _rss_mb(resource.getrusage(resource.RUSAGE_CHILDREN)),
+    }
+
+
+def bench_warm(paths, repeats=WARM_REPEATS):
+    # One utterance at a time on a loaded model: the full pipeline from
+    # decoded PCM, preprocessing alone, and the encoder alone.
+    decoded = [load_audio(path) for path in paths]
+    prepared = [preprocess_waveform(*item) for item in decoded]
+    waveform_to_embedding(*decoded[0])
+
+    pipeline, preprocess, encode = [], [], []
+    for _ in range(repeats):
+        for item, waveform in zip(decoded, prepared):
+            start = time.perf_counter()
+            waveform_to_embedding(*item)
+            pipeline.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            preprocess_waveform(*item)
+            preprocess.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            embed_waveforms([waveform])
+            encode.append(time.perf_counter() - start)
+    seconds = np.mean([item[0].shape[-1] / item[1] for item in decoded])
+    results = {}
+    results.update(_percentiles("warm.pipeline", _ms(pipeline)))
+    results.update(_percentiles("warm.preprocess", _ms(preprocess)))
+    results.update(_percentiles("warm.encode", _ms(encode)))
+    results["warm.audio_seconds_per_s"] = float(seconds / np.median(pipeline))
+    return results
+
+
+def bench_batch(paths, batch_sizes=BATCH_SIZES, utterances=BATCH_UTTERANCES, repeats=WARM_REPEATS):
+    # Encoder throughput against batch size, on preprocessed utterances.
+    # Best of repeats passes, which is the least noisy estimate.
+    prepared = [preprocess_waveform(*load_audio(path)) for path in paths]
+    waveforms = [prepared[i % len(prepared)] for i in range(utterances)]
+    embed_waveforms(waveforms[:1])
+    results = {}
+    for batch_size in batch_sizes:
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            embed_waveforms(waveforms, batch_size)
+            best = min(best, time.perf_counter() - start)
+        results[f"batch.bs{batch_size}_utt_per_s"] = utterances / best
+    return results
+
+
+def bench_verify(paths, repeats=WARM_REPEATS, filler=INDEX_FILLER):
+    # End-to-end verify (decode to decision) against a local index holding
+    # the bundled speakers plus filler vectors, with AS-norm over a cohort
+    # drawn from the filler.
+    from models.vector_store import LocalVectorStore
+    from models.verification import COHORT_TOP_N, Cohort, Verifier
+
+    directory = tempfile.mkdtemp(prefix="vb-bench-index-")
+    try:
+        index = LocalVectorStore(directory, EMBEDDING_DIM)
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((filler, EMBEDDING_DIM)).astype(np.float32)
+        for start in range(0, filler, 1000):
+            index.upsert([(f"filler-{i}", vectors[i].tolist(), {}) for i in range(start, min(filler, start + 1000))])
+        verifier = Verifier(index, Cohort(vectors[:max(COHORT_TOP_N, filler // 10)]))
+        users = [f"user-{i}" for i in range(len(paths))]
+        for user, path in zip(users, paths):
+            verifier.enroll(user, waveform_to_embedding(*load_audio(path)))
+
+        end_to_end, scoring, query = [], [], []
+        embedding = waveform_to_embedding(*load_audio(paths[0]))
+        for _ in range(repeats):
+            for user, path in zip(users, paths):
+                start = time.perf_counter()
+                verifier.verify(user, path)
+                end_to_end.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                verifier.score(user, embedding)
+                scoring.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                index.query(vector=embedding.tolist(), top_k=5)
+                query.append(time.perf_counter() - start)
+        results = {}
+        results.update(_percentiles("verify.end_to_end", _ms(end_to_end)))
+        results.update(_percentiles("verify.score", _ms(scoring)))
+        results.update(_percentiles("verify.index_query", _ms(query)))
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_ingest(paths, copies=INGEST_COPIES, workers=None):
+    # Directory ingest into a MemorySink, over copies of the recordings.
+    from models.ingest_pipeline import MemorySink, run_ingest_pipeline
+
+    directory = tempfile.mkdtemp(prefix="vb-bench-ingest-")
+    try:
+        files = []
+        for copy in range(copies):
+            for path in paths:
+                name = f"{copy}_{os.path.basename(path)}"
+                shutil.copyfile(path, os.path.join(directory, name))
+                files.append(os.path.join(directory, name))
+        seconds = sum(waveform.shape[-1] / sr for waveform, sr in map(load_audio, paths)) * copies
+        start = time.perf_counter()
+        stats = run_ingest_pipeline(files, MemorySink(), workers=workers, progress=None)
+        elapsed = time.perf_counter() - start
+        return {
+            "ingest.files_per_s": stats.embedded / elapsed,
+            "ingest.audio_seconds_per_s": seconds / elapsed,
+            "ingest.failed_files": float(stats.failed),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+BENCHMARKS = ("cold", "warm", "batch", "verify", "ingest")
+
+
+def run_suite(paths=None, benchmarks=BENCHMARKS, repeats=WARM_REPEATS, batch_sizes=BATCH_SIZES,
+              filler=INDEX_FILLER, copies=INGEST_COPIES, workers=None):
+    paths = paths or audio_paths()
+    if not paths:
+        raise ValueError(f"No recordings found in {AUDIO_DIRS}")
+    results = {}
+    with _cache_disabled():
+        if "cold" in benchmarks:
+            results.update(bench_cold(paths[0], active_model()))
+        if "warm" in benchmarks:
+            results.update(bench_warm(paths, repeats))
+        if "batch" in benchmarks:
+            results.update(bench_batch(paths, batch_sizes, repeats=repeats))
+        if "verify" in benchmarks:
+            results.update(bench_verify(paths, repeats, filler))
+        if "ingest" in benchmarks:
+            results.update(bench_ingest(paths, copies, workers))
+    results["memory.peak_rss_mb"] = _rss_mb(resource.getrusage(resource.RUSAGE_SELF))
+    return {"meta": dict(environment(paths), benchmarks=list(benchmarks)), "results": results}
+
+
+def environment(paths):
+    import torch
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "threads": thread_settings(),
+        "model": active_model(),
+        "preprocessing": preprocess_options(),
+        "recordings": len(paths),
+    }
+
+
+# -------------------- Baseline comparison --------------------
+
+# Run settings that must match for a comparison to mean anything.
+COMPARABLE_META = ("model", "threads", "cpus", "preprocessing", "benchmarks")
+
+
+def higher_is_better(name):
+    return name.endswith("_per_s")
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    # One row per metric present in both runs; change is relative, and
+    # positive means better.
+    rows = []
+    for name, base in sorted(baseline.items()):
+        if name not in results or base == 0:
+            continue
+        change = (results[name] - base) / abs(base)
+        if not higher_is_better(name):
+            change = -change
+        rows.append({
+            "metric": name,
+            "baseline": base,
+            "current": results[name],
+            "change": change,
+            "regression": change < -tolerance,
+        })
+    return rows
+
+
+def meta_mismatches(meta, baseline_meta):
+    return [key for key in COMPARABLE_META if meta.get(key) != baseline_meta.get(key)]
+
+
+def format_comparison(rows):
+    lines = ["| metric | baseline | current | change |", "|---|---|---|---|"]
+    for row in rows:
+        flag = " ❌" if row["regression"] else ""
+        lines.append(f"| {row['metric']} | {row['baseline']:.4g} | {row['current']:.4g} | "
+                     f"{row['change']:+.1%}{flag} |")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the embedding pipeline on the bundled recordings.")
+    parser.add_argument("--audio-dir", nargs="+", default=list(AUDIO_DIRS))
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", help="also write the results here")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--repeats", type=int, default=WARM_REPEATS)
+    parser.add_argument("--filler", type=int, default=INDEX_FILLER, help="extra vectors in the verify index")
+    parser.add_argument("--copies", type=int, default=INGEST_COPIES, help="copies of each recording to ingest")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--model")
+    parser.add_argument("--intra-op", type=int)
+    parser.add_argument("--inter-op", type=int)
+    args = parser.parse_args()
+
+    configure_threads(args.intra_op, args.inter_op)
+    if args.model:
+        set_active_model(args.model)
+    report = run_suite(audio_paths(args.audio_dir), args.only, args.repeats, filler=args.filler,
+                       copies=args.copies, workers=args.workers)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    for name, value in report["results"].items():
+        print(f"{name}: {value:.4g}")
+    print(f"✅ Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in meta_mismatches(report["meta"], baseline.get("meta", {})):
+            print(f"⚠️ {key} differs from the baseline: {report['meta'].get(key)} vs {baseline['meta'].get(key)}")
+        rows = compare(report["results"], baseline["results"], args.tolerance)
+        print(format_comparison(rows))
+        regressions = [row["metric"] for row in rows if row["regression"]]
+        if regressions:
+            print(f"[❌ ERROR] {len(regressions)} metrics regressed by more than {args.tolerance:.0%}: "
+                  f"{', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
@@ -0,0 +1,170 @@
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from models.training_evaluation import EMBEDDING_DIM, UPSERT_BATCH_SIZE, init_pinecone
+
+# Bulk writer for the vector index. Upserts are network-bound, so batches
+# go out through a small thread pool on one shared index handle. At most
+# max_pending batches are queued or in flight; submit() blocks past that,
+# which pushes back on whatever is producing vectors. Failed requests are
+# retried with full-jitter exponential backoff, and a batch that still
+# fails is reported in stats()["failed_ids"] instead of aborting the load.
+
+UPSERT_WORKERS = 8
+MAX_RETRIES = 5
+BACKOFF_BASE_S = 0.25
+BACKOFF_MAX_S = 8.0
+
+
+class BulkUpserter:
+    def __init__(self, index=None, batch_size=UPSERT_BATCH_SIZE, workers=UPSERT_WORKERS, max_pending=None,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE_S, backoff_max=BACKOFF_MAX_S):
+        self.index = index if index is not None else init_pinecone()
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upsert")
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * workers)
+        self._lock = threading.Lock()
+        self._futures = []
+        self._started = None
+        self._last_done = None
+        self._latencies = []
+        self._vectors = 0
+        self._retries = 0
+        self._failed_ids = []
+
+    def submit(self, vectors, on_written=None):
+        # on_written(ids) is called from a worker thread for every batch
+        # that was stored.
+        if self._started is None:
+            self._started = time.perf_counter()
+        for i in range(0, len(vectors), self.batch_size):
+            batch = vectors[i:i + self.batch_size]
+            self._slots.acquire()
+            future = self._pool.submit(self._send, batch, on_written)
+            future.add_done_callback(lambda _: self._slots.release())
+            with self._lock:
+                self._futures.append(future)
+
+    def _send(self, batch, on_written):
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                self.index.upsert(vectors=batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"[❌ ERROR] upsert of {len(batch)} vectors failed after {attempt + 1} attempts: {e}")
+                    with self._lock:
+                        self._failed_ids.extend(_vector_id(v) for v in batch)
+                    return False
+                with self._lock:
+                    self._retries += 1
+                time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                continue
+
+            with self._lock:
+                self._last_done = time.perf_counter()
+                self._latencies.append(self._last_done - start)
+                self._vectors += len(batch)
+            if on_written is not None:
+                # The batch is stored either way; a failing callback must not
+                # turn it into a failed future that close() re-raises.
+                try:
+                    on_written([_vector_id(v) for v in batch])
+                except Exception as e:
+                    print(f"[❌ ERROR] on_written callback failed: {e}")
+            return True
+
+    def flush(self):
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+        return self.stats()
+
+    def close(self):
+        stats = self.flush()
+        self._pool.shutdown()
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+            elapsed = self._last_done - self._started if self._last_done else 0.0
+            return {
+                "vectors": self._vectors,
+                "batches": len(self._latencies),
+                "retries": self._retries,
+                "failed_ids": list(self._failed_ids),
+                "p50_batch_ms": float(np.percentile(latencies, 50) * 1000),
+                "p95_batch_ms": float(np.percentile(latencies, 95) * 1000),
+                "vectors_per_s": self._vectors / elapsed if elapsed > 0 else 0.0,
+            }
+
+
+def _vector_id(vector):
+    return vector["id"] if isinstance(vector, dict) else vector[0]
+
+
+def report(stats):
+    print(
+        f"✅ Upserted {stats['vectors']} vectors in {stats['batches']} batches | "
+        f"{stats['vectors_per_s']:.0f} vectors/s | batch p50 {stats['p50_batch_ms']:.1f} ms "
+        f"p95 {stats['p95_batch_ms']:.1f} ms | {stats['retries']} retries | "
+        f"{len(stats['failed_ids'])} failed"
+    )
+
+
+# -------------------- Local stand-in --------------------
+
+class SimulatedRemoteIndex:
+    # Adds network-like latency and random failures in front of a real
+    # index, to tune batch size / workers without a remote service.
+    def __init__(self, index, latency_s=0.05, per_vector_s=0.0002, failure_rate=0.05):
+        self.index = index
+        self.latency_s = latency_s
+        self.per_vector_s = per_vector_s
+        self.failure_rate = failure_rate
+
+    def upsert(self, vectors, **kwargs):
+        time.sleep(self.latency_s + self.per_vector_s * len(vectors))
+        if random.random() < self.failure_rate:
+            raise ConnectionError("simulated transient failure")
+        return self.index.upsert(vectors, **kwargs)
+
+
+if __name__ == "__main__":
+    from models.vector_store import LocalVectorStore
+
+    parser = argparse.ArgumentParser(description="Bulk upsert against a simulated remote index.")
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=UPSERT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=UPSERT_WORKERS)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = [(f"vec-{i}", row.tolist(), None) for i, row in
+               enumerate(rng.standard_normal((args.vectors, EMBEDDING_DIM)).astype(np.float32))]
+    with tempfile.TemporaryDirectory() as directory:
+        index = SimulatedRemoteIndex(LocalVectorStore(directory), args.latency_ms / 1000, failure_rate=args.failure_rate)
+        for workers in sorted({1, args.workers}):
+            with BulkUpserter(index, batch_size=args.batch_size, workers=workers, backoff_base=0.01) as upserter:
+                upserter.submit(vectors)
+            print(f"workers={workers}: ", end="")
+            report(upserter.stats())
@@ -0,0 +1,114 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Embeddings keyed by what produced them: a hash of the decoded PCM, its
+# sample rate and shape, and the preprocessing/model signature. Identical
+# audio therefore hits the cache whatever file name it arrives under, and
+# any change to preprocessing or the encoder changes every key.
+#
+# Two tiers: a bounded in-memory LRU per process, and .npy files on disk
+# that are shared by every process (ingest workers, the app, evaluation).
+
+CACHE_DIR = os.environ.get("VB_EMBEDDING_CACHE_DIR", "data/embedding_cache")
+CACHE_ENABLED = os.environ.get("VB_EMBEDDING_CACHE", "1") != "0"
+MEMORY_ENTRIES = 4096
+
+
+class EmbeddingCache:
+    def __init__(self, directory=CACHE_DIR, max_entries=MEMORY_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "stores": 0}
+
+    @staticmethod
+    def key(pcm, sample_rate, signature):
+        pcm = np.ascontiguousarray(pcm, dtype=np.float32)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{signature}|{sample_rate}|{pcm.shape}|".encode())
+        digest.update(memoryview(pcm).cast("B"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npy")
+
+    def _remember(self, key, embedding):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return embedding
+
+        if self.directory:
+            try:
+                embedding = np.load(self._path(key))
+            except (FileNotFoundError, ValueError, OSError):
+                embedding = None
+            if embedding is not None:
+                with self._lock:
+                    self._remember(key, embedding)
+                    self.counters["disk_hits"] += 1
+                return embedding
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, key, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, embedding)
+            self.counters["stores"] += 1
+        if self.directory:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so a concurrent reader never sees half a file.
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, embedding)
+            os.replace(tmp_path, path)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self, memory_only=False):
+        with self._lock:
+            self._memory.clear()
+        if not memory_only and self.directory and os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(".npy"):
+                        os.remove(os.path.join(root, name))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    # Process-wide cache, or None when disabled with VB_EMBEDDING_CACHE=0.
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+    return _cache
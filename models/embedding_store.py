@@ -0,0 +1,198 @@
+import os
+import csv
+import json
+import argparse
+
+import numpy as np
+
+# Binary embedding export, replacing embeddings.csv.
+#
+# A store is a directory:
+#   header.json   {"format": 1, "dtype": "float32" | "float16", "dim": 192}
+#   vectors.bin   contiguous row-major matrix, no padding
+#   ids.jsonl     one {"id": ..., "metadata": {...}} line per row
+#
+# EmbeddingWriter appends as records arrive (it is an ingest sink), so
+# nothing is held in memory. read_embeddings maps vectors.bin with
+# np.memmap, so loading a store copies nothing. Rows are written to
+# vectors.bin before their id line, and a reader only counts rows that
+# have both, so a store cut off mid-write still reads back consistently.
+#
+#   python -m models.embedding_store data/embeddings --import-csv embeddings.csv
+#   python -m models.embedding_store data/embeddings --export-csv embeddings.csv
+#   python -m models.embedding_store data/embeddings --upsert
+
+EMBEDDINGS_PATH = "data/embeddings"
+FORMAT_VERSION = 1
+DTYPES = ("float32", "float16")
+UPSERT_CHUNK = 10000
+
+
+def _paths(path):
+    return (os.path.join(path, "header.json"), os.path.join(path, "vectors.bin"),
+            os.path.join(path, "ids.jsonl"))
+
+
+def _read_header(path):
+    with open(_paths(path)[0]) as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported embedding store format {header.get('format')}")
+    return header
+
+
+def _complete_rows(path, header):
+    # Rows present in both vectors.bin and ids.jsonl, and the byte length of
+    # that many id lines.
+    _, vectors_path, ids_path = _paths(path)
+    row_bytes = header["dim"] * np.dtype(header["dtype"]).itemsize
+    rows = os.path.getsize(vectors_path) // row_bytes
+    lines, ids_bytes = 0, 0
+    with open(ids_path, "rb") as f:
+        for line in f:
+            if lines == rows or not line.endswith(b"\n"):
+                break
+            lines += 1
+            ids_bytes += len(line)
+    return lines, ids_bytes
+
+
+class EmbeddingWriter:
+    # mode "w" starts a new store; "a" appends to an existing one (creating
+    # it if needed) after dropping any half-written trailing row.
+    def __init__(self, path=EMBEDDINGS_PATH, dim=None, dtype="float32", mode="w"):
+        from models.training_evaluation import EMBEDDING_DIM
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        header_path, vectors_path, ids_path = _paths(path)
+        os.makedirs(path, exist_ok=True)
+
+        if mode == "a" and os.path.exists(header_path):
+            header = _read_header(path)
+            if dim not in (None, header["dim"]) or dtype != header["dtype"]:
+                raise ValueError(f"{path} holds {header['dtype']} x {header['dim']}, not {dtype} x {dim}")
+            rows, ids_bytes = _complete_rows(path, header)
+            with open(vectors_path, "r+b") as f:
+                f.truncate(rows * header["dim"] * np.dtype(header["dtype"]).itemsize)
+            with open(ids_path, "r+b") as f:
+                f.truncate(ids_bytes)
+        else:
+            header = {"format": FORMAT_VERSION, "dtype": dtype, "dim": dim or EMBEDDING_DIM}
+            with open(header_path, "w") as f:
+                json.dump(header, f)
+            open(vectors_path, "wb").close()
+            open(ids_path, "wb").close()
+            rows = 0
+
+        self.path = path
+        self.dim = header["dim"]
+        self.dtype = np.dtype(header["dtype"])
+        self.rows = rows
+        self._vectors = open(vectors_path, "ab")
+        self._ids = open(ids_path, "ab")
+
+    def write(self, records):
+        # records: (id, embedding, metadata) tuples, as passed to ingest sinks.
+        if not records:
+            return
+        matrix = np.stack([np.asarray(embedding, dtype=np.float32).reshape(-1) for _, embedding, _ in records])
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"expected {self.dim}-dimensional embeddings, got {matrix.shape[1]}")
+        self._vectors.write(np.ascontiguousarray(matrix, dtype=self.dtype).tobytes())
+        self._vectors.flush()
+        self._ids.write("".join(
+            json.dumps({"id": vector_id, "metadata": metadata or {}}) + "\n" for vector_id, _, metadata in records
+        ).encode())
+        self._ids.flush()
+        self.rows += len(records)
+
+    def close(self):
+        self._vectors.close()
+        self._ids.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_embeddings(path=EMBEDDINGS_PATH):
+    # Returns (matrix, ids, metadata). matrix is a read-only np.memmap of
+    # shape (rows, dim) in the stored dtype.
+    header = _read_header(path)
+    rows, _ = _complete_rows(path, header)
+    ids, metadata = [], []
+    with open(_paths(path)[2]) as f:
+        for _, line in zip(range(rows), f):
+            entry = json.loads(line)
+            ids.append(entry["id"])
+            metadata.append(entry["metadata"])
+    if rows == 0:
+        return np.zeros((0, header["dim"]), dtype=header["dtype"]), ids, metadata
+    matrix = np.memmap(_paths(path)[1], dtype=header["dtype"], mode="r", shape=(rows, header["dim"]))
+    return matrix, ids, metadata
+
+
+def import_csv(csv_path, path=EMBEDDINGS_PATH, dtype="float32", chunk=UPSERT_CHUNK):
+    # Converts an embeddings.csv written by earlier versions.
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        writer = EmbeddingWriter(path, dim=len(next(reader)) - 1, dtype=dtype)
+        records = []
+        for row in reader:
+            records.append((row[0], np.array(row[1:], dtype=np.float32), {}))
+            if len(records) == chunk:
+                writer.write(records)
+                records = []
+        writer.write(records)
+        writer.close()
+    return writer.rows
+
+
+def export_csv(csv_path, path=EMBEDDINGS_PATH):
+    matrix, ids, _ = read_embeddings(path)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id"] + list(range(matrix.shape[1])))
+        for vector_id, row in zip(ids, matrix):
+            writer.writerow([vector_id] + row.astype(np.float32).tolist())
+    return len(ids)
+
+
+def upsert_store(index, path=EMBEDDINGS_PATH, chunk=UPSERT_CHUNK):
+    # Re-indexes a store into any vector store, chunk rows at a time.
+    from models.training_evaluation import batch_upsert
+    matrix, ids, metadata = read_embeddings(path)
+    failed = []
+    for start in range(0, len(ids), chunk):
+        rows = np.asarray(matrix[start:start + chunk], dtype=np.float32)
+        stats = batch_upsert(index, [
+            (vector_id, row.tolist(), meta)
+            for vector_id, row, meta in zip(ids[start:start + chunk], rows, metadata[start:start + chunk])
+        ])
+        failed.extend(stats["failed_ids"])
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, convert or re-index a binary embedding store.")
+    parser.add_argument("path", nargs="?", default=EMBEDDINGS_PATH)
+    parser.add_argument("--import-csv")
+    parser.add_argument("--export-csv")
+    parser.add_argument("--float16", action="store_true", help="store imported vectors as float16")
+    parser.add_argument("--upsert", action="store_true", help="upsert every row into init_pinecone()")
+    args = parser.parse_args()
+
+    if args.import_csv:
+        rows = import_csv(args.import_csv, args.path, "float16" if args.float16 else "float32")
+        print(f"✅ Imported {rows} embeddings from {args.import_csv} into {args.path}")
+    if args.export_csv:
+        print(f"✅ Exported {export_csv(args.export_csv, args.path)} embeddings to {args.export_csv}")
+    if args.upsert:
+        from models.training_evaluation import init_pinecone
+        failed = upsert_store(init_pinecone(), args.path)
+        if failed:
+            print(f"[❌ ERROR] {len(failed)} vectors failed to upsert")
+    matrix, ids, _ = read_embeddings(args.path)
+    print(f"📦 {args.path}: {len(ids)} x {matrix.shape[1]} {matrix.dtype}")
@@ -0,0 +1,250 @@
+import os
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+# Speaker-verification evaluation: cosine trial scoring and EER / minDCF.
+#
+# Embeddings are L2-normalised once, then scored with blocked matrix
+# products, so memory stays around memory_mb whatever the cohort size.
+# pairwise_trials and score_trials return every score. all_pairs_histogram
+# streams the blocks into fixed-width score histograms instead, for cohorts
+# whose N*(N-1)/2 scores would not fit in memory. 100k utterances give
+# about 5e9 trials.
+#
+# Metrics are computed from an ROC, the error rates at every distinct
+# threshold, built by one sort (or a cumulative sum over histogram bins).
+# Trials are accepted when score >= threshold, and tied scores share an
+# operating point.
+#
+#   python -m models.evaluation data/recordings --far 0.01 0.001
+#   python -m models.evaluation --embeddings data/embeddings --histogram
+
+# Scratch memory for one block of scores.
+EVAL_MEMORY_MB = int(os.environ.get("VB_EVAL_MEMORY_MB", 256))
+# Histogram bins over [-1, 1]; a bin is 2e-5 wide.
+HISTOGRAM_BINS = 100000
+# NIST SRE-style detection cost.
+P_TARGET = 0.01
+C_MISS = 1.0
+C_FA = 1.0
+
+Roc = namedtuple("Roc", ["thresholds", "far", "frr", "n_target", "n_nontarget"])
+
+
+def speaker_label(path):
+    # Bundled recordings are named <speaker>[_<purpose>_<timestamp>].wav
+    return os.path.basename(path).split("_")[0].split(".")[0].lower()
+
+
+def l2_normalize(embeddings, dtype=np.float32):
+    # Normalised in float32 and then stored as dtype (float32 or float16).
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(dtype)
+
+
+def _label_codes(labels):
+    return np.unique(np.asarray(labels), return_inverse=True)[1]
+
+
+def _block_rows(n_columns, memory_mb, bytes_per_score=12):
+    # A block holds its float32 scores plus a same-sized target mask and
+    # upper-triangle mask.
+    return max(1, int(memory_mb * 2**20 // (max(n_columns, 1) * bytes_per_score)))
+
+
+def _upper_blocks(normed, codes, memory_mb):
+    # Yields (scores, is_target) for every pair i < j, one block of rows at
+    # a time. Each block is scored against the rows from its own start on.
+    n = len(normed)
+    start = 0
+    while start < n - 1:
+        stop = min(n, start + _block_rows(n - start, memory_mb))
+        columns = normed[start:].astype(np.float32, copy=False)
+        scores = normed[start:stop].astype(np.float32, copy=False) @ columns.T
+        upper = np.arange(n - start)[None, :] > np.arange(stop - start)[:, None]
+        is_target = codes[start:stop, None] == codes[None, start:]
+        yield scores[upper], is_target[upper]
+        start = stop
+
+
+def pairwise_trials(embeddings, labels, memory_mb=EVAL_MEMORY_MB, dtype=np.float32):
+    # All-pairs cosine scores (i < j) with is_target flags.
+    normed = l2_normalize(embeddings, dtype)
+    blocks = list(_upper_blocks(normed, _label_codes(labels), memory_mb))
+    if not blocks:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=bool)
+    scores, is_target = zip(*blocks)
+    return np.concatenate(scores), np.concatenate(is_target)
+
+
+def score_trials(embeddings, enroll, test, memory_mb=EVAL_MEMORY_MB, dtype=np.float32):
+    # Cosine scores for a trial list given as two row-index arrays.
+    normed = l2_normalize(embeddings, dtype)
+    enroll, test = np.asarray(enroll), np.asarray(test)
+    scores = np.empty(len(enroll), dtype=np.float32)
+    step = max(1, int(memory_mb * 2**20 // (2 * normed.shape[1] * 4)))
+    for start in range(0, len(enroll), step):
+        a = normed[enroll[start:start + step]].astype(np.float32, copy=False)
+        b = normed[test[start:start + step]].astype(np.float32, copy=False)
+        scores[start:start + step] = np.einsum("ij,ij->i", a, b)
+    return scores
+
+
+class ScoreHistogram:
+    # Target and non-target score counts in fixed-width bins over [-1, 1].
+    # Metrics from it are exact up to one bin width in threshold.
+    def __init__(self, bins=HISTOGRAM_BINS):
+        self.bins = bins
+        self.counts = np.zeros((2, bins), dtype=np.int64)
+
+    def add(self, scores, is_target):
+        index = np.clip(((np.asarray(scores, dtype=np.float64) + 1.0) * (self.bins / 2)).astype(np.int64),
+                        0, self.bins - 1)
+        self.counts += np.bincount(
+            index + self.bins * np.asarray(is_target, dtype=np.int64), minlength=2 * self.bins
+        ).reshape(2, self.bins)
+
+    def roc(self):
+        # Thresholds are the lower bin edges, highest first.
+        nontarget, target = self.counts[:, ::-1]
+        occupied = (nontarget + target) > 0
+        thresholds = (np.arange(self.bins)[::-1] * (2.0 / self.bins) - 1.0)[occupied]
+        return _roc_from_counts(thresholds, np.cumsum(target)[occupied], np.cumsum(nontarget)[occupied],
+                                int(target.sum()), int(nontarget.sum()))
+
+
+def all_pairs_histogram(embeddings, labels, memory_mb=EVAL_MEMORY_MB, dtype=np.float32, bins=HISTOGRAM_BINS):
+    histogram = ScoreHistogram(bins)
+    for scores, is_target in _upper_blocks(l2_normalize(embeddings, dtype), _label_codes(labels), memory_mb):
+        histogram.add(scores, is_target)
+    return histogram
+
+
+def _roc_from_counts(thresholds, accepted_targets, accepted_nontargets, n_target, n_nontarget):
+    # Prepends the reject-everything point (threshold +inf).
+    far = np.concatenate([[0.0], accepted_nontargets / max(n_nontarget, 1)])
+    frr = np.concatenate([[1.0], 1.0 - accepted_targets / max(n_target, 1)])
+    return Roc(np.concatenate([[np.inf], thresholds]), far, frr, n_target, n_nontarget)
+
+
+def roc(scores, is_target):
+    # Exact ROC: one operating point per distinct score.
+    scores = np.asarray(scores)
+    is_target = np.asarray(is_target, dtype=bool)
+    order = np.argsort(-scores, kind="stable")
+    scores, is_target = scores[order], is_target[order]
+    # The last trial of each run of tied scores closes its operating point.
+    last = np.append(scores[1:] != scores[:-1], True) if len(scores) else np.zeros(0, dtype=bool)
+    return _roc_from_counts(scores[last], np.cumsum(is_target)[last], np.cumsum(~is_target)[last],
+                            int(is_target.sum()), int((~is_target).sum()))
+
+
+def _as_roc(scores, is_target=None):
+    return scores if isinstance(scores, Roc) else roc(scores, is_target)
+
+
+def eer(scores, is_target=None):
+    # (EER, threshold). Interpolates between the two operating points where
+    # FRR - FAR changes sign. Accepts scores and labels or a Roc.
+    curve = _as_roc(scores, is_target)
+    diff = curve.frr - curve.far
+    i = int(np.argmax(diff <= 0))
+    if i == 0:
+        return float(curve.frr[0]), float(curve.thresholds[0])
+    # diff is non-increasing, so the crossing lies between i - 1 and i.
+    w = diff[i - 1] / (diff[i - 1] - diff[i])
+    rate = curve.far[i - 1] + w * (curve.far[i] - curve.far[i - 1])
+    return float(rate), float(curve.thresholds[i])
+
+
+def compute_eer(scores, is_target):
+    return eer(scores, is_target)[0]
+
+
+def min_dcf(scores, is_target=None, p_target=P_TARGET, c_miss=C_MISS, c_fa=C_FA):
+    # (normalised minimum detection cost, threshold).
+    curve = _as_roc(scores, is_target)
+    cost = c_miss * p_target * curve.frr + c_fa * (1 - p_target) * curve.far
+    i = int(np.argmin(cost))
+    return float(cost[i] / min(c_miss * p_target, c_fa * (1 - p_target))), float(curve.thresholds[i])
+
+
+def threshold_at_far(scores, is_target=None, far=0.01):
+    # Lowest threshold whose false-accept rate is at most far, and its FRR.
+    curve = _as_roc(scores, is_target)
+    i = int(np.searchsorted(curve.far, far, side="right")) - 1
+    return float(curve.thresholds[i]), float(curve.frr[i])
+
+
+def threshold_sweep(scores, is_target, thresholds):
+    # (far, frr) at each given threshold, from two sorted score arrays.
+    scores = np.asarray(scores)
+    is_target = np.asarray(is_target, dtype=bool)
+    target = np.sort(scores[is_target])
+    nontarget = np.sort(scores[~is_target])
+    thresholds = np.asarray(thresholds)
+    far = (len(nontarget) - np.searchsorted(nontarget, thresholds, side="left")) / max(len(nontarget), 1)
+    frr = np.searchsorted(target, thresholds, side="left") / max(len(target), 1)
+    return far, frr
+
+
+def evaluate(scores, is_target=None, fars=(0.01, 0.001), p_target=P_TARGET):
+    # Summary for a list of trials or a Roc (for example a histogram's).
+    curve = _as_roc(scores, is_target)
+    rate, eer_threshold = eer(curve)
+    dcf, dcf_threshold = min_dcf(curve, p_target=p_target)
+    summary = {
+        "targets": curve.n_target,
+        "nontargets": curve.n_nontarget,
+        "eer": rate,
+        "eer_threshold": eer_threshold,
+        "min_dcf": dcf,
+        "min_dcf_threshold": dcf_threshold,
+    }
+    for far in fars:
+        threshold, frr = threshold_at_far(curve, far=far)
+        summary[f"threshold_far_{far:g}"] = threshold
+        summary[f"frr_far_{far:g}"] = frr
+    return summary
+
+
+if __name__ == "__main__":
+    from models.embedding_store import read_embeddings
+    from models.ingest_pipeline import list_audio_files
+    from models.training_evaluation import audio_files_to_embeddings
+
+    parser = argparse.ArgumentParser(description="EER, minDCF and operating thresholds over all pairs of recordings.")
+    parser.add_argument("audio_dir", nargs="?")
+    parser.add_argument("--embeddings", help="score a binary embedding store instead of embedding audio_dir")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--far", type=float, nargs="+", default=[0.01, 0.001])
+    parser.add_argument("--p-target", type=float, default=P_TARGET)
+    parser.add_argument("--memory-mb", type=int, default=EVAL_MEMORY_MB)
+    parser.add_argument("--float16", action="store_true")
+    parser.add_argument("--histogram", action="store_true",
+                        help="accumulate score histograms instead of keeping every score")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        # Labelled by the source file name recorded at ingest.
+        matrix, ids, metadata = read_embeddings(args.embeddings)
+        matrix, ids, metadata = matrix[:args.limit], ids[:args.limit], metadata[:args.limit]
+        labels = [speaker_label(meta.get("file_name", vector_id)) for vector_id, meta in zip(ids, metadata)]
+    elif args.audio_dir:
+        paths = list(list_audio_files(args.audio_dir, args.limit))
+        embeddings = audio_files_to_embeddings(paths)
+        kept = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+        matrix = np.stack([np.asarray(embeddings[i]).reshape(-1) for i in kept])
+        labels = [speaker_label(paths[i]) for i in kept]
+    else:
+        parser.error("give an audio_dir or --embeddings")
+    dtype = np.float16 if args.float16 else np.float32
+    if args.histogram:
+        curve = all_pairs_histogram(matrix, labels, args.memory_mb, dtype).roc()
+    else:
+        curve = roc(*pairwise_trials(matrix, labels, args.memory_mb, dtype))
+    for name, value in evaluate(curve, fars=args.far, p_target=args.p_target).items():
+        print(f"{name}: {value:.6g}" if isinstance(value, float) else f"{name}: {value}")
@@ -0,0 +1,180 @@
+import torch
+import torch.nn.functional as F
+
+from models.metrics import stage_timer
+
+# Fast alternative to noisereduce + torchaudio's sox Vad, selected with
+# VB_PREPROCESSOR=fast (see models.training_evaluation.preprocess_waveform).
+#
+# One STFT per batch feeds both stages:
+#   - spectral gating: per-bin noise profile from the quietest frames of each
+#     utterance, a smoothed binary mask, then a single iSTFT
+#   - VAD: frame energy from the same spectrum (before gating, whose
+#     residue makes the noise floor unreliable) plus zero-crossing rate,
+#     with a hangover; it trims both ends and drops internal pauses
+#
+# Input is already gained, mono and at 16 kHz. The STFT zero-pads instead of
+# reflecting, and padded frames are left out of every statistic, so a
+# waveform comes out the same whether it is processed alone or in a batch.
+
+N_FFT = 512
+WIN_LENGTH = 400   # 25 ms
+HOP_LENGTH = 160   # 10 ms
+# Fraction of each utterance's quietest frames used as its noise profile.
+NOISE_QUANTILE = 0.15
+# A bin passes the gate above noise mean + GATE_STD noise std (dB).
+GATE_STD = 1.5
+# How much of a gated bin is removed (1.0 removes it entirely).
+PROP_DECREASE = 1.0
+# Mask smoothing, as in noisereduce: ~500 Hz by 50 ms.
+SMOOTH_BINS = 17
+SMOOTH_FRAMES = 5
+# A frame is speech when its energy is VAD_MARGIN_DB above the noise floor
+# and within VAD_RANGE_DB of the loudest frame, or when it is at least
+# ZCR_MARGIN_DB above the floor with a fricative-like zero-crossing rate.
+VAD_MARGIN_DB = 10.0
+VAD_RANGE_DB = 40.0
+ZCR_MARGIN_DB = 5.0
+ZCR_THRESHOLD = 0.25
+# Speech frames are extended by this many frames on both sides (80 ms), so
+# onsets and word endings survive and short gaps inside words are kept.
+HANGOVER_FRAMES = 8
+MIN_LENGTH = 16000
+BATCH_SIZE = 16
+EPS = 1e-10
+
+_windows = {}
+
+
+def _window(device):
+    if device not in _windows:
+        _windows[device] = torch.hann_window(WIN_LENGTH, device=device)
+    return _windows[device]
+
+
+def _stft(batch):
+    return torch.stft(
+        batch, N_FFT, HOP_LENGTH, WIN_LENGTH, _window(batch.device),
+        center=True, pad_mode="constant", return_complex=True,
+    )
+
+
+def _frame_mask(lengths, n_frames):
+    # The frames an utterance has when it is transformed on its own.
+    starts = torch.arange(n_frames) * HOP_LENGTH
+    return starts.unsqueeze(0) <= lengths.unsqueeze(1)
+
+
+def _quietest(frame_db, valid):
+    # Boolean (B, N) selecting the NOISE_QUANTILE quietest valid frames.
+    ranked = frame_db.masked_fill(~valid, float("inf"))
+    rank = ranked.argsort(dim=1).argsort(dim=1)
+    count = (valid.sum(dim=1).float() * NOISE_QUANTILE).clamp(min=1).long()
+    return (rank < count.unsqueeze(1)) & valid
+
+
+def _power(spec):
+    return spec.real.pow(2) + spec.imag.pow(2)
+
+
+def _moving_average(x, size, dim):
+    # Centered moving average over dim, zero outside, via a cumulative sum.
+    half = size // 2
+    x = x.transpose(dim, -1)
+    padded = F.pad(x, (half + 1, half))
+    total = padded.cumsum(dim=-1)
+    return ((total[..., size:] - total[..., :-size]) / size).transpose(dim, -1)
+
+
+def _box_smooth(mask):
+    # SMOOTH_BINS x SMOOTH_FRAMES moving average, zero outside.
+    return _moving_average(_moving_average(mask, SMOOTH_FRAMES, 2), SMOOTH_BINS, 1)
+
+
+def spectral_gate(spec, valid):
+    # spec: complex (B, F, N). Returns the gated spectrum.
+    power = _power(spec)
+    power_db = 10 * torch.log10(power + EPS)
+    frame_db = 10 * torch.log10(power.mean(dim=1) + EPS)
+    noise = _quietest(frame_db, valid).unsqueeze(1).float()
+    count = noise.sum(dim=2, keepdim=True)
+    mean = (power_db * noise).sum(dim=2, keepdim=True) / count
+    std = (((power_db - mean) * noise).pow(2).sum(dim=2, keepdim=True) / count).sqrt()
+
+    mask = _box_smooth(((power_db > mean + GATE_STD * std) & valid.unsqueeze(1)).float())
+    return spec * (1.0 - PROP_DECREASE * (1.0 - mask))
+
+
+def zero_crossing_rate(batch, n_frames):
+    # Per-frame ZCR on the same frame grid as _stft.
+    padded = F.pad(batch, (N_FFT // 2, N_FFT // 2))
+    frames = padded.unfold(1, N_FFT, HOP_LENGTH)[:, :n_frames]
+    signs = torch.sign(frames)
+    return (signs[..., 1:] != signs[..., :-1]).float().mean(dim=2)
+
+
+def speech_frames(spec, batch, valid):
+    frame_db = 10 * torch.log10(_power(spec).mean(dim=1) + EPS)
+    quiet = _quietest(frame_db, valid)
+    floor = (frame_db * quiet).sum(dim=1, keepdim=True) / quiet.sum(dim=1, keepdim=True)
+    peak = frame_db.masked_fill(~valid, -float("inf")).max(dim=1, keepdim=True).values
+
+    voiced = (frame_db > floor + VAD_MARGIN_DB) & (frame_db > peak - VAD_RANGE_DB)
+    zcr = zero_crossing_rate(batch, spec.shape[2])
+    unvoiced = (zcr > ZCR_THRESHOLD) & (frame_db > floor + ZCR_MARGIN_DB) & (frame_db > peak - VAD_RANGE_DB)
+    speech = ((voiced | unvoiced) & valid).float().unsqueeze(1)
+    speech = F.max_pool1d(speech, 2 * HANGOVER_FRAMES + 1, stride=1, padding=HANGOVER_FRAMES).squeeze(1)
+    return speech.bool() & valid
+
+
+def fast_preprocess_batch(waveforms, denoise=True, vad=True, batch_size=BATCH_SIZE):
+    # waveforms: 1-D float tensors at 16 kHz. Returns (1, T) tensors, peak
+    # normalized and padded to at least one second, or None where VAD kept
+    # nothing. Batches are formed from similar lengths to limit padding.
+    results = [None] * len(waveforms)
+    order = sorted(range(len(waveforms)), key=lambda i: waveforms[i].numel())
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        for i, waveform in zip(chunk, _process([waveforms[i] for i in chunk], denoise, vad)):
+            results[i] = waveform
+    return results
+
+
+def _process(waveforms, denoise, vad):
+    lengths = torch.tensor([w.numel() for w in waveforms])
+    batch = torch.nn.utils.rnn.pad_sequence([w.reshape(-1).float() for w in waveforms], batch_first=True)
+    if denoise or vad:
+        with stage_timer("stft", count=len(waveforms)):
+            spec = _stft(batch)
+            valid = _frame_mask(lengths, spec.shape[2])
+        if vad:
+            with stage_timer("vad", count=len(waveforms)):
+                keep = speech_frames(spec, batch, valid)
+                keep = keep.repeat_interleave(HOP_LENGTH, dim=1)[:, :batch.shape[1]]
+        if denoise:
+            with stage_timer("denoise", count=len(waveforms)):
+                spec = spectral_gate(spec, valid)
+                # Inverted row by row over the row's own frames: frames past
+                # the end would otherwise change the overlap-add
+                # normalisation of its last samples.
+                batch = torch.zeros_like(batch)
+                for row, length in enumerate(lengths.tolist()):
+                    batch[row, :length] = torch.istft(
+                        spec[row, :, :length // HOP_LENGTH + 1], N_FFT, HOP_LENGTH, WIN_LENGTH,
+                        _window(batch.device), center=True, length=length,
+                    )
+
+    results = []
+    for row, length in enumerate(lengths.tolist()):
+        waveform = batch[row, :length]
+        if vad:
+            waveform = waveform[keep[row, :length]]
+        peak = waveform.abs().max() if waveform.numel() else 0
+        if peak == 0:
+            results.append(None)
+            continue
+        waveform = (waveform / peak).unsqueeze(0)
+        if waveform.shape[1] < MIN_LENGTH:
+            waveform = F.pad(waveform, (0, MIN_LENGTH - waveform.shape[1]))
+        results.append(waveform)
+    return results
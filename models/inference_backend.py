@@ -0,0 +1,340 @@
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+import numpy as np
+
+from models.evaluation import compute_eer, pairwise_trials, speaker_label
+from models.model_registry import (
+    DEFAULT_MODEL,
+    EXPORTED_BACKENDS,
+    active_model,
+    configure_threads,
+    get_model,
+    thread_settings,
+    unload,
+)
+from models.training_evaluation import (
+    AUDIO_EXTENSIONS,
+    EMBED_BATCH_SIZE,
+    TARGET_SAMPLE_RATE,
+    embed_waveforms,
+    length_buckets,
+    load_audio,
+    preprocess_batch,
+    preprocess_waveform,
+)
+
+# CPU inference backends for the ECAPA speaker encoder. Feature extraction
+# (Fbank + mean normalisation) stays in torch; only the embedding network,
+# which is where the time goes, runs in the exported runtime.
+#
+#   ecapa              full-precision SpeechBrain model (reference)
+#   ecapa-torchscript  traced TorchScript module
+#   ecapa-onnx         ONNX Runtime, FP32
+#   ecapa-onnx-int8    ONNX Runtime with int8 dynamic quantization
+#
+# ONNX backends need the optional onnx, onnxscript and onnxruntime packages.
+# torch's own quantize_dynamic only covers nn.Linear/LSTM, and ECAPA is
+# built from Conv1d layers, so int8 goes through ONNX Runtime, which
+# quantizes convolutions as well.
+
+BACKENDS = (DEFAULT_MODEL,) + EXPORTED_BACKENDS
+EXPORT_DIR = "pretrained_models/exported"
+PARITY_AUDIO_DIR = "data/recordings"
+# Batched embeddings must match one-at-a-time embeddings at least this well.
+BATCH_PARITY_MIN_COSINE = 0.9999
+# Preprocessing configurations compared by preprocessing_report, as
+# preprocess_options() keyword arguments; the first is the reference.
+PREPROCESSING_CONFIGS = (
+    {"preprocessor": "reference", "denoise": True, "vad": True},
+    {"preprocessor": "fast", "denoise": True, "vad": True},
+    {"preprocessor": "fast", "denoise": False, "vad": True},
+    {"preprocessor": "fast", "denoise": False, "vad": False},
+)
+
+class ExportedEncoder:
+    # Same encode_batch(wavs, wav_lens) contract as EncoderClassifier, so
+    # embed_waveforms can use any backend unchanged.
+    def __init__(self, base, run_embedding_model):
+        self.mods = base.mods
+        self.run_embedding_model = run_embedding_model
+
+    def encode_batch(self, wavs, wav_lens=None):
+        import torch
+        if wavs.dim() == 1:
+            wavs = wavs.unsqueeze(0)
+        if wav_lens is None:
+            wav_lens = torch.ones(wavs.shape[0])
+        with torch.no_grad():
+            feats = self.mods.compute_features(wavs.float())
+            feats = self.mods.mean_var_norm(feats, wav_lens)
+        return self.run_embedding_model(feats, wav_lens.float())
+
+
+@contextlib.contextmanager
+def _shape_polymorphic_masks():
+    # SpeechBrain's length_to_mask expands to len(lengths), which tracing
+    # and export freeze into a fixed batch size. Broadcasting gives the same
+    # mask without baking in the shape.
+    import torch
+    import speechbrain.lobes.models.ECAPA_TDNN as ecapa_module
+
+    def length_to_mask(length, max_len=None, dtype=None, device=None):
+        if max_len is None:
+            max_len = length.max().long().item()
+        mask = torch.arange(max_len, device=length.device, dtype=length.dtype).unsqueeze(0) < length.unsqueeze(1)
+        return mask.to(dtype=dtype or length.dtype, device=device or length.device)
+
+    original = ecapa_module.length_to_mask
+    ecapa_module.length_to_mask = length_to_mask
+    try:
+        yield
+    finally:
+        ecapa_module.length_to_mask = original
+
+
+def _example_inputs():
+    import torch
+    return torch.randn(2, 200, 80), torch.tensor([1.0, 0.75])
+
+
+def _export_torchscript(embedding_model, path):
+    import torch
+    with _shape_polymorphic_masks(), torch.no_grad():
+        traced = torch.jit.trace(embedding_model, _example_inputs())
+    torch.jit.save(traced, path)
+
+
+def _export_onnx(embedding_model, path):
+    import torch
+    batch = torch.export.Dim("batch")
+    frames = torch.export.Dim("frames", min=10)
+    with _shape_polymorphic_masks(), torch.no_grad():
+        torch.onnx.export(
+            embedding_model,
+            _example_inputs(),
+            path,
+            input_names=["feats", "lengths"],
+            output_names=["embeddings"],
+            dynamic_shapes={"x": {0: batch, 1: frames}, "lengths": {0: batch}},
+            dynamo=True,
+        )
+
+
+def _quantize_onnx(fp32_path, path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+
+
+def _onnx_runner(path):
+    import torch
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    threads = thread_settings()
+    if threads["intra_op"]:
+        options.intra_op_num_threads = threads["intra_op"]
+    if threads["inter_op"]:
+        options.inter_op_num_threads = threads["inter_op"]
+    session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def run(feats, wav_lens):
+        outputs = session.run(None, {"feats": feats.numpy(), "lengths": wav_lens.numpy()})
+        return torch.from_numpy(outputs[0])
+    return run
+
+
+def load_backend(name):
+    import torch
+    base = get_model(DEFAULT_MODEL)
+    if name == DEFAULT_MODEL:
+        return base
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    embedding_model = base.mods.embedding_model.eval()
+
+    if name == "ecapa-torchscript":
+        path = os.path.join(EXPORT_DIR, "ecapa.torchscript.pt")
+        if not os.path.exists(path):
+            _export_torchscript(embedding_model, path)
+        module = torch.jit.load(path).eval()
+
+        def run(feats, wav_lens):
+            with torch.no_grad():
+                return module(feats, wav_lens)
+        return ExportedEncoder(base, run)
+
+    fp32_path = os.path.join(EXPORT_DIR, "ecapa.onnx")
+    if not os.path.exists(fp32_path):
+        _export_onnx(embedding_model, fp32_path)
+    if name == "ecapa-onnx":
+        return ExportedEncoder(base, _onnx_runner(fp32_path))
+
+    if name == "ecapa-onnx-int8":
+        int8_path = os.path.join(EXPORT_DIR, "ecapa.int8.onnx")
+        if not os.path.exists(int8_path):
+            _quantize_onnx(fp32_path, int8_path)
+        return ExportedEncoder(base, _onnx_runner(int8_path))
+
+    raise KeyError(f"Unknown backend '{name}'. Available: {BACKENDS}")
+
+
+# -------------------- Parity --------------------
+
+def _load_parity_audio(audio_dir):
+    paths = sorted(
+        os.path.join(audio_dir, f) for f in os.listdir(audio_dir) if f.lower().endswith(AUDIO_EXTENSIONS)
+    )
+    return paths, [preprocess_waveform(*load_audio(path)) for path in paths]
+
+
+def _cosine_rows(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def batch_parity_report(audio_dir=PARITY_AUDIO_DIR, batch_size=EMBED_BATCH_SIZE, model_name=None,
+                        max_pad_ratio=None, waveforms=None):
+    # Batched embed_waveforms against one forward pass per utterance.
+    if waveforms is None:
+        waveforms = _load_parity_audio(audio_dir)[1]
+    single = np.concatenate([embed_waveforms([w], model_name=model_name) for w in waveforms])
+    batched = embed_waveforms(waveforms, batch_size, model_name=model_name, max_pad_ratio=max_pad_ratio)
+    cosine = _cosine_rows(batched, single)
+    return {
+        "model": model_name or active_model(),
+        "utterances": len(waveforms),
+        "batches": len(length_buckets([w.reshape(-1).shape[0] for w in waveforms], batch_size, max_pad_ratio)),
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "passed": bool(cosine.min() >= BATCH_PARITY_MIN_COSINE),
+    }
+
+
+def parity_report(backends=BACKENDS, audio_dir=PARITY_AUDIO_DIR, reference=DEFAULT_MODEL):
+    paths, waveforms = _load_parity_audio(audio_dir)
+    labels = [speaker_label(path) for path in paths]
+
+    reference_embeddings = embed_waveforms(waveforms, model_name=reference)
+    reference_eer = compute_eer(*pairwise_trials(reference_embeddings, labels))
+
+    rows = []
+    for backend in backends:
+        embeddings = embed_waveforms(waveforms, model_name=backend)
+        cosine = _cosine_rows(embeddings, reference_embeddings)
+        eer = compute_eer(*pairwise_trials(embeddings, labels))
+        rows.append({
+            "backend": backend,
+            "mean_cosine_drift": float(np.mean(1.0 - cosine)),
+            "max_cosine_drift": float(np.max(1.0 - cosine)),
+            "eer": eer,
+            "eer_change": eer - reference_eer,
+        })
+    return rows
+
+
+def preprocessing_report(audio_dir=PARITY_AUDIO_DIR, configs=PREPROCESSING_CONFIGS, model_name=None):
+    # Preprocessing time, audio kept and EER for each configuration, with
+    # the change in EER against the first one.
+    paths = sorted(
+        os.path.join(audio_dir, f) for f in os.listdir(audio_dir) if f.lower().endswith(AUDIO_EXTENSIONS)
+    )
+    decoded = [load_audio(path) for path in paths]
+    labels = [speaker_label(path) for path in paths]
+    input_seconds = sum(waveform.shape[-1] / sample_rate for waveform, sample_rate in decoded)
+
+    rows, reference = [], None
+    for options in configs:
+        start = time.perf_counter()
+        waveforms = preprocess_batch(decoded, **options)
+        elapsed = time.perf_counter() - start
+        kept = [i for i, waveform in enumerate(waveforms) if waveform is not None]
+        embeddings = embed_waveforms([waveforms[i] for i in kept], model_name=model_name)
+        eer = compute_eer(*pairwise_trials(embeddings, [labels[i] for i in kept]))
+        reference = eer if reference is None else reference
+        rows.append({
+            "preprocessor": options["preprocessor"],
+            "denoise": options["denoise"],
+            "vad": options["vad"],
+            "ms_per_file": 1000 * elapsed / len(decoded),
+            "kept_fraction": sum(waveforms[i].shape[1] for i in kept) / TARGET_SAMPLE_RATE / input_seconds,
+            "failed": len(decoded) - len(kept),
+            "eer": eer,
+            "eer_change": eer - reference,
+        })
+    return rows
+
+
+# -------------------- Latency --------------------
+
+def benchmark_backends(backends=BACKENDS, seconds=3.0, batch_size=EMBED_BATCH_SIZE, repeats=10):
+    import torch
+    generator = torch.Generator().manual_seed(0)
+    utterance = torch.randn(1, int(seconds * TARGET_SAMPLE_RATE), generator=generator) * 0.1
+    batch = [utterance] * batch_size
+
+    rows = []
+    for backend in backends:
+        embed_waveforms([utterance], model_name=backend)  # export / load / warm up
+
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            embed_waveforms([utterance], model_name=backend)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(max(1, repeats // 5)):
+            embed_waveforms(batch, batch_size=batch_size, model_name=backend)
+        elapsed = time.perf_counter() - start
+
+        rows.append({
+            "backend": backend,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+            "throughput_utt_s": max(1, repeats // 5) * batch_size / elapsed,
+        })
+        if backend != DEFAULT_MODEL:
+            unload(backend)
+    return rows
+
+
+def format_table(rows):
+    columns = list(rows[0])
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    for row in rows:
+        cells = [f"{v:.4g}" if isinstance(v, float) else str(v) for v in row.values()]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ECAPA inference backends.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--audio-dir", default=PARITY_AUDIO_DIR)
+    parser.add_argument("--intra-op", type=int)
+    parser.add_argument("--inter-op", type=int)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--skip-parity", action="store_true")
+    parser.add_argument("--batch-parity", action="store_true",
+                        help="only check batched against one-at-a-time embeddings")
+    parser.add_argument("--max-pad-ratio", type=float)
+    parser.add_argument("--preprocessing", action="store_true",
+                        help="only compare preprocessing configurations (time, audio kept, EER)")
+    args = parser.parse_args()
+
+    configure_threads(args.intra_op, args.inter_op)
+    if args.preprocessing:
+        print(format_table(preprocessing_report(args.audio_dir, model_name=args.backends[0])))
+        sys.exit(0)
+    if args.batch_parity:
+        rows = [batch_parity_report(args.audio_dir, args.batch_size, backend, args.max_pad_ratio)
+                for backend in args.backends]
+        print(format_table(rows))
+        sys.exit(0 if all(row["passed"] for row in rows) else 1)
+    if not args.skip_parity:
+        print(format_table(parity_report(args.backends, args.audio_dir)))
+        print()
+    print(format_table(benchmark_backends(args.backends, args.seconds, args.batch_size)))
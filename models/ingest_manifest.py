@@ -0,0 +1,147 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+
+# Records what has been ingested into the vector index so re-runs only
+# touch new or changed files. One entry per source file, keyed by absolute
+# path:
+#
+#   size, mtime_ns   cheap change check
+#   content_hash     BLAKE2 of the file bytes, for files touched but not changed
+#   vector_id        uuid5 of the path, so re-ingesting a file overwrites
+#                    its vector instead of adding a duplicate
+#   model_version    preprocessing/model signature the vector was made with
+
+DEFAULT_MANIFEST_PATH = "data/ingest_manifest.json"
+VECTOR_ID_NAMESPACE = uuid.UUID("5b0d6c1e-8f0a-4f5e-9a43-3d1f6b2c7e90")
+HASH_CHUNK_BYTES = 1 << 20
+# Save progress every this many committed files so an interrupted run
+# resumes close to where it stopped.
+SAVE_EVERY = 5000
+DELETE_BATCH_SIZE = 1000
+
+
+def vector_id_for(path):
+    return str(uuid.uuid5(VECTOR_ID_NAMESPACE, os.path.abspath(path)))
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self.files = {}
+        self._unsaved = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f).get("files", {})
+
+    def plan(self, paths, model_version):
+        # Returns ({path: new_entry} for files that need (re-)embedding,
+        # number of files that are already up to date).
+        pending, unchanged = {}, 0
+        for path in paths:
+            key = os.path.abspath(path)
+            stat = os.stat(key)
+            old = self.files.get(key)
+            if (
+                old is not None
+                and old["model_version"] == model_version
+                and old["size"] == stat.st_size
+                and old["mtime_ns"] == stat.st_mtime_ns
+            ):
+                unchanged += 1
+                continue
+
+            content_hash = file_hash(key)
+            if old is not None and old["model_version"] == model_version and old["content_hash"] == content_hash:
+                # Touched but identical: refresh the stat fields only.
+                old.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                self._unsaved += 1
+                unchanged += 1
+                continue
+
+            pending[path] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "content_hash": content_hash,
+                "vector_id": vector_id_for(key),
+                "model_version": model_version,
+            }
+        return pending, unchanged
+
+    def removed(self, root):
+        # Entries under root whose source file no longer exists.
+        root = os.path.join(os.path.abspath(root), "")
+        return {
+            key: entry for key, entry in self.files.items()
+            if key.startswith(root) and not os.path.exists(key)
+        }
+
+    def record(self, path, entry):
+        self.files[os.path.abspath(path)] = entry
+        self._unsaved += 1
+        if self._unsaved >= SAVE_EVERY:
+            self.save()
+
+    def forget(self, key):
+        self.files.pop(key, None)
+        self._unsaved += 1
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+
+class ManifestSink:
+    # Wraps the index sink: only new or changed files (pending) reach the
+    # index, and a file is recorded in the manifest only once the index sink
+    # reports its vector as written, so failed batches are retried next run.
+    # Records of unchanged files are dropped; their vectors are already
+    # stored under the same ID.
+    def __init__(self, sink, manifest, pending):
+        self.sink = sink
+        self.manifest = manifest
+        self.path_for_id = {entry["vector_id"]: path for path, entry in pending.items()}
+        self.pending = pending
+        self._lock = threading.Lock()
+
+    def write(self, records):
+        records = [record for record in records if record[0] in self.path_for_id]
+        if records:
+            self.sink.write(records, on_written=self._commit)
+
+    def _commit(self, ids):
+        with self._lock:
+            for vector_id in ids:
+                path = self.path_for_id.get(vector_id)
+                if path is not None:
+                    self.manifest.record(path, self.pending[path])
+
+    def close(self):
+        self.sink.close()
+        self.manifest.save()
+
+
+def delete_removed(index, manifest, root):
+    removed = manifest.removed(root)
+    ids = [entry["vector_id"] for entry in removed.values()]
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        index.delete(ids=ids[i:i + DELETE_BATCH_SIZE])
+    for key in removed:
+        manifest.forget(key)
+    return len(removed)
@@ -0,0 +1,267 @@
+import os
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import torch
+from pydub import AudioSegment
+
+from models.training_evaluation import (
+    AUDIO_EXTENSIONS,
+    EMBED_BATCH_SIZE,
+    UPSERT_BATCH_SIZE,
+    audio_segment_to_tensor,
+    embed_waveforms,
+    embedding_cache_key,
+    init_preprocess_worker,
+    preprocess_options,
+    preprocess_waveform,
+    preprocessing_signature,
+)
+from models.embedding_cache import get_embedding_cache
+from models.metrics import capture_metrics, record_audio, record_failure, replay, stage_timer
+from models.quality import QUALITY_GATE, check_quality
+from models.bulk_upsert import BulkUpserter, report as report_upserts
+from utils.audio_tools import is_up_to_date, wav_output_path, write_canonical_wav
+
+# Embedded batches waiting for the sink; when the sink falls behind,
+# inference blocks instead of piling results up in memory.
+SINK_QUEUE_BATCHES = 4
+PROGRESS_INTERVAL = 5.0
+
+
+def list_audio_files(input_folder, limit=None):
+    count = 0
+    for file_name in sorted(os.listdir(input_folder)):
+        if limit and count >= limit:
+            return
+        if file_name.lower().endswith(AUDIO_EXTENSIONS):
+            count += 1
+            yield os.path.join(input_folder, file_name)
+
+
+# -------------------- Sinks --------------------
+# A sink receives lists of (id, embedding, metadata) records as batches finish.
+
+class MemorySink:
+    def __init__(self):
+        self.embeddings, self.ids, self.metadata = [], [], []
+
+    def write(self, records):
+        for vector_id, embedding, metadata in records:
+            self.ids.append(vector_id)
+            self.embeddings.append(embedding)
+            self.metadata.append(metadata)
+
+    def close(self):
+        pass
+
+
+class PineconeSink:
+    # Streams records into one BulkUpserter for the whole run, so batches
+    # from successive writes overlap on the network.
+    def __init__(self, index, batch_size=UPSERT_BATCH_SIZE):
+        self.upserter = BulkUpserter(index, batch_size=batch_size)
+
+    def write(self, records, on_written=None):
+        self.upserter.submit([(i, e.tolist(), m) for i, e, m in records], on_written)
+
+    def close(self):
+        report_upserts(self.upserter.close())
+
+
+class MultiSink:
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, records):
+        for sink in self.sinks:
+            sink.write(records)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+# -------------------- Stats --------------------
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.submitted = 0
+        self.preprocessed = 0
+        self.embedded = 0
+        self.written = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.write_failures = 0
+        self.preprocess_depth = 0
+        self.embed_depth = 0
+        self.sink_depth = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def report_progress(stats):
+    rate = stats.embedded / stats.elapsed() if stats.elapsed() > 0 else 0.0
+    print(
+        f"⏳ {stats.submitted} submitted | {stats.preprocessed} preprocessed | "
+        f"{stats.embedded} embedded ({stats.cache_hits} cached) | {stats.written} written | {stats.failed} failed | "
+        f"{rate:.1f} files/s | queues: preprocess={stats.preprocess_depth} "
+        f"embed={stats.embed_depth} sink={stats.sink_depth}"
+    )
+
+
+# -------------------- Stages --------------------
+
+def _preprocess_file(path, wav_folder=None, signature=None, options=None, quality_gate=True):
+    # Returns (path, waveform, cache_key, cached_embedding, error, events,
+    # timing). A cache hit on the shared disk tier skips denoise and VAD
+    # entirely, and a recording rejected by the quality gate skips
+    # everything after decode. events are this worker's metrics, for replay()
+    # in the parent; timing is (audio seconds, preprocessing seconds).
+    start = time.perf_counter()
+    with capture_metrics() as events:
+        try:
+            with stage_timer("decode"):
+                waveform, sample_rate = audio_segment_to_tensor(AudioSegment.from_file(path))
+            if quality_gate:
+                with stage_timer("quality"):
+                    check_quality(waveform, sample_rate)
+            if wav_folder:
+                # Canonical 16 kHz mono copy of the decoded audio, unless a
+                # current one is already there.
+                out_path = wav_output_path(path, wav_folder)
+                if not is_up_to_date(path, out_path):
+                    write_canonical_wav(out_path, waveform.numpy(), sample_rate)
+            timing = (waveform.shape[-1] / sample_rate, 0.0)
+            cache = get_embedding_cache()
+            key = embedding_cache_key(waveform, sample_rate, signature) if cache else None
+            cached = cache.get(key) if cache else None
+            if cached is not None:
+                return path, None, key, cached, None, events, timing
+            waveform = preprocess_waveform(waveform, sample_rate, **(options or {}))
+            timing = (timing[0], time.perf_counter() - start)
+            return path, waveform.reshape(-1).numpy(), key, None, None, events, timing
+        except Exception as e:
+            return path, None, None, None, record_failure(e, "preprocess"), events, None
+
+
+def _drain_sink(sink, sink_queue, stats):
+    while True:
+        records = sink_queue.get()
+        if records is None:
+            return
+        try:
+            sink.write(records)
+            stats.written += len(records)
+        except Exception as e:
+            stats.write_failures += len(records)
+            print(f"[❌ ERROR] sink write failed: {record_failure(e, 'sink')}")
+
+
+def _embed_ready(ready, sink_queue, stats, id_for=None):
+    # ready holds (path, waveform, cache_key, cached_embedding, timing) tuples.
+    cache = get_embedding_cache()
+    embeddings = [cached for _, _, _, cached, _ in ready]
+    pending = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if pending:
+        start = time.perf_counter()
+        computed = embed_waveforms([torch.from_numpy(ready[i][1]) for i in pending], batch_size=len(pending))
+        encode_share = (time.perf_counter() - start) / len(pending)
+        for i, embedding in zip(pending, computed):
+            embeddings[i] = embedding
+            if cache and ready[i][2]:
+                cache.put(ready[i][2], embedding)
+            audio_seconds, preprocess_seconds = ready[i][4]
+            record_audio(audio_seconds, preprocess_seconds + encode_share)
+    stats.cache_hits += len(ready) - len(pending)
+
+    records = [
+        (id_for(path) if id_for else str(uuid.uuid4()), embedding, {"file_name": os.path.basename(path)})
+        for (path, _, _, _, _), embedding in zip(ready, embeddings)
+    ]
+    stats.embedded += len(records)
+    sink_queue.put(records)
+
+
+def run_ingest_pipeline(audio_paths, sink, workers=None, batch_size=EMBED_BATCH_SIZE, max_inflight=None,
+                        wav_folder=None, progress=report_progress, progress_interval=PROGRESS_INTERVAL, id_for=None,
+                        quality_gate=None):
+    # Decode/denoise/VAD run in a process pool, the encoder runs in this
+    # process on batches of finished files, and a writer thread streams each
+    # embedded batch to the sink. Only max_inflight files are ever in the
+    # preprocessing stage, so memory stays flat however many files there are.
+    # id_for(path) gives each vector its ID; random UUIDs when not set.
+    # quality_gate (default VB_QUALITY_GATE) rejects empty, silent, clipped
+    # or too-short recordings before preprocessing; they count as failed.
+    workers = workers or os.cpu_count() or 1
+    max_inflight = max_inflight or 2 * workers + batch_size
+    if wav_folder:
+        os.makedirs(wav_folder, exist_ok=True)
+
+    # Cache keys are signed here, for the model this process embeds with,
+    # and workers preprocess with this process's settings.
+    options = preprocess_options()
+    signature = preprocessing_signature(options)
+    quality_gate = QUALITY_GATE if quality_gate is None else quality_gate
+    stats = IngestStats()
+    sink_queue = queue.Queue(maxsize=SINK_QUEUE_BATCHES)
+    writer = threading.Thread(target=_drain_sink, args=(sink, sink_queue, stats), daemon=True)
+    writer.start()
+
+    paths = iter(audio_paths)
+    inflight, ready = set(), []
+    exhausted = False
+    last_report = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_preprocess_worker) as pool:
+            while True:
+                while not exhausted and len(inflight) < max_inflight:
+                    path = next(paths, None)
+                    if path is None:
+                        exhausted = True
+                        break
+                    inflight.add(pool.submit(_preprocess_file, path, wav_folder, signature, options, quality_gate))
+                    stats.submitted += 1
+
+                if not inflight and not ready:
+                    break
+
+                if inflight:
+                    done, inflight = wait(inflight, timeout=progress_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path, waveform, key, cached, error, events, timing = future.result()
+                        replay(events)
+                        if error is not None:
+                            stats.failed += 1
+                            print(f"[❌ ERROR] {path}: {error}")
+                        else:
+                            stats.preprocessed += 1
+                            ready.append((path, waveform, key, cached, timing))
+
+                while len(ready) >= batch_size or (ready and not inflight and exhausted):
+                    _embed_ready(ready[:batch_size], sink_queue, stats, id_for)
+                    ready = ready[batch_size:]
+
+                stats.preprocess_depth = len(inflight)
+                stats.embed_depth = len(ready)
+                stats.sink_depth = sink_queue.qsize()
+                if progress and time.perf_counter() - last_report >= progress_interval:
+                    progress(stats)
+                    last_report = time.perf_counter()
+    finally:
+        sink_queue.put(None)
+        writer.join()
+        sink.close()
+
+    stats.preprocess_depth = stats.embed_depth = stats.sink_depth = 0
+    if progress:
+        progress(stats)
+    return stats
@@ -0,0 +1,266 @@
+import os
+import time
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+# Pipeline instrumentation: per-stage latency histograms, audio duration,
+# real-time factor and failure counters.
+#
+#   vb_stage_seconds{stage}        time per utterance in each stage: decode,
+#                                  quality (the gate in models.quality),
+#                                  gain, resample, denoise, vad (stft with the
+#                                  fast preprocessor), encode, and
+#                                  vector_store (with an op label)
+#   vb_audio_seconds               input duration per embedded utterance
+#   vb_real_time_factor            processing time / audio duration
+#   vb_failures_total{stage,reason} failures by the stage they happened in
+#                                  and the exception type (or the exception's
+#                                  vb_reason code, such as quality rejections)
+#   vb_quality_flags_total{flag}   recordings embedded despite a quality
+#                                  warning (models.quality)
+#
+# Stages that run on a batch record the per-utterance share, once per
+# utterance. Metrics go to a process-wide sink: InProcessMetrics by default
+# (snapshot() for JSON, prometheus_text() for scraping), NullMetrics with
+# VB_METRICS=off, or anything set with set_metrics_sink(). Worker processes
+# record into a MetricsRecorder and send the events back with their result,
+# and the parent replays them into its own sink.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+RTF_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+BUCKETS = {
+    "vb_stage_seconds": LATENCY_BUCKETS,
+    "vb_audio_seconds": DURATION_BUCKETS,
+    "vb_real_time_factor": RTF_BUCKETS,
+}
+HELP = {
+    "vb_stage_seconds": "Seconds per utterance spent in each pipeline stage.",
+    "vb_audio_seconds": "Duration of each embedded utterance.",
+    "vb_real_time_factor": "Processing time divided by audio duration.",
+    "vb_failures_total": "Pipeline failures by stage and reason.",
+    "vb_quality_flags_total": "Recordings embedded with a quality warning.",
+}
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class MetricsSink(ABC):
+    @abstractmethod
+    def observe(self, name, value, labels=None, count=1): ...
+
+    @abstractmethod
+    def increment(self, name, labels=None, amount=1): ...
+
+
+class NullMetrics(MetricsSink):
+    def observe(self, name, value, labels=None, count=1):
+        pass
+
+    def increment(self, name, labels=None, amount=1):
+        pass
+
+
+class MetricsRecorder(MetricsSink):
+    # Keeps raw events, to be replayed into another sink with replay().
+    def __init__(self):
+        self.events = []
+
+    def observe(self, name, value, labels=None, count=1):
+        self.events.append(("observe", name, value, labels, count))
+
+    def increment(self, name, labels=None, amount=1):
+        self.events.append(("increment", name, amount, labels, None))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value, count=1):
+        self.counts[bisect.bisect_left(self.buckets, value)] += count
+        self.count += count
+        self.sum += value * count
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket, as histogram_quantile does.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+def _key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class InProcessMetrics(MetricsSink):
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, labels=None, count=1):
+        key = _key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(BUCKETS.get(name, LATENCY_BUCKETS))
+            series[key].observe(value, count)
+
+    def increment(self, name, labels=None, amount=1):
+        key = _key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def snapshot(self):
+        # {name: [{"labels", "count", "sum", "mean", "p50", "p90", "p99"}]}
+        # for histograms, {name: [{"labels", "value"}]} for counters.
+        with self._lock:
+            summary = {}
+            for name, series in self._histograms.items():
+                summary[name] = [
+                    {
+                        "labels": dict(key),
+                        "count": h.count,
+                        "sum": h.sum,
+                        "mean": h.sum / h.count if h.count else 0.0,
+                        **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES},
+                    }
+                    for key, h in sorted(series.items())
+                ]
+            for name, series in self._counters.items():
+                summary[name] = [{"labels": dict(key), "value": value} for key, value in sorted(series.items())]
+            return summary
+
+    def prometheus_text(self):
+        # Prometheus text exposition format, version 0.0.4.
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+                for key, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+            for name, series in sorted(self._counters.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+_sink = NullMetrics() if os.environ.get("VB_METRICS") == "off" else InProcessMetrics()
+
+
+def get_metrics():
+    return _sink
+
+
+def set_metrics_sink(sink):
+    # Returns the previous sink.
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+
+@contextmanager
+def capture_metrics():
+    # Records everything inside the block for replay() in another process.
+    recorder = MetricsRecorder()
+    previous = set_metrics_sink(recorder)
+    try:
+        yield recorder.events
+    finally:
+        set_metrics_sink(previous)
+
+
+def replay(events):
+    sink = get_metrics()
+    for kind, name, value, labels, count in events or ():
+        if kind == "observe":
+            sink.observe(name, value, labels, count)
+        else:
+            sink.increment(name, labels, value)
+
+
+@contextmanager
+def stage_timer(stage, count=1, **labels):
+    # Times a stage. A failing stage is not timed; its exception is tagged
+    # with the stage so record_failure() can count it there.
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if getattr(e, "vb_stage", None) is None:
+            e.vb_stage = stage
+        raise
+    get_metrics().observe("vb_stage_seconds", (time.perf_counter() - start) / max(count, 1),
+                          {"stage": stage, **labels}, count)
+
+
+def record_failure(error, stage="unknown"):
+    # Counts a failure under the stage it was tagged with and its reason
+    # code, or its exception type. Returns "stage/reason: message" for logging.
+    stage = getattr(error, "vb_stage", None) or stage
+    reason = getattr(error, "vb_reason", None) or type(error).__name__
+    get_metrics().increment("vb_failures_total", {"stage": stage, "reason": reason})
+    return f"{stage}/{reason}: {error}"
+
+
+def record_audio(audio_seconds, processing_seconds):
+    if audio_seconds <= 0:
+        return
+    sink = get_metrics()
+    sink.observe("vb_audio_seconds", audio_seconds)
+    sink.observe("vb_real_time_factor", processing_seconds / audio_seconds)
+
+
+class InstrumentedIndex:
+    # Wraps a vector store handle and times its round trips.
+    TIMED = ("query", "fetch", "upsert", "delete", "describe_index_stats")
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getattr__(self, name):
+        attr = getattr(self._index, name)
+        if name not in self.TIMED:
+            return attr
+
+        def timed(*args, **kwargs):
+            with stage_timer("vector_store", op=name):
+                return attr(*args, **kwargs)
+        return timed
+
+    @property
+    def wrapped(self):
+        return self._index
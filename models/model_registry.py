@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+import subprocess
+
+# Process-wide registry of speaker encoders. Nothing heavy (torch,
+# speechbrain) is imported until a model is first requested, so importing
+# the embedding API stays cheap and Streamlit reruns / pool workers that
+# never embed do not pay for the model at all.
+
+DEFAULT_MODEL = "ecapa"
+# Exported / quantized variants of the same encoder, see models.inference_backend.
+EXPORTED_BACKENDS = ("ecapa-torchscript", "ecapa-onnx", "ecapa-onnx-int8")
+ECAPA_SOURCE = "speechbrain/spkrec-ecapa-voxceleb"
+ECAPA_SAVEDIR = "pretrained_models/spkrec-ecapa-voxceleb"
+
+# Startup target: a fresh interpreter must import the embedding API in
+# less than this many seconds (checked by `python -m models.model_registry`).
+IMPORT_TIME_BUDGET_S = 0.5
+
+_loaders = {}
+_models = {}
+# Reentrant: exported backends load the base model from inside their loader.
+_lock = threading.RLock()
+_active_model = os.environ.get("VB_MODEL_BACKEND", DEFAULT_MODEL)
+
+# Thread counts for torch and ONNX Runtime sessions, None for the runtime
+# default. The environment values are applied when the first model loads.
+_threads = {
+    "intra_op": int(os.environ["VB_INTRA_OP_THREADS"]) if os.environ.get("VB_INTRA_OP_THREADS") else None,
+    "inter_op": int(os.environ["VB_INTER_OP_THREADS"]) if os.environ.get("VB_INTER_OP_THREADS") else None,
+}
+_threads_applied = False
+
+
+def register_model(name, loader):
+    _loaders[name] = loader
+
+
+def _load_ecapa():
+    from speechbrain.pretrained import EncoderClassifier
+    return EncoderClassifier.from_hparams(
+        source=ECAPA_SOURCE,
+        savedir=ECAPA_SAVEDIR,
+        run_opts={"skip_vad": True}
+    )
+
+
+def _load_exported(name):
+    def loader():
+        from models.inference_backend import load_backend
+        return load_backend(name)
+    return loader
+
+
+register_model(DEFAULT_MODEL, _load_ecapa)
+for _name in EXPORTED_BACKENDS:
+    register_model(_name, _load_exported(_name))
+
+
+def configure_threads(intra_op=None, inter_op=None):
+    # Applies to torch right away and to ONNX Runtime sessions created later.
+    global _threads_applied
+    import torch
+    if intra_op:
+        torch.set_num_threads(intra_op)
+        _threads["intra_op"] = intra_op
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            # torch only allows this before any inter-op parallel work ran.
+            print(f"[⚠️ WARNING] inter-op threads not changed: {e}")
+        _threads["inter_op"] = inter_op
+    _threads_applied = True
+
+
+def thread_settings():
+    return dict(_threads)
+
+
+def set_active_model(name):
+    global _active_model
+    if name not in _loaders:
+        raise KeyError(f"Unknown model '{name}'. Registered: {sorted(_loaders)}")
+    _active_model = name
+
+
+def active_model():
+    return _active_model
+
+
+def get_model(name=None):
+    name = name or _active_model
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            if name not in _models:
+                if name not in _loaders:
+                    raise KeyError(f"Unknown model '{name}'. Registered: {sorted(_loaders)}")
+                if not _threads_applied:
+                    configure_threads(_threads["intra_op"], _threads["inter_op"])
+                _models[name] = _loaders[name]()
+            model = _models[name]
+    return model
+
+
+def is_loaded(name=None):
+    return (name or _active_model) in _models
+
+
+def unload(name=None):
+    with _lock:
+        _models.pop(name or _active_model, None)
+
+
+def warmup(name=None, seconds=1.0):
+    # Loads the model and runs one dummy forward pass so the first real
+    # request does not pay for lazy initialisation inside torch.
+    import torch
+    model = get_model(name)
+    with torch.no_grad():
+        model.encode_batch(torch.zeros(1, int(16000 * seconds)), torch.ones(1))
+    return model
+
+
+def measure_import_time(module="models.training_evaluation"):
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=repo_root, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    elapsed = measure_import_time()
+    status = "✅" if elapsed < IMPORT_TIME_BUDGET_S else "❌"
+    print(f"{status} import models.training_evaluation: {elapsed:.3f}s (budget {IMPORT_TIME_BUDGET_S}s)")
+    if elapsed >= IMPORT_TIME_BUDGET_S:
+        sys.exit(1)
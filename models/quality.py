@@ -0,0 +1,154 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from models.metrics import get_metrics
+
+# Quality gate on raw PCM, before any decode-side preprocessing: speech
+# duration, SNR estimate, clipping ratio and RMS level from one pass of
+# vectorised frame statistics, a millisecond or so for a 10 s recording.
+#
+# Speech frames are those more than SPEECH_MARGIN_DB above the noise floor
+# (a low percentile of frame energies) and above MIN_SPEECH_DBFS. The SNR
+# estimate is the mean speech-frame power over the noise floor.
+#
+# reasons are rejections: the recording is not worth embedding. warnings
+# flag audio that is embedded anyway. Both are short machine-readable codes:
+#   empty       shorter than one frame
+#   too_quiet   RMS below MIN_RMS_DBFS
+#   too_short   less than MIN_SPEECH_SECONDS of speech
+#   clipped     more than MAX_CLIPPING_RATIO of samples at full scale
+#   low_snr     SNR estimate below MIN_SNR_DB
+#   clipping / noisy   the same checks at the WARN_* levels
+
+FRAME_MS = 25
+NOISE_PERCENTILE = 10
+SPEECH_MARGIN_DB = 6.0
+MIN_SPEECH_DBFS = -55.0
+CLIP_LEVEL = 0.999
+MIN_SPEECH_SECONDS = float(os.environ.get("VB_MIN_SPEECH_SECONDS", 0.5))
+MIN_RMS_DBFS = -55.0
+MAX_CLIPPING_RATIO = 0.02
+WARN_CLIPPING_RATIO = 0.001
+MIN_SNR_DB = 3.0
+WARN_SNR_DB = 10.0
+# VB_QUALITY_GATE=0 lets every recording through to preprocessing.
+QUALITY_GATE = os.environ.get("VB_QUALITY_GATE", "1") != "0"
+
+QualityReport = namedtuple("QualityReport", [
+    "accepted", "reasons", "warnings", "duration_seconds", "speech_seconds", "snr_db", "clipping_ratio", "rms_dbfs",
+])
+
+
+class QualityError(ValueError):
+    # The recording failed the quality gate; report holds the details.
+    vb_stage = "quality"
+
+    def __init__(self, report):
+        super().__init__(f"Rejected by the quality gate: {', '.join(report.reasons)}")
+        self.report = report
+        self.vb_reason = report.reasons[0]
+
+
+def _db(power):
+    return 10 * np.log10(np.maximum(power, 1e-10))
+
+
+class QualityMeter:
+    # Frame statistics accumulated chunk by chunk, so live capture can be
+    # assessed without keeping the audio. assess_quality() is one add().
+    def __init__(self):
+        self.sample_rate = None
+        self._frame_power = []
+        self._pending = np.empty(0, dtype=np.float32)
+        self._samples = 0
+        self._clipped = 0
+        self._channel_samples = 0
+        self._sum_squares = 0.0
+
+    def add(self, samples, sample_rate):
+        # samples: (T,) or (channels, T) integer or float PCM.
+        samples = np.asarray(samples)
+        if np.issubdtype(samples.dtype, np.integer):
+            full_scale = float(np.iinfo(samples.dtype).max + 1)
+            samples = samples.astype(np.float32) / full_scale
+        samples = samples.astype(np.float32, copy=False)
+        if sample_rate != self.sample_rate:
+            self._pending = np.empty(0, dtype=np.float32)
+            self.sample_rate = sample_rate
+
+        self._clipped += int(np.count_nonzero(np.abs(samples) >= CLIP_LEVEL))
+        self._channel_samples += samples.size
+        mono = samples.mean(axis=0) if samples.ndim == 2 else samples
+        self._samples += len(mono)
+        self._sum_squares += float(np.dot(mono, mono))
+
+        frame = sample_rate * FRAME_MS // 1000
+        mono = np.concatenate([self._pending, mono])
+        n_frames = len(mono) // frame
+        if n_frames:
+            frames = mono[:n_frames * frame].reshape(n_frames, frame)
+            self._frame_power.append(np.mean(frames * frames, axis=1))
+        self._pending = mono[n_frames * frame:]
+        return self
+
+    def report(self):
+        power = np.concatenate(self._frame_power) if self._frame_power else np.empty(0)
+        duration = self._samples / self.sample_rate if self.sample_rate else 0.0
+        rms_dbfs = float(_db(self._sum_squares / max(self._samples, 1)))
+        clipping = self._clipped / max(self._channel_samples, 1)
+        if len(power) == 0:
+            return QualityReport(False, ["empty"], [], duration, 0.0, 0.0, clipping, rms_dbfs)
+
+        energy_db = _db(power)
+        noise_db = float(np.percentile(energy_db, NOISE_PERCENTILE))
+        speech = energy_db > max(noise_db + SPEECH_MARGIN_DB, MIN_SPEECH_DBFS)
+        speech_seconds = float(np.count_nonzero(speech)) * FRAME_MS / 1000
+        snr_db = float(_db(power[speech].mean()) - noise_db) if speech.any() else 0.0
+
+        reasons, warnings = [], []
+        if rms_dbfs < MIN_RMS_DBFS:
+            reasons.append("too_quiet")
+        if speech_seconds < MIN_SPEECH_SECONDS:
+            reasons.append("too_short")
+        if clipping > MAX_CLIPPING_RATIO:
+            reasons.append("clipped")
+        elif clipping > WARN_CLIPPING_RATIO:
+            warnings.append("clipping")
+        if speech.any() and snr_db < MIN_SNR_DB:
+            reasons.append("low_snr")
+        elif speech.any() and snr_db < WARN_SNR_DB:
+            warnings.append("noisy")
+        return QualityReport(not reasons, reasons, warnings, duration, speech_seconds, snr_db, clipping, rms_dbfs)
+
+
+def assess_quality(waveform, sample_rate):
+    # waveform: (T,) or (channels, T) PCM as an ndarray or tensor.
+    if not isinstance(waveform, np.ndarray):
+        waveform = waveform.numpy()
+    return QualityMeter().add(waveform, sample_rate).report()
+
+
+def check_quality(waveform, sample_rate):
+    # Raises QualityError on a rejection; counts warnings as flags.
+    report = assess_quality(waveform, sample_rate)
+    for warning in report.warnings:
+        get_metrics().increment("vb_quality_flags_total", {"flag": warning})
+    if not report.accepted:
+        raise QualityError(report)
+    return report
+
+
+def describe(report):
+    # One line for people: what is wrong and what to do about it.
+    messages = {
+        "empty": "nothing was recorded",
+        "too_quiet": "the recording is too quiet",
+        "too_short": f"less than {MIN_SPEECH_SECONDS:g}s of speech was heard",
+        "clipped": "the audio is distorted (too loud)",
+        "low_snr": "there is too much background noise",
+        "clipping": "the audio is slightly distorted",
+        "noisy": "there is some background noise",
+    }
+    return "; ".join(messages[code] for code in report.reasons + report.warnings)
@@ -0,0 +1,290 @@
+import math
+import threading
+
+import numpy as np
+
+from models.training_evaluation import TARGET_SAMPLE_RATE, embed_waveforms, get_resampler, preprocess_waveform
+from models.verification import get_verifier
+
+# Streaming verification for live capture. Audio is downmixed, resampled to
+# 16 kHz and passed through an incremental energy VAD as it arrives; only
+# speech goes into a fixed-size ring buffer, so a session holds at most
+# RING_SECONDS of audio however long the microphone stays open. Once enough
+# speech has arrived, sliding windows are embedded and scored against the
+# claimed user's enrollment in a background thread, and the session
+# decides as soon as the running mean score clears the threshold by a
+# margin in either direction.
+
+RING_SECONDS = 12.0
+WINDOW_SECONDS = 2.0
+HOP_SECONDS = 1.0
+MIN_WINDOWS = 2
+MAX_SPEECH_SECONDS = 8.0
+MIN_FINAL_SPEECH_SECONDS = 0.5
+# Early-decision margins around the verifier threshold, per score scale.
+COSINE_MARGIN = 0.1
+ASNORM_MARGIN = 1.0
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._write = 0
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, len(self._data))
+
+    def write(self, samples):
+        capacity = len(self._data)
+        self.total += len(samples)
+        samples = samples[-capacity:]
+        first = min(len(samples), capacity - self._write)
+        self._data[self._write:self._write + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self._write = (self._write + len(samples)) % capacity
+
+    def latest(self, n):
+        n = min(n, len(self))
+        start = (self._write - n) % len(self._data)
+        if start + n <= len(self._data):
+            return self._data[start:start + n].copy()
+        return np.concatenate([self._data[start:], self._data[:self._write]])
+
+
+class StreamResampler:
+    # Chunked resampling without seams: every chunk is resampled together
+    # with CONTEXT input samples on each side, and only the output that
+    # belongs to the chunk is kept. Chunks are whole multiples of the
+    # reduced input step so output samples line up exactly.
+    CONTEXT_STEPS = 16
+
+    def __init__(self, orig_freq, new_freq=TARGET_SAMPLE_RATE):
+        g = math.gcd(orig_freq, new_freq)
+        self.orig_freq, self.new_freq = orig_freq, new_freq
+        self.down, self.up = orig_freq // g, new_freq // g
+        self.context = self.CONTEXT_STEPS * self.down
+        self._buffer = np.zeros(self.context, dtype=np.float32)
+
+    def process(self, samples):
+        if self.orig_freq == self.new_freq:
+            return samples
+        import torch
+        self._buffer = np.concatenate([self._buffer, samples])
+        usable = (len(self._buffer) - 2 * self.context) // self.down * self.down
+        if usable <= 0:
+            return np.empty(0, dtype=np.float32)
+        chunk = self._buffer[:usable + 2 * self.context]
+        out = get_resampler(self.orig_freq, self.new_freq)(torch.from_numpy(chunk).unsqueeze(0))[0].numpy()
+        skip = self.CONTEXT_STEPS * self.up
+        out = out[skip:skip + usable // self.down * self.up]
+        self._buffer = self._buffer[usable:]
+        return out
+
+    def flush(self):
+        # Resamples whatever is still held back, with silence as the right
+        # context, and starts over.
+        pending = len(self._buffer) - self.context
+        if self.orig_freq == self.new_freq or pending <= 0:
+            return np.empty(0, dtype=np.float32)
+        import torch
+        padded = -(-pending // self.down) * self.down
+        chunk = np.concatenate([self._buffer, np.zeros(padded - pending + self.context, dtype=np.float32)])
+        out = get_resampler(self.orig_freq, self.new_freq)(torch.from_numpy(chunk).unsqueeze(0))[0].numpy()
+        skip = self.CONTEXT_STEPS * self.up
+        out = out[skip:skip + -(-pending * self.up // self.down)]
+        self._buffer = np.zeros(self.context, dtype=np.float32)
+        return out
+
+
+class EnergyVad:
+    # Frame-energy VAD with an adaptive noise floor: the floor follows
+    # quiet frames quickly and loud frames slowly, and a short hangover keeps
+    # word endings.
+    def __init__(self, frame_ms=30, margin_db=12.0, min_db=-55.0, hangover_frames=8):
+        self.frame = TARGET_SAMPLE_RATE * frame_ms // 1000
+        self.margin_db = margin_db
+        self.min_db = min_db
+        self.hangover_frames = hangover_frames
+        self.noise_db = -60.0
+        self._hangover = 0
+        self._pending = np.empty(0, dtype=np.float32)
+
+    def process(self, samples):
+        self._pending = np.concatenate([self._pending, samples])
+        n_frames = len(self._pending) // self.frame
+        if n_frames == 0:
+            return np.empty(0, dtype=np.float32)
+        frames = self._pending[:n_frames * self.frame].reshape(n_frames, self.frame)
+        self._pending = self._pending[n_frames * self.frame:]
+
+        energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        keep = np.array([self._keep(e) for e in energy_db], dtype=bool)
+        return frames[keep].reshape(-1)
+
+    def flush(self):
+        # Decides on the trailing partial frame as if it were a whole one.
+        pending, self._pending = self._pending, np.empty(0, dtype=np.float32)
+        if len(pending) and self._keep(10 * np.log10(np.mean(pending ** 2) + 1e-10)):
+            return pending
+        return np.empty(0, dtype=np.float32)
+
+    def _keep(self, energy_db):
+        keep = False
+        if energy_db > max(self.noise_db + self.margin_db, self.min_db):
+            keep = True
+            self._hangover = self.hangover_frames
+        elif self._hangover > 0:
+            keep = True
+            self._hangover -= 1
+        rate = 0.2 if energy_db < self.noise_db else 0.01
+        self.noise_db += rate * (energy_db - self.noise_db)
+        return keep
+
+
+def _to_mono_float(samples):
+    samples = np.asarray(samples)
+    if np.issubdtype(samples.dtype, np.integer):
+        samples = samples.astype(np.float32) / float(np.iinfo(samples.dtype).max + 1)
+    samples = samples.astype(np.float32, copy=False)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=0)
+    return samples
+
+
+class StreamingVerification:
+    def __init__(self, user_id, verifier=None, window_seconds=WINDOW_SECONDS, hop_seconds=HOP_SECONDS,
+                 min_windows=MIN_WINDOWS, margin=None, max_speech_seconds=MAX_SPEECH_SECONDS,
+                 ring_seconds=RING_SECONDS, background=True):
+        self.user_id = user_id
+        self.verifier = verifier or get_verifier()
+        self.threshold = self.verifier.threshold
+        self._auto_margin = margin is None
+        if margin is None:
+            margin = ASNORM_MARGIN if self.verifier.cohort is not None else COSINE_MARGIN
+        self.margin = margin
+        self.window = int(window_seconds * TARGET_SAMPLE_RATE)
+        self.hop = int(hop_seconds * TARGET_SAMPLE_RATE)
+        self.min_windows = min_windows
+        self.max_speech = int(max_speech_seconds * TARGET_SAMPLE_RATE)
+
+        self.ring = RingBuffer(int(ring_seconds * TARGET_SAMPLE_RATE))
+        self.vad = EnergyVad()
+        self.scores = []
+        self.decision = None
+        self._resampler = None
+        self._scored_at = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+
+        # The claimed user's enrollment is fetched once per session.
+        self.enrollment = self.verifier.enrollment_vector(user_id)
+        if self.enrollment is None:
+            self.decision = {"user_id": user_id, "accepted": False, "reason": "not_enrolled"}
+
+        self._worker = None
+        if background and self.decision is None:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    @property
+    def speech_samples(self):
+        return self.ring.total
+
+    def feed(self, samples, sample_rate):
+        # Cheap enough for the capture thread: no model work happens here.
+        if self.decision is not None or self._stopped:
+            return
+        if self._resampler is None or self._resampler.orig_freq != sample_rate:
+            self._resampler = StreamResampler(sample_rate)
+        speech = self.vad.process(self._resampler.process(_to_mono_float(samples)))
+        if len(speech):
+            with self._lock:
+                self.ring.write(speech)
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped and self.decision is None:
+            self._wake.wait(timeout=0.5)
+            self._wake.clear()
+            while self.decision is None and self.step():
+                pass
+
+    def _score_latest(self, n):
+        with self._lock:
+            window = self.ring.latest(n)
+            self._scored_at = self.ring.total
+        try:
+            embedding = embed_waveforms([preprocess_waveform(window, TARGET_SAMPLE_RATE)])[0]
+        except Exception as e:
+            print(f"[❌ ERROR] streaming window: {e}")
+            return False
+        result = self.verifier.score(self.user_id, embedding, enrollment=self.enrollment)
+        if result["threshold"] != self.threshold:
+            # The verifier fell back to raw cosine for this speaker.
+            self.threshold = result["threshold"]
+            if self._auto_margin:
+                self.margin = COSINE_MARGIN
+        self.scores.append(result["score"])
+        return True
+
+    def _decide(self, reason, accepted):
+        self.decision = {
+            "user_id": self.user_id,
+            "accepted": bool(accepted),
+            "score": float(np.mean(self.scores)) if self.scores else None,
+            "threshold": self.threshold,
+            "windows": len(self.scores),
+            "speech_seconds": self.ring.total / TARGET_SAMPLE_RATE,
+            "reason": reason,
+        }
+        return self.decision
+
+    def step(self):
+        # Scores one window if one is due; returns True if it did.
+        with self._lock:
+            total = self.ring.total
+        if self.decision is not None or total < self.window or total - self._scored_at < self.hop:
+            return False
+        if not self._score_latest(self.window):
+            return False
+
+        mean = float(np.mean(self.scores))
+        if len(self.scores) >= self.min_windows:
+            if mean >= self.threshold + self.margin:
+                self._decide("early_accept", True)
+            elif mean <= self.threshold - self.margin:
+                self._decide("early_reject", False)
+        if self.decision is None and total >= self.max_speech:
+            self._decide("max_speech", mean >= self.threshold)
+        return True
+
+    def finish(self):
+        # Called when capture stops: returns the early decision if there is
+        # one, otherwise decides on what has been heard so far.
+        self._stopped = True
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join()
+        if self.decision is not None:
+            return self.decision
+
+        # Audio still held back by the resampler and the VAD's partial frame.
+        if self._resampler is not None:
+            tail = self.vad.process(self._resampler.flush())
+            tail = np.concatenate([tail, self.vad.flush()])
+            if len(tail):
+                with self._lock:
+                    self.ring.write(tail)
+
+        total = self.ring.total
+        if total - self._scored_at >= MIN_FINAL_SPEECH_SECONDS * TARGET_SAMPLE_RATE:
+            self._score_latest(min(max(total - self._scored_at, self.window), len(self.ring)))
+        if not self.scores:
+            return self._decide("no_speech", False)
+        return self._decide("final", float(np.mean(self.scores)) >= self.threshold)
+
+    def speech_audio(self):
+        with self._lock:
+            return self.ring.latest(len(self.ring))
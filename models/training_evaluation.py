@@ -1,78 +1,359 @@
 import os
-import uuid
-import torch
-import torchaudio
+import time
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import noisereduce as nr
 from pydub import AudioSegment
-from speechbrain.pretrained import EncoderClassifier
-import pinecone
 from typing import List, Union
 
+from models.model_registry import active_model, get_model
+from models.embedding_cache import EmbeddingCache, get_embedding_cache
+from models.embedding_store import EMBEDDINGS_PATH, EmbeddingWriter, read_embeddings
+from models.metrics import InstrumentedIndex, capture_metrics, record_audio, record_failure, stage_timer
+from models.ingest_manifest import DEFAULT_MANIFEST_PATH
+
+# torch, torchaudio, noisereduce, speechbrain and pinecone are imported
+# inside the functions that need them so this module imports quickly.
+
 # Constants
 PINECONE_API_KEY = "pcsk_2yzKnb_DusX4M95CU1KTjQxkZFPdYWbtFghFc7kUD2cHzpUT4hWPLmMbPgEgT5NgoX3Fib"
 PINECONE_ENV = "us-east-1"
 INDEX_NAME = "voicebiometrics-forbanking"
 EMBEDDING_DIM = 192
 UPSERT_BATCH_SIZE = 100
+# "pinecone", "local" (models.vector_store.LocalVectorStore) or "ann"
+# (models.ann_index.AnnVectorStore, the local store with approximate search
+# for large-population identification)
+VECTOR_STORE = os.environ.get("VB_VECTOR_STORE", "pinecone")
+LOCAL_INDEX_PATH = "data/local_index"
+TARGET_SAMPLE_RATE = 16000
+EMBED_BATCH_SIZE = 32
+# Fbank hop. Utterances with the same number of whole hops get the same
+# frames whether they are zero-padded in a batch or not.
+FRAME_HOP_SAMPLES = 160
+# Padding allowed inside a batch, as a fraction of the shortest member's
+# frames. ECAPA's convolutions reflect-pad at the sequence end, so every
+# whole padded frame shifts the embedding; 0 keeps batched output identical
+# to single-utterance output at the cost of smaller batches.
+EMBED_MAX_PAD_RATIO = float(os.environ.get("VB_EMBED_MAX_PAD_RATIO", 0.0))
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac")
+# Bump whenever preprocess_waveform changes what it produces, so cached
+# embeddings from the old pipeline are no longer used.
+PREPROCESSING_VERSION = 1
+# "reference" runs noisereduce and torchaudio's sox Vad; "fast" runs
+# models.fast_preprocess (one STFT for spectral gating and an energy/ZCR VAD
+# that also drops pauses). Either stage can be switched off to trade
+# accuracy for latency. All three are part of preprocessing_signature().
+PREPROCESSOR = os.environ.get("VB_PREPROCESSOR", "reference")
+DENOISE = os.environ.get("VB_DENOISE", "1") != "0"
+VAD = os.environ.get("VB_VAD", "1") != "0"
+PREPROCESSORS = ("reference", "fast")
 
-# Initialize model
-model = EncoderClassifier.from_hparams(
-    source="speechbrain/spkrec-ecapa-voxceleb",
-    savedir="pretrained_models/spkrec-ecapa-voxceleb",
-    run_opts={"skip_vad": True}
-)
-
-def convert_to_wav_universal(input_folder, output_folder):
-    os.makedirs(output_folder, exist_ok=True)
-    for file_name in os.listdir(input_folder):
-        if file_name.lower().endswith((".mp3", ".wav", ".m4a", ".flac")):
-            input_path = os.path.join(input_folder, file_name)
-            audio = AudioSegment.from_file(input_path)
-            out_path = os.path.join(output_folder, os.path.splitext(file_name)[0] + ".wav")
-            audio.export(out_path, format="wav")
-            print(f"✔ Converted {file_name} to wav")
+def __getattr__(name):
+    # `from models.training_evaluation import model` still works, but only
+    # loads the encoder when someone actually asks for it.
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def audio_to_embedding_enhanced(audio_path):
-    try:
-        audio = AudioSegment.from_file(audio_path)
-        normalized_audio = audio.apply_gain(-audio.dBFS)
-        temp_path = audio_path.replace(".wav", "_normalized.wav")
-        normalized_audio.export(temp_path, format="wav")
+def convert_to_wav_universal(input_folder, output_folder, workers=None):
+    # 16 kHz mono PCM16 copies, converted in parallel and only when out of
+    # date. Returns the utils.audio_tools.ConversionReport.
+    from utils.audio_tools import convert_folder
+    return convert_folder(input_folder, output_folder, workers, extensions=AUDIO_EXTENSIONS)
+
+class NoSpeechError(ValueError):
+    # Preprocessing left nothing to embed.
+    vb_stage = "vad"
+
+def load_audio(audio_path):
+    with stage_timer("decode"):
+        return audio_segment_to_tensor(AudioSegment.from_file(audio_path))
+
+def load_audio_bytes(data, audio_format=None):
+    # Same as load_audio for an uploaded file held in memory. audio_format
+    # is the file extension, when known; without it pydub has to probe the
+    # bytes with ffprobe.
+    import io
+    with stage_timer("decode"):
+        return audio_segment_to_tensor(AudioSegment.from_file(io.BytesIO(data), format=audio_format))
+
+def audio_segment_to_tensor(audio):
+    import torch
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    samples = samples.reshape(-1, audio.channels).T / float(1 << (8 * audio.sample_width - 1))
+    return torch.from_numpy(np.ascontiguousarray(samples)), audio.frame_rate
+
+# Resample kernels and the VAD transform only depend on their parameters, so
+# build them once per process instead of on every call.
+_resamplers = {}
+_vad = None
+
+def get_resampler(orig_freq, new_freq=TARGET_SAMPLE_RATE):
+    import torchaudio
+    key = (orig_freq, new_freq)
+    if key not in _resamplers:
+        _resamplers[key] = torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq)
+    return _resamplers[key]
 
-        waveform, sample_rate = torchaudio.load(temp_path)
+def get_vad():
+    global _vad
+    if _vad is None:
+        import torchaudio
+        _vad = torchaudio.transforms.Vad(sample_rate=TARGET_SAMPLE_RATE)
+    return _vad
+
+def to_waveform_tensor(waveform):
+    # Accepts (samples,) or (channels, samples) PCM as ndarray or tensor;
+    # integer PCM is scaled to [-1, 1].
+    import torch
+    if isinstance(waveform, np.ndarray):
+        if np.issubdtype(waveform.dtype, np.integer):
+            waveform = waveform.astype(np.float32) / float(np.iinfo(waveform.dtype).max + 1)
+        waveform = torch.from_numpy(np.ascontiguousarray(waveform, dtype=np.float32))
+    elif not torch.is_floating_point(waveform):
+        waveform = waveform.float() / float(torch.iinfo(waveform.dtype).max + 1)
+    waveform = waveform.float()
+    if waveform.dim() == 1:
+        waveform = waveform.unsqueeze(0)
+    return waveform
+
+def preprocess_options(preprocessor=None, denoise=None, vad=None):
+    # The settings preprocess_waveform runs with. Pool workers get these
+    # from the parent along with the signature, not from their own module.
+    options = {
+        "preprocessor": PREPROCESSOR if preprocessor is None else preprocessor,
+        "denoise": DENOISE if denoise is None else denoise,
+        "vad": VAD if vad is None else vad,
+    }
+    if options["preprocessor"] not in PREPROCESSORS:
+        raise ValueError(f"Unknown preprocessor {options['preprocessor']!r}, expected one of {PREPROCESSORS}")
+    return options
+
+def prepare_waveform(waveform, sample_rate):
+    # Shared front end: gain, downmix and resample to a (1, T) 16 kHz tensor.
+    import torch
+    waveform = to_waveform_tensor(waveform)
+
+    # Gain to 0 dBFS RMS, saturating like pydub's apply_gain(-dBFS).
+    with stage_timer("gain"):
+        rms = waveform.pow(2).mean().sqrt()
+        if rms > 0:
+            waveform = (waveform / rms).clamp(-1.0, 1.0)
+
+    # Downmix is timed with resampling.
+    with stage_timer("resample"):
         if waveform.shape[0] > 1:
             waveform = torch.mean(waveform, dim=0, keepdim=True)
-        if sample_rate != 16000:
-            resampler = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)
-            waveform = resampler(waveform)
+        if sample_rate != TARGET_SAMPLE_RATE:
+            waveform = get_resampler(sample_rate)(waveform)
+    return waveform
+
+def preprocess_waveform(waveform, sample_rate, **options):
+    # options: see preprocess_options(); unset ones use the module settings.
+    waveform = preprocess_batch([(waveform, sample_rate)], **options)[0]
+    if waveform is None:
+        raise NoSpeechError("Empty VAD result.")
+    return waveform
+
+def preprocess_batch(items, **options):
+    # items: (waveform, sample_rate) pairs. The fast preprocessor handles
+    # them as batches; the reference one goes through them one by one.
+    # Returns a (1, T) tensor per item, None where VAD kept nothing.
+    options = preprocess_options(**options)
+    prepared = [prepare_waveform(waveform, sample_rate) for waveform, sample_rate in items]
+    if options["preprocessor"] == "fast":
+        from models.fast_preprocess import fast_preprocess_batch
+        results = fast_preprocess_batch(
+            [waveform.squeeze(0) for waveform in prepared], denoise=options["denoise"], vad=options["vad"]
+        )
+    else:
+        results = [_reference_preprocess(waveform, options["denoise"], options["vad"]) for waveform in prepared]
+    return results
+
+def _reference_preprocess(waveform, denoise, vad):
+    import torch
+    import noisereduce as nr
+    if denoise:
+        with stage_timer("denoise"):
+            denoised = nr.reduce_noise(y=waveform.squeeze(0).numpy(), sr=TARGET_SAMPLE_RATE)
+            waveform = torch.from_numpy(np.asarray(denoised, dtype=np.float32)).unsqueeze(0)
+    if vad:
+        with stage_timer("vad"):
+            waveform = get_vad()(waveform)
 
-        denoised = nr.reduce_noise(y=waveform.squeeze().numpy(), sr=16000)
-        waveform = torch.tensor(denoised).unsqueeze(0)
+    if waveform.numel() == 0 or waveform.abs().max() == 0:
+        return None
+
+    waveform = waveform / waveform.abs().max()
+    if waveform.shape[1] < TARGET_SAMPLE_RATE:
+        waveform = torch.nn.functional.pad(waveform, (0, TARGET_SAMPLE_RATE - waveform.shape[1]))
+    return waveform
+
+def length_buckets(lengths, batch_size=EMBED_BATCH_SIZE, max_pad_ratio=None):
+    # Groups utterance indices, shortest first, into batches whose longest
+    # member has at most max_pad_ratio more Fbank frames than the shortest.
+    max_pad_ratio = EMBED_MAX_PAD_RATIO if max_pad_ratio is None else max_pad_ratio
+    buckets, bucket, first_frames = [], [], 0
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        frames = lengths[i] // FRAME_HOP_SAMPLES
+        if bucket and (len(bucket) == batch_size or frames > first_frames * (1 + max_pad_ratio)):
+            buckets.append(bucket)
+            bucket = []
+        if not bucket:
+            first_frames = frames
+        bucket.append(i)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+def embed_waveforms(waveforms, batch_size=EMBED_BATCH_SIZE, model_name=None, max_pad_ratio=None):
+    # Embeds preprocessed 16 kHz waveforms with one forward pass per batch.
+    # Utterances are batched with others of (nearly) the same length, and
+    # wav_lens tells the encoder where each one really ends.
+    import torch
+    model = get_model(model_name)
+    waveforms = [w.reshape(-1) for w in waveforms]
+    lengths = [w.shape[0] for w in waveforms]
+    embeddings = np.empty((len(waveforms), EMBEDDING_DIM), dtype=np.float32)
+
+    for bucket in length_buckets(lengths, batch_size, max_pad_ratio):
+        max_len = max(lengths[i] for i in bucket)
+        padded = torch.zeros(len(bucket), max_len)
+        for row, i in enumerate(bucket):
+            padded[row, :lengths[i]] = waveforms[i]
+        wav_lens = torch.tensor([lengths[i] / max_len for i in bucket])
+        with stage_timer("encode", count=len(bucket)), torch.no_grad():
+            batch_embeddings = model.encode_batch(padded, wav_lens)
+        embeddings[bucket] = batch_embeddings.reshape(len(bucket), -1).numpy()
 
-        vad = torchaudio.transforms.Vad(sample_rate=16000)
-        waveform = vad(waveform)
+    return embeddings
 
-        if waveform.numel() == 0:
-            raise ValueError("Empty VAD result.")
+def preprocessing_signature(options=None):
+    options = options or preprocess_options()
+    stages = f"{options['preprocessor']}:dn{int(options['denoise'])}:vad{int(options['vad'])}"
+    return f"pre{PREPROCESSING_VERSION}:{stages}:sr{TARGET_SAMPLE_RATE}:model={active_model()}"
 
-        waveform = waveform / waveform.abs().max()
-        if waveform.shape[1] < 16000:
-            waveform = torch.nn.functional.pad(waveform, (0, 16000 - waveform.shape[1]))
+def embedding_cache_key(waveform, sample_rate, signature=None):
+    # Pool workers get the signature from the process that embeds: their own
+    # active_model() is the environment default, not what the parent chose.
+    signature = signature or preprocessing_signature()
+    return EmbeddingCache.key(to_waveform_tensor(waveform).numpy(), sample_rate, signature)
 
-        waveform = waveform.unsqueeze(0).squeeze(1)
-        embedding = model.encode_batch(waveform)
-        os.remove(temp_path)
-        return embedding.squeeze().numpy()
+def audio_files_to_embeddings(audio_paths, batch_size=EMBED_BATCH_SIZE):
+    # Returns one embedding per path, None where decoding or preprocessing
+    # failed; failures are counted by stage and reason (models.metrics).
+    start = time.perf_counter()
+    cache = get_embedding_cache()
+    results = [None] * len(audio_paths)
+    decoded, positions, keys = [], [], []
+    for position, audio_path in enumerate(audio_paths):
+        try:
+            waveform, sample_rate = load_audio(audio_path)
+            key = embedding_cache_key(waveform, sample_rate) if cache else None
+            cached = cache.get(key) if cache else None
+            if cached is not None:
+                results[position] = cached
+                continue
+            decoded.append((waveform, sample_rate))
+            positions.append(position)
+            keys.append(key)
+        except Exception as e:
+            print(f"[❌ ERROR] {audio_path}: {record_failure(e, 'decode')}")
 
+    waveforms, embedded, seconds = [], [], []
+    for position, key, waveform, (raw, sample_rate) in zip(positions, keys, preprocess_batch(decoded), decoded):
+        if waveform is None:
+            print(f"[❌ ERROR] {audio_paths[position]}: {record_failure(NoSpeechError('Empty VAD result.'))}")
+            continue
+        waveforms.append(waveform)
+        embedded.append((position, key))
+        seconds.append(raw.shape[-1] / sample_rate)
+
+    if waveforms:
+        for (position, key), embedding in zip(embedded, embed_waveforms(waveforms, batch_size)):
+            results[position] = embedding
+            if cache:
+                cache.put(key, embedding)
+        # Every file gets the run's overall real-time factor.
+        elapsed = time.perf_counter() - start
+        for duration in seconds:
+            record_audio(duration, elapsed * duration / sum(seconds))
+    return results
+
+def waveform_to_embedding(waveform, sample_rate):
+    # Returns None when the audio cannot be embedded. The failure is counted
+    # by stage and reason (models.metrics) and logged with both.
+    start = time.perf_counter()
+    try:
+        cache = get_embedding_cache()
+        key = embedding_cache_key(waveform, sample_rate) if cache else None
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            return cached
+        embedding = embed_waveforms([preprocess_waveform(waveform, sample_rate)])[0]
+        if cache:
+            cache.put(key, embedding)
     except Exception as e:
-        print(f"[❌ ERROR] {e}")
+        print(f"[❌ ERROR] {record_failure(e, 'preprocess')}")
         return None
+    record_audio(np.shape(waveform)[-1] / sample_rate, time.perf_counter() - start)
+    return embedding
+
+def init_preprocess_worker():
+    # Initializer for process pools that preprocess one file per task:
+    # intra-op threads would only oversubscribe the cores the pool uses.
+    import torch
+    torch.set_num_threads(1)
+
+def preprocess_audio_bytes(data, audio_format=None, signature=None, options=None):
+    # Decode and preprocess an uploaded file, for worker pools that leave
+    # the encoder to the caller; pass the caller's preprocess_options() and
+    # preprocessing_signature().
+    # Returns (waveform ndarray, cache_key, cached_embedding, events,
+    # audio_seconds); on a cache hit the waveform is None. events are the
+    # worker's stage metrics, for models.metrics.replay() in the caller.
+    # Exceptions keep the stage they were raised in for record_failure().
+    with capture_metrics() as events:
+        waveform, sample_rate = load_audio_bytes(data, audio_format)
+        audio_seconds = waveform.shape[-1] / sample_rate
+        cache = get_embedding_cache()
+        key = embedding_cache_key(waveform, sample_rate, signature) if cache else None
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            return None, key, cached, events, audio_seconds
+        waveform = preprocess_waveform(waveform, sample_rate, **(options or {}))
+    return waveform.reshape(-1).numpy(), key, None, events, audio_seconds
 
-def init_pinecone():
+def audio_to_embedding_enhanced(audio_path):
+    try:
+        waveform, sample_rate = load_audio(audio_path)
+    except Exception as e:
+        print(f"[❌ ERROR] {audio_path}: {record_failure(e, 'decode')}")
+        return None
+    return waveform_to_embedding(waveform, sample_rate)
+
+# Index handles are created once per process and reused, so register and
+# verify do not pay for a list_indexes() round trip every time.
+_index_handles = {}
+
+def init_pinecone(backend=None):
+    backend = backend or VECTOR_STORE
+    if backend not in _index_handles:
+        if backend == "local":
+            from models.vector_store import LocalVectorStore
+            index = LocalVectorStore(LOCAL_INDEX_PATH, EMBEDDING_DIM)
+        elif backend == "ann":
+            from models.ann_index import ANN_INDEX_PATH, AnnVectorStore
+            index = AnnVectorStore(ANN_INDEX_PATH, EMBEDDING_DIM)
+        elif backend == "pinecone":
+            index = _connect_pinecone()
+        else:
+            raise ValueError(f"Unknown vector store '{backend}'. Use 'pinecone', 'local' or 'ann'.")
+        # Round trips show up as vb_stage_seconds{stage="vector_store"}.
+        _index_handles[backend] = InstrumentedIndex(index)
+    return _index_handles[backend]
+
+def _connect_pinecone():
+    import pinecone
     pc = pinecone.Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENV)
     if INDEX_NAME not in pc.list_indexes().names():
         pc.create_index(
@@ -89,40 +370,69 @@ def format_embeddings(vectors, ids, metadata_list=None):
         for i in range(len(vectors))
     ]
 
-def batch_upsert(index, data, batch_size=10):
-    for i in range(0, len(data), batch_size):
-        index.upsert(vectors=data[i:i + batch_size])
-        print(f"✅ Upserted batch {i // batch_size + 1}")
-
-def process_audio_directory(input_folder, wav_folder, save_csv=True, upsert_to_pinecone=True, limit=None):
-    convert_to_wav_universal(input_folder, wav_folder)
-    embeddings, ids, metadata = [], [], []
-
-    index = init_pinecone() if upsert_to_pinecone else None
-    wav_files = [f for f in os.listdir(wav_folder) if f.endswith(".wav")]
-    if limit:
-        wav_files = wav_files[:limit]
-
-    for file in wav_files:
-        path = os.path.join(wav_folder, file)
-        emb = audio_to_embedding_enhanced(path)
-        if emb is not None:
-            uid = str(uuid.uuid4())
-            embeddings.append(emb)
-            ids.append(uid)
-            metadata.append({"file_name": file})
-            print(f"🎧 Processed: {file}")
+def batch_upsert(index, data, batch_size=UPSERT_BATCH_SIZE):
+    # Concurrent, retrying upsert; returns stats including failed_ids.
+    from models.bulk_upsert import BulkUpserter, report
+    with BulkUpserter(index, batch_size=batch_size) as upserter:
+        upserter.submit(data)
+    stats = upserter.stats()
+    report(stats)
+    return stats
 
+def process_audio_directory(input_folder, wav_folder, save_embeddings=True, upsert_to_pinecone=True, limit=None,
+                            workers=None, return_embeddings=False, manifest_path=DEFAULT_MANIFEST_PATH,
+                            embeddings_path=EMBEDDINGS_PATH, embeddings_dtype="float32"):
+    # Embeddings stream to the sinks and are not kept in memory, so a run
+    # over any number of files uses flat memory. save_embeddings writes them
+    # to the binary store at embeddings_path (models.embedding_store).
+    # return_embeddings=True returns (embeddings, ids, metadata): read back
+    # from that store as a memory map when saving, otherwise collected in
+    # memory (about 1 KB per file). Without it, three empty lists come back.
+    # With a manifest (the default when upserting), only new or changed
+    # files are upserted, under IDs derived from their path, and vectors of
+    # deleted source files are removed. The store and the returned lists
+    # still cover every file; unchanged files come from the embedding cache
+    # when it is enabled. With neither save_embeddings nor return_embeddings,
+    # unchanged files are skipped entirely. manifest_path=None re-ingests
+    # everything under random IDs.
+    from models.ingest_pipeline import MemorySink, MultiSink, PineconeSink, list_audio_files, run_ingest_pipeline
+    from models.ingest_manifest import IngestManifest, ManifestSink, delete_removed, vector_id_for
+
+    paths = list(list_audio_files(input_folder, limit=limit))
+    id_for = None
+    sinks = []
+    memory = MemorySink() if return_embeddings and not save_embeddings else None
+    if memory is not None:
+        sinks.append(memory)
     if upsert_to_pinecone:
-        formatted = format_embeddings(embeddings, ids, metadata)
-        batch_upsert(index, formatted)
+        index = init_pinecone()
+        index_sink = PineconeSink(index)
+        if manifest_path:
+            manifest = IngestManifest(manifest_path)
+            pending, unchanged = manifest.plan(paths, preprocessing_signature())
+            removed = delete_removed(index, manifest, input_folder)
+            print(f"📒 {len(pending)} new or changed, {unchanged} unchanged, {removed} removed")
+            if not (save_embeddings or return_embeddings):
+                paths = list(pending)
+            id_for = vector_id_for
+            index_sink = ManifestSink(index_sink, manifest, pending)
+        sinks.append(index_sink)
+    if save_embeddings:
+        sinks.append(EmbeddingWriter(embeddings_path, dtype=embeddings_dtype))
 
-    if save_csv:
-        df = pd.DataFrame(embeddings, index=ids)
-        df.index.name = 'id'
-        df.to_csv("embeddings.csv")
+    run_ingest_pipeline(
+        paths,
+        MultiSink(sinks),
+        workers=workers,
+        wav_folder=wav_folder,
+        id_for=id_for,
+    )
 
-    return embeddings, ids, metadata
+    if not return_embeddings:
+        return [], [], []
+    if memory is None:
+        return read_embeddings(embeddings_path)
+    return memory.embeddings, memory.ids, memory.metadata
 
 def similarity_search(audio_path: str, index, top_k: int = 5):
     query_embedding = audio_to_embedding_enhanced(audio_path)
@@ -130,10 +440,10 @@ def similarity_search(audio_path: str, index, top_k: int = 5):
 
 
 if __name__ == "__main__":
-    embeddings, ids, metadata_list = process_audio_directory(
+    process_audio_directory(
         input_folder="recordings_training",
         wav_folder="data/Convert2wav",
-        save_csv=True,
+        save_embeddings=True,
         upsert_to_pinecone=True,
         limit=100
     )
@@ -0,0 +1,294 @@
+import os
+import json
+import threading
+import contextlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process locking, see LocalVectorStore.
+    fcntl = None
+
+from models.training_evaluation import EMBEDDING_DIM
+
+# Vector stores follow the subset of Pinecone's Index API the project uses,
+# so a pinecone.Index and a LocalVectorStore are interchangeable:
+#
+#   upsert(vectors)                      (id, values[, metadata]) tuples or dicts
+#   fetch(ids)                           -> {"vectors": {id: {"id", "values", "metadata"}}}
+#   query(vector, top_k, include_metadata, include_values)
+#                                        -> {"matches": [{"id", "score", "metadata"}]}
+#   delete(ids=None, delete_all=False)
+#   describe_index_stats()               -> {"dimension", "total_vector_count"}
+#
+# Scores are cosine similarities, like the Pinecone index created by
+# init_pinecone().
+
+
+class Response(dict):
+    # Pinecone responses allow both response["matches"] and response.matches.
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class VectorStore(ABC):
+    @abstractmethod
+    def upsert(self, vectors, **kwargs):
+        ...
+
+    @abstractmethod
+    def fetch(self, ids, **kwargs):
+        ...
+
+    @abstractmethod
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, **kwargs):
+        ...
+
+    @abstractmethod
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        ...
+
+    @abstractmethod
+    def describe_index_stats(self, **kwargs):
+        ...
+
+
+def _unpack(vector):
+    if isinstance(vector, dict):
+        return vector["id"], vector["values"], vector.get("metadata")
+    if len(vector) == 3:
+        return vector
+    return vector[0], vector[1], None
+
+
+class LocalVectorStore(VectorStore):
+    # Single-node store: float32 rows in an append-only, memory-mapped file
+    # plus a JSON-lines log of upserts and deletes that is replayed on open.
+    # Re-upserting an ID appends a new row and retires the old one;
+    # compact() rewrites the files without retired rows.
+    #
+    # Several handles and processes (the app, ingest runs, API workers) can
+    # share one directory. Writers hold an exclusive flock on <path>/lock,
+    # readers a shared one, and every call first replays the log records
+    # other handles appended since it last looked, so row numbers always
+    # come from the log and never from a stale in-memory count. Without
+    # fcntl (Windows) only one process may open a directory at a time.
+
+    def __init__(self, path, dimension=EMBEDDING_DIM):
+        self.path = path
+        self.dimension = dimension
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._log_path = os.path.join(path, "log.jsonl")
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, "lock"), "a+")
+        with self._locked(exclusive=False):
+            self._load()
+
+    # -------------------- Storage --------------------
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        self._rows = {}
+        self._metadata = {}
+        self._n_rows = 0
+        self._row_ids = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._inv_norms = np.zeros(0, dtype=np.float32)
+        self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+        self._log_offset = 0
+        self._log_inode = None
+        self._sync()
+
+    def _sync(self):
+        # Applies log records appended since the last call. A log replaced by
+        # compact() (new inode, or shorter than what was read) is re-read.
+        try:
+            stat = os.stat(self._log_path)
+        except FileNotFoundError:
+            return
+        if self._log_inode is not None and (stat.st_ino != self._log_inode or stat.st_size < self._log_offset):
+            self._load()
+            return
+        self._log_inode = stat.st_ino
+        if stat.st_size == self._log_offset:
+            return
+
+        with open(self._log_path, "rb") as log:
+            log.seek(self._log_offset)
+            data = log.read(stat.st_size - self._log_offset)
+        # Only whole lines; a torn final line is re-read next time.
+        data = data[:data.rfind(b"\n") + 1]
+        self._log_offset += len(data)
+        records = [json.loads(line) for line in data.splitlines() if line.strip()]
+        if records:
+            self._apply(records)
+
+    def _apply(self, records):
+        first_new_row = self._n_rows
+        n_rows = max([self._n_rows] + [r["row"] + 1 for r in records if r["op"] == "upsert"])
+        if n_rows > self._n_rows:
+            self._row_ids.extend([None] * (n_rows - self._n_rows))
+            self._alive = np.concatenate([self._alive, np.zeros(n_rows - self._n_rows, dtype=bool)])
+            self._n_rows = n_rows
+
+        for record in records:
+            vector_id = record["id"]
+            old_row = self._rows.pop(vector_id, None)
+            if old_row is not None:
+                self._alive[old_row] = False
+                self._row_ids[old_row] = None
+            self._metadata.pop(vector_id, None)
+            if record["op"] == "upsert":
+                row = record["row"]
+                self._rows[vector_id] = row
+                self._metadata[vector_id] = record.get("metadata")
+                self._row_ids[row] = vector_id
+                self._alive[row] = True
+
+        if self._n_rows > first_new_row:
+            self._remap()
+            norms = np.linalg.norm(self._matrix[first_new_row:], axis=1)
+            inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0).astype(np.float32)
+            self._inv_norms = np.concatenate([self._inv_norms, inv_norms])
+
+    def _remap(self):
+        # Rows written past the last logged upsert (a crash between the two
+        # writes) are ignored because the shape comes from the log.
+        if self._n_rows:
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(self._n_rows, self.dimension)
+            )
+        else:
+            self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+
+    def _append_log(self, records):
+        with open(self._log_path, "a") as log:
+            for record in records:
+                log.write(json.dumps(record) + "\n")
+
+    # -------------------- API --------------------
+
+    def upsert(self, vectors, **kwargs):
+        if not vectors:
+            return Response(upserted_count=0)
+        ids, values, metadata = zip(*(_unpack(v) for v in vectors))
+        matrix = np.asarray(values, dtype=np.float32).reshape(len(ids), -1)
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {self.dimension}")
+
+        with self._locked(exclusive=True):
+            self._sync()
+            # Align the file to the logged row count before appending.
+            first_row = self._n_rows
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(first_row * self.dimension * 4)
+                f.write(matrix.tobytes())
+            self._append_log(
+                {"op": "upsert", "id": vector_id, "row": first_row + i, "metadata": metadata[i]}
+                for i, vector_id in enumerate(ids)
+            )
+            self._sync()
+        return Response(upserted_count=len(ids))
+
+    def fetch(self, ids, **kwargs):
+        with self._locked(exclusive=False):
+            self._sync()
+            vectors = {}
+            for vector_id in ids:
+                row = self._rows.get(vector_id)
+                if row is not None:
+                    vectors[vector_id] = Response(
+                        id=vector_id,
+                        values=self._matrix[row].tolist(),
+                        metadata=self._metadata.get(vector_id),
+                    )
+        return Response(vectors=vectors)
+
+    def fetch_matrix(self, ids):
+        # NumPy variant of fetch for local scoring: (matrix, found_ids).
+        with self._locked(exclusive=False):
+            self._sync()
+            found = [vector_id for vector_id in ids if vector_id in self._rows]
+            rows = [self._rows[vector_id] for vector_id in found]
+            return np.array(self._matrix[rows]), found
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, **kwargs):
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        query_norm = np.linalg.norm(query)
+        with self._locked(exclusive=False):
+            self._sync()
+            n_alive = len(self._rows)
+            if n_alive == 0 or top_k <= 0:
+                return Response(matches=[])
+            scores = (self._matrix @ query) * self._inv_norms
+            if query_norm > 0:
+                scores /= query_norm
+            scores[~self._alive] = -np.inf
+
+            k = min(top_k, n_alive)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            matches = []
+            for row in top:
+                vector_id = self._row_ids[row]
+                match = Response(id=vector_id, score=float(scores[row]))
+                if include_metadata:
+                    match["metadata"] = self._metadata.get(vector_id)
+                if include_values:
+                    match["values"] = self._matrix[row].tolist()
+                matches.append(match)
+        return Response(matches=matches)
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        with self._locked(exclusive=True):
+            self._sync()
+            if delete_all:
+                ids = list(self._rows)
+            ids = [vector_id for vector_id in (ids or []) if vector_id in self._rows]
+            self._append_log({"op": "delete", "id": vector_id} for vector_id in ids)
+            self._sync()
+        return Response()
+
+    def describe_index_stats(self, **kwargs):
+        with self._locked(exclusive=False):
+            self._sync()
+            return Response(dimension=self.dimension, total_vector_count=len(self._rows))
+
+    def compact(self):
+        # Rewrites both files with only the live rows, in row order. Other
+        # handles notice the new log and reload on their next call.
+        with self._locked(exclusive=True):
+            self._sync()
+            live_rows = np.flatnonzero(self._alive)
+            ids = [self._row_ids[row] for row in live_rows]
+            matrix = np.array(self._matrix[live_rows]) if len(live_rows) else np.empty((0, self.dimension), np.float32)
+
+            with open(self._vectors_path + ".tmp", "wb") as f:
+                f.write(matrix.astype(np.float32).tobytes())
+            with open(self._log_path + ".tmp", "w") as log:
+                for row, vector_id in enumerate(ids):
+                    record = {"op": "upsert", "id": vector_id, "row": row, "metadata": self._metadata.get(vector_id)}
+                    log.write(json.dumps(record) + "\n")
+
+            self._matrix = None
+            os.replace(self._vectors_path + ".tmp", self._vectors_path)
+            os.replace(self._log_path + ".tmp", self._log_path)
+            self._load()
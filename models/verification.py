@@ -0,0 +1,211 @@
+import os
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+from models.training_evaluation import audio_to_embedding_enhanced, init_pinecone, waveform_to_embedding
+
+# 1:1 verification of a claimed identity. Only the claimed user's enrollment
+# vector is fetched and scored, so the cost does not grow with the number of
+# enrolled users. Scores are normalised with adaptive symmetric score
+# normalisation (AS-norm): both sides are compared against the top-N most
+# similar utterances of an impostor cohort, and the raw cosine score is
+# standardised with those statistics. That gives one threshold that means the
+# same thing for every speaker, instead of "is the top hit the claimed user".
+
+COHORT_PATH = "data/cohort.npy"
+COHORT_TOP_N = 200
+# Decision thresholds. Pick them from data with the evaluation tools; these
+# are starting points (0.25 is SpeechBrain's cosine default for ECAPA).
+COSINE_THRESHOLD = 0.25
+ASNORM_THRESHOLD = 2.0
+MIN_COHORT_STD = 1e-6
+# AS-norm needs this many cohort scores once the claimed speaker's own
+# utterances are left out; below that the raw cosine score is used.
+MIN_COHORT_SIZE = 10
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class Cohort:
+    def __init__(self, embeddings, ids=None):
+        self.embeddings = _unit(np.atleast_2d(embeddings))
+        self.ids = np.asarray(ids) if ids is not None else None
+
+    @classmethod
+    def load(cls, path=COHORT_PATH):
+        ids_path = os.path.splitext(path)[0] + "_ids.npy"
+        ids = np.load(ids_path, allow_pickle=False) if os.path.exists(ids_path) else None
+        return cls(np.load(path), ids)
+
+    def save(self, path=COHORT_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, self.embeddings)
+        if self.ids is not None:
+            np.save(os.path.splitext(path)[0] + "_ids.npy", self.ids)
+
+    def stats(self, embedding, top_n=COHORT_TOP_N, exclude_id=None):
+        # Mean and std of the top-N cohort scores for one embedding, or None
+        # when fewer than MIN_COHORT_SIZE cohort utterances remain.
+        scores = self.embeddings @ _unit(embedding)
+        if exclude_id is not None and self.ids is not None:
+            scores = scores[self.ids != exclude_id]
+        if len(scores) < MIN_COHORT_SIZE:
+            return None
+        n = min(top_n, len(scores))
+        top = np.partition(scores, len(scores) - n)[len(scores) - n:]
+        return float(top.mean()), float(max(top.std(), MIN_COHORT_STD))
+
+
+def build_cohort(audio_paths, path=COHORT_PATH, ids=None):
+    from models.training_evaluation import audio_files_to_embeddings
+    embeddings = audio_files_to_embeddings(audio_paths)
+    keep = [i for i, e in enumerate(embeddings) if e is not None]
+    if not keep:
+        raise ValueError("No cohort utterance could be embedded.")
+    cohort = Cohort(np.stack([embeddings[i] for i in keep]), [ids[i] for i in keep] if ids else None)
+    cohort.save(path)
+    return cohort
+
+
+class Verifier:
+    def __init__(self, index, cohort=None, threshold=None, top_n=COHORT_TOP_N):
+        self.index = index
+        self.top_n = top_n
+        self._threshold = threshold
+        self._lock = threading.Lock()
+        # user_id -> (enrollment digest, (mean, std) or None). The digest ties
+        # the cached statistics to the exact enrollment vector they came from.
+        self._stats_cache = {}
+        self.set_cohort(cohort)
+
+    @property
+    def threshold(self):
+        if self._threshold is not None:
+            return self._threshold
+        return ASNORM_THRESHOLD if self.cohort is not None else COSINE_THRESHOLD
+
+    def set_cohort(self, cohort):
+        with self._lock:
+            self.cohort = cohort
+            self._stats_cache.clear()
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._stats_cache.clear()
+            else:
+                self._stats_cache.pop(user_id, None)
+
+    def enroll(self, user_id, embedding, metadata=None):
+        self.index.upsert([(user_id, np.asarray(embedding).tolist(), metadata)])
+        self.invalidate(user_id)
+
+    def remove(self, user_id):
+        self.index.delete(ids=[user_id])
+        self.invalidate(user_id)
+
+    def enrollment_vector(self, user_id):
+        vectors = self.index.fetch(ids=[user_id])["vectors"]
+        if user_id not in vectors:
+            return None
+        return np.asarray(vectors[user_id]["values"], dtype=np.float32)
+
+    def _enrollment_stats(self, user_id, enrollment):
+        digest = hashlib.sha1(enrollment.tobytes()).hexdigest()
+        with self._lock:
+            cached = self._stats_cache.get(user_id)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        stats = self.cohort.stats(enrollment, self.top_n, exclude_id=user_id)
+        with self._lock:
+            self._stats_cache[user_id] = (digest, stats)
+        return stats
+
+    def score(self, user_id, embedding, enrollment=None):
+        # enrollment can be passed in by callers that score several
+        # utterances against the same user (streaming sessions).
+        if enrollment is None:
+            enrollment = self.enrollment_vector(user_id)
+        if enrollment is None:
+            return {"user_id": user_id, "accepted": False, "reason": "not_enrolled"}
+
+        raw_score = float(_unit(enrollment) @ _unit(embedding))
+        score, threshold, normalization = raw_score, self.threshold, "none"
+        if self.cohort is not None:
+            enroll_stats = self._enrollment_stats(user_id, enrollment)
+            test_stats = self.cohort.stats(embedding, self.top_n, exclude_id=user_id)
+            if enroll_stats is None or test_stats is None:
+                # Cohort too small without this speaker: raw cosine instead.
+                threshold = COSINE_THRESHOLD
+            else:
+                (enroll_mean, enroll_std), (test_mean, test_std) = enroll_stats, test_stats
+                score = 0.5 * ((raw_score - enroll_mean) / enroll_std + (raw_score - test_mean) / test_std)
+                normalization = "as-norm"
+
+        return {
+            "user_id": user_id,
+            "accepted": score >= threshold,
+            "score": score,
+            "raw_score": raw_score,
+            "threshold": threshold,
+            "normalization": normalization,
+            "reason": "accepted" if score >= threshold else "below_threshold",
+        }
+
+    def verify(self, user_id, audio, sample_rate=None):
+        # audio is a file path, or PCM samples together with sample_rate.
+        if isinstance(audio, str):
+            embedding = audio_to_embedding_enhanced(audio)
+        else:
+            embedding = waveform_to_embedding(audio, sample_rate)
+        if embedding is None:
+            return {"user_id": user_id, "accepted": False, "reason": "no_embedding"}
+        return self.score(user_id, embedding)
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    # Process-wide verifier on the default index, with the cohort from
+    # COHORT_PATH when one has been built.
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None:
+            cohort = Cohort.load(COHORT_PATH) if os.path.exists(COHORT_PATH) else None
+            _verifier = Verifier(init_pinecone(), cohort)
+    return _verifier
+
+
+def verify(user_id, audio, sample_rate=None):
+    return get_verifier().verify(user_id, audio, sample_rate)
+
+
+if __name__ == "__main__":
+    # Builds COHORT_PATH, which get_verifier() loads to switch from raw
+    # cosine to AS-norm scoring. Files are labelled by their name up to the
+    # first "_" (<user_id>_<anything>.wav), so a claimed speaker's own
+    # recordings are left out of their cohort statistics.
+    from models.ingest_pipeline import list_audio_files
+
+    parser = argparse.ArgumentParser(description="Build the AS-norm impostor cohort from a folder of recordings.")
+    parser.add_argument("audio_dir")
+    parser.add_argument("--output", default=COHORT_PATH)
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    paths = list(list_audio_files(args.audio_dir, args.limit))
+    labels = [os.path.basename(path).split("_")[0].split(".")[0] for path in paths]
+    cohort = build_cohort(paths, args.output, ids=labels)
+    print(f"✅ Cohort of {len(cohort.embeddings)} utterances from {len(set(cohort.ids))} speakers saved to {args.output}")
+    if len(cohort.embeddings) < COHORT_TOP_N:
+        print(f"[⚠️ WARNING] fewer than COHORT_TOP_N={COHORT_TOP_N} utterances; AS-norm statistics will be noisy")
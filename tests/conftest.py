@@ -0,0 +1,76 @@
+import wave
+
+import numpy as np
+import pytest
+import torch
+
+from models import embedding_cache
+from models.embedding_cache import EmbeddingCache
+from models.model_registry import active_model, register_model, set_active_model, unload
+from models.training_evaluation import EMBEDDING_DIM, TARGET_SAMPLE_RATE
+
+STUB_MODEL = "stub-encoder"
+
+
+class StubEncoder:
+    # Deterministic stand-in for ECAPA: a fixed projection of 10 ms frames,
+    # averaged over the valid part of each row.
+    def __init__(self):
+        self.proj = torch.randn(160, EMBEDDING_DIM, generator=torch.Generator().manual_seed(0))
+
+    def encode_batch(self, wavs, wav_lens):
+        rows = []
+        for wav, rel in zip(wavs, wav_lens):
+            n = int(round(float(rel) * wav.shape[0])) // 160 * 160
+            rows.append(torch.tanh(wav[:n].reshape(-1, 160) @ self.proj).mean(0))
+        return torch.stack(rows).unsqueeze(1)
+
+
+def speech_like(seconds=2.0, seed=0, sample_rate=TARGET_SAMPLE_RATE):
+    # Half-second bursts of a voiced-like signal with a little noise, loud
+    # enough for the VAD to keep.
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 120 + 40 * seed
+    voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 2 * t), 0, None)
+    return (0.3 * envelope * voiced + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def write_wav(path, samples, sample_rate=TARGET_SAMPLE_RATE):
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return str(path)
+
+
+@pytest.fixture
+def stub_model():
+    previous = active_model()
+    register_model(STUB_MODEL, StubEncoder)
+    set_active_model(STUB_MODEL)
+    yield STUB_MODEL
+    set_active_model(previous)
+    unload(STUB_MODEL)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # A fresh cache for this process and for spawned workers.
+    directory = tmp_path / "embedding_cache"
+    monkeypatch.setenv("VB_EMBEDDING_CACHE_DIR", str(directory))
+    monkeypatch.setattr(embedding_cache, "_cache", EmbeddingCache(str(directory)))
+    return directory
+
+
+@pytest.fixture
+def metrics():
+    # A fresh in-process sink for this test.
+    from models.metrics import InProcessMetrics, set_metrics_sink
+    sink = InProcessMetrics()
+    previous = set_metrics_sink(sink)
+    yield sink
+    set_metrics_sink(previous)
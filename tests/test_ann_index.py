@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from models.ann_index import AnnVectorStore, perturbed_queries, recall_report, synthetic_speakers
+
+DIM = 32
+
+
+def populated(path, n=3000, **kwargs):
+    index = AnnVectorStore(str(path), DIM, pca_dim=16, min_train=n, **kwargs)
+    vectors = synthetic_speakers(n, DIM, clusters=100)
+    # The last upsert reaches min_train and trains the index.
+    index.upsert([(f"v{i}", vectors[i], {"i": i}) for i in range(n - 1)])
+    assert not index.trained
+    index.upsert([(f"v{n - 1}", vectors[n - 1], {"i": n - 1})])
+    assert index.trained
+    return index, vectors
+
+
+def test_recall_against_exact_search(tmp_path):
+    index, _ = populated(tmp_path, nprobe=8)
+    queries = perturbed_queries(index, 50, noise=0.3)
+    same = 0
+    for q in queries:
+        approximate = index.query(q, top_k=1)["matches"][0]
+        exact = index.exact_query(q, top_k=1)["matches"][0]
+        if approximate["id"] == exact["id"]:
+            same += 1
+            # Re-ranked scores are exact cosines.
+            assert approximate["score"] == pytest.approx(exact["score"], abs=1e-5)
+    assert same >= 48
+
+    report = recall_report(index, queries, k=10, nprobes=(1, 8))
+    assert [row["nprobe"] for row in report] == [1, 8]
+    assert report[1]["recall@10"] >= 0.95
+    assert report[1]["recall@10"] >= report[0]["recall@10"]
+
+
+def test_incremental_add_delete_and_persistence(tmp_path):
+    index, vectors = populated(tmp_path)
+    new = vectors[0] + 0.05 * np.ones(DIM, dtype=np.float32)
+    index.upsert([("new", new, {"source": "late"})])
+    match = index.query(new, top_k=1, include_metadata=True)["matches"][0]
+    assert match["id"] == "new" and match["metadata"] == {"source": "late"}
+
+    index.delete(ids=["v7"])
+    assert "v7" not in [m["id"] for m in index.query(vectors[7], top_k=5)["matches"]]
+
+    # A second handle loads the trained model and codes from disk.
+    reopened = AnnVectorStore(str(tmp_path), DIM, pca_dim=16)
+    assert reopened.trained and reopened._model["id"] == index._model["id"]
+    assert reopened._on_disk() == reopened._n_rows
+    for list_id in range(len(index._model["centroids"])):
+        for ours, theirs in zip(reopened._posting(list_id), index._posting(list_id)):
+            np.testing.assert_array_equal(ours, theirs)
+    for q in perturbed_queries(index, 20):
+        assert reopened.query(q, top_k=5)["matches"] == index.query(q, top_k=5)["matches"]
+
+    # Retraining or compacting through one handle is picked up by the other.
+    reopened.compact()
+    index.train(n_lists=20)
+    assert reopened.query(new, top_k=1)["matches"][0]["id"] == "new"
+    assert len(reopened._model["centroids"]) == 20
+    assert reopened.describe_index_stats()["total_vector_count"] == len(vectors)
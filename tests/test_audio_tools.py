@@ -0,0 +1,62 @@
+import os
+import wave
+
+import numpy as np
+import torch
+
+from conftest import speech_like, write_wav
+from models.training_evaluation import get_resampler, load_audio
+from utils.audio_tools import convert_folder, is_canonical_wav
+
+
+def write_stereo_wav(path, samples, sample_rate):
+    pcm = (np.clip(np.stack([samples, 0.5 * samples], axis=1), -1, 1) * 32767).astype(np.int16)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return str(path)
+
+
+def test_converts_to_canonical_wav_matching_the_pipeline(tmp_path):
+    source = tmp_path / "in"
+    source.mkdir()
+    stereo = write_stereo_wav(source / "call.wav", speech_like(1.0, sample_rate=44100), 44100)
+    (source / "broken.mp3").write_bytes(b"not audio")
+    (source / "notes.txt").write_text("ignored")
+
+    report = convert_folder(str(source), str(tmp_path / "out"), workers=2)
+    assert [os.path.basename(r.source) for r in report.results] == ["broken.mp3", "call.wav"]
+    assert len(report.converted) == 1 and len(report.failed) == 1
+    assert report.failed[0].error
+    assert report.summary()["errors"][0]["source"].endswith("broken.mp3")
+
+    output = report.converted[0].output
+    assert is_canonical_wav(output)
+    # The source downmixed and resampled with the pipeline's own resampler,
+    # up to 16-bit quantisation.
+    waveform, sample_rate = load_audio(stereo)
+    expected = get_resampler(sample_rate)(waveform.mean(0, keepdim=True))
+    actual, rate = load_audio(output)
+    assert rate == 16000 and actual.shape == expected.shape
+    assert torch.allclose(actual, expected, atol=1e-4)
+
+
+def test_reruns_skip_outputs_that_are_up_to_date(tmp_path):
+    source = tmp_path / "in"
+    source.mkdir()
+    paths = [write_wav(source / f"spk{i}.wav", speech_like(0.5, seed=i, sample_rate=8000), 8000) for i in range(3)]
+    out = str(tmp_path / "out")
+
+    assert len(convert_folder(str(source), out, workers=1).converted) == 3
+    rerun = convert_folder(str(source), out, workers=1)
+    assert len(rerun.skipped) == 3 and not rerun.converted
+
+    # A newer source, or an output that is not canonical, is converted again.
+    later = os.path.getmtime(paths[0]) + 10
+    os.utime(paths[0], (later, later))
+    write_wav(os.path.join(out, "spk1.wav"), speech_like(0.5), 8000)
+    rerun = convert_folder(str(source), out, workers=1)
+    assert sorted(os.path.basename(r.source) for r in rerun.converted) == ["spk0.wav", "spk1.wav"]
+    assert len(convert_folder(str(source), out, workers=1, force=True).converted) == 3
@@ -0,0 +1,51 @@
+from conftest import speech_like, write_wav
+import json
+
+import pytest
+
+from models import embedding_cache
+from models.benchmark import compare, meta_mismatches, run_suite
+
+
+def test_suite_reports_every_metric(tmp_path, stub_model):
+    paths = [write_wav(tmp_path / f"speaker{i}.wav", speech_like(1.5, seed=i)) for i in range(2)]
+    report = run_suite(paths, ("warm", "batch", "verify", "ingest"), repeats=1, batch_sizes=(1, 2),
+                       filler=50, copies=1, workers=1)
+    results = report["results"]
+
+    for name in ("warm.pipeline_p50_ms", "warm.encode_p95_ms", "batch.bs2_utt_per_s",
+                 "verify.end_to_end_p50_ms", "verify.index_query_p50_ms", "ingest.files_per_s",
+                 "memory.peak_rss_mb"):
+        assert results[name] > 0
+    assert results["ingest.failed_files"] == 0
+    assert report["meta"]["model"] == stub_model
+    assert report["meta"]["recordings"] == 2
+    # The cache is back on after the run.
+    assert embedding_cache.CACHE_ENABLED
+    json.dumps(report)
+
+
+def test_compare_flags_regressions_by_direction():
+    baseline = {"warm.pipeline_p50_ms": 100.0, "batch.bs8_utt_per_s": 50.0, "memory.peak_rss_mb": 500.0,
+                "ingest.files_per_s": 10.0}
+    results = {"warm.pipeline_p50_ms": 130.0, "batch.bs8_utt_per_s": 60.0, "memory.peak_rss_mb": 510.0,
+               "ingest.files_per_s": 8.0}
+    rows = {row["metric"]: row for row in compare(results, baseline, tolerance=0.15)}
+
+    assert rows["warm.pipeline_p50_ms"]["change"] == pytest.approx(-0.3)
+    assert rows["warm.pipeline_p50_ms"]["regression"]
+    assert rows["batch.bs8_utt_per_s"]["change"] == pytest.approx(0.2)
+    assert not rows["batch.bs8_utt_per_s"]["regression"]
+    assert not rows["memory.peak_rss_mb"]["regression"]
+    assert rows["ingest.files_per_s"]["regression"]
+    # Metrics missing from either run are skipped.
+    assert len(compare({"new_ms": 1.0}, baseline)) == 0
+
+
+def test_meta_mismatches_name_the_settings_that_differ():
+    meta = {"model": "ecapa", "threads": {"intra_op": 4, "inter_op": None}, "cpus": 8,
+            "preprocessing": {"preprocessor": "fast"}, "benchmarks": ["warm"], "timestamp": "a"}
+    same = dict(meta, timestamp="b")
+    assert meta_mismatches(meta, same) == []
+    other = dict(meta, threads={"intra_op": 1, "inter_op": None}, benchmarks=["warm", "batch"])
+    assert meta_mismatches(meta, other) == ["threads", "benchmarks"]
@@ -0,0 +1,84 @@
+import random
+import threading
+import time
+
+import numpy as np
+
+from models.bulk_upsert import BulkUpserter, SimulatedRemoteIndex
+from models.vector_store import LocalVectorStore
+
+DIM = 8
+
+
+def _vectors(n):
+    rng = np.random.default_rng(0)
+    return [(f"vec-{i}", row.tolist(), None) for i, row in enumerate(rng.standard_normal((n, DIM)))]
+
+
+def _index(tmp_path, failure_rate=0.0):
+    return SimulatedRemoteIndex(LocalVectorStore(str(tmp_path), DIM), latency_s=0.001, per_vector_s=0.0,
+                                failure_rate=failure_rate)
+
+
+def test_retries_transient_failures(tmp_path):
+    random.seed(1)
+    index = _index(tmp_path, failure_rate=0.3)
+    with BulkUpserter(index, batch_size=10, workers=4, backoff_base=0.001) as upserter:
+        upserter.submit(_vectors(200))
+    stats = upserter.stats()
+    assert stats["vectors"] == 200 and stats["batches"] == 20
+    assert stats["retries"] > 0 and stats["failed_ids"] == []
+    assert index.index.describe_index_stats()["total_vector_count"] == 200
+
+
+def test_reports_failed_ids_after_max_retries(tmp_path):
+    index = _index(tmp_path, failure_rate=1.0)
+    with BulkUpserter(index, batch_size=10, workers=2, max_retries=2, backoff_base=0.001) as upserter:
+        upserter.submit(_vectors(30))
+    stats = upserter.stats()
+    assert stats["vectors"] == 0
+    assert stats["retries"] == 3 * 2
+    assert sorted(stats["failed_ids"]) == sorted(f"vec-{i}" for i in range(30))
+
+
+def test_on_written_gets_stored_ids_and_errors_are_contained(tmp_path):
+    written = []
+    lock = threading.Lock()
+
+    def on_written(ids):
+        with lock:
+            written.extend(ids)
+        raise RuntimeError("callback bug")
+
+    with BulkUpserter(_index(tmp_path), batch_size=7, workers=3) as upserter:
+        upserter.submit(_vectors(50), on_written)
+    assert sorted(written) == sorted(f"vec-{i}" for i in range(50))
+    assert upserter.stats()["vectors"] == 50
+
+
+class _GatedIndex:
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, **kwargs):
+        with self._lock:
+            self.started += 1
+        self.release.wait(timeout=10)
+
+
+def test_submit_blocks_once_max_pending_batches_are_queued():
+    index = _GatedIndex()
+    upserter = BulkUpserter(index, batch_size=1, workers=2, max_pending=3)
+    submitter = threading.Thread(target=upserter.submit, args=(_vectors(10),), daemon=True)
+    submitter.start()
+    time.sleep(0.2)
+    # Two batches running, one queued, the producer blocked on the fourth.
+    assert submitter.is_alive()
+    assert index.started == 2
+    assert len(upserter._futures) == 3
+    index.release.set()
+    submitter.join(timeout=10)
+    assert not submitter.is_alive()
+    assert upserter.close()["vectors"] == 10
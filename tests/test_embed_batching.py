@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import torch
+
+from models.model_registry import register_model, unload
+from models.training_evaluation import FRAME_HOP_SAMPLES, TARGET_SAMPLE_RATE, embed_waveforms, length_buckets
+from models.inference_backend import BATCH_PARITY_MIN_COSINE, batch_parity_report
+
+MODEL = "ecapa-random-test"
+
+
+class RandomEcapa:
+    # The ECAPA architecture with random weights, so the test runs without
+    # downloading the pretrained model. Padding effects are, if anything,
+    # larger than with trained weights.
+    def __init__(self):
+        from speechbrain.lobes.features import Fbank
+        from speechbrain.lobes.models.ECAPA_TDNN import ECAPA_TDNN
+        from speechbrain.processing.features import InputNormalization
+        torch.manual_seed(0)
+        self.compute_features = Fbank(n_mels=80)
+        self.mean_var_norm = InputNormalization(norm_type="sentence", std_norm=False)
+        self.embedding_model = ECAPA_TDNN(
+            input_size=80, lin_neurons=192, channels=[128, 128, 128, 128, 384], attention_channels=32
+        ).eval()
+
+    def encode_batch(self, wavs, wav_lens):
+        with torch.no_grad():
+            feats = self.mean_var_norm(self.compute_features(wavs), wav_lens)
+            return self.embedding_model(feats, wav_lens)
+
+
+@pytest.fixture(scope="module")
+def model():
+    pytest.importorskip("speechbrain")
+    register_model(MODEL, RandomEcapa)
+    yield MODEL
+    unload(MODEL)
+
+
+def _waveforms(lengths):
+    rng = np.random.default_rng(0)
+    return [torch.from_numpy(rng.standard_normal(n).astype(np.float32) * 0.1) for n in lengths]
+
+
+def test_buckets_only_share_frame_counts_by_default():
+    lengths = [16000, 16100, 16159, 16160, 32000, 15999]
+    buckets = length_buckets(lengths, batch_size=4, max_pad_ratio=0.0)
+    for bucket in buckets:
+        assert len({lengths[i] // FRAME_HOP_SAMPLES for i in bucket}) == 1
+    assert sorted(i for bucket in buckets for i in bucket) == list(range(len(lengths)))
+    assert [0, 1, 2] in buckets
+
+
+def test_buckets_respect_batch_size_and_pad_ratio():
+    lengths = [TARGET_SAMPLE_RATE + 160 * i for i in range(10)]
+    assert max(len(b) for b in length_buckets(lengths, batch_size=3, max_pad_ratio=1.0)) == 3
+    assert len(length_buckets(lengths, batch_size=32, max_pad_ratio=0.1)) == 1
+
+
+def test_batched_embeddings_match_single(model):
+    # Same-frame-count groups are batched together, the rest on their own.
+    lengths = [16000, 16080, 16159, 24000, 24100, 40000, 16000 + 3 * 160]
+    report = batch_parity_report(batch_size=8, model_name=model, waveforms=_waveforms(lengths))
+    assert report["batches"] < len(lengths)
+    assert report["min_cosine"] >= BATCH_PARITY_MIN_COSINE
+    assert report["passed"]
+
+
+def test_embeddings_keep_input_order(model):
+    waveforms = _waveforms([24000, 16000, 40000])
+    batched = embed_waveforms(waveforms, model_name=model)
+    reversed_batch = embed_waveforms(waveforms[::-1], model_name=model)[::-1]
+    np.testing.assert_allclose(batched, reversed_batch, atol=1e-5)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from models.embedding_store import EmbeddingWriter, export_csv, import_csv, read_embeddings
+
+
+def records(n, start=0, dim=8):
+    rng = np.random.default_rng(start)
+    return [(f"id{i}", rng.standard_normal(dim).astype(np.float32), {"file_name": f"f{i}.wav"})
+            for i in range(start, start + n)]
+
+
+def test_round_trip_is_memory_mapped(tmp_path):
+    path = tmp_path / "store"
+    written = records(5)
+    with EmbeddingWriter(path, dim=8) as writer:
+        writer.write(written[:2])
+        writer.write(written[2:])
+
+    matrix, ids, metadata = read_embeddings(path)
+    assert isinstance(matrix, np.memmap) and matrix.shape == (5, 8) and matrix.dtype == np.float32
+    np.testing.assert_array_equal(matrix, np.stack([e for _, e, _ in written]))
+    assert ids == [i for i, _, _ in written]
+    assert metadata[3] == {"file_name": "f3.wav"}
+
+
+def test_float16_append_and_torn_tail(tmp_path):
+    path = tmp_path / "store"
+    with EmbeddingWriter(path, dim=8, dtype="float16") as writer:
+        writer.write(records(3))
+    # A crash after the vector bytes but before the id line.
+    with open(path / "vectors.bin", "ab") as f:
+        f.write(b"\0" * 10)
+    assert read_embeddings(path)[0].shape == (3, 8)
+
+    with EmbeddingWriter(path, dim=8, dtype="float16", mode="a") as writer:
+        writer.write(records(2, start=3))
+    matrix, ids, _ = read_embeddings(path)
+    assert matrix.dtype == np.float16 and ids == [f"id{i}" for i in range(5)]
+    np.testing.assert_allclose(matrix[4], records(2, start=3)[1][1], atol=1e-2)
+
+    with pytest.raises(ValueError):
+        EmbeddingWriter(path, dim=8, dtype="float32", mode="a")
+
+
+def test_csv_import_and_export(tmp_path):
+    path = tmp_path / "store"
+    with EmbeddingWriter(path, dim=8) as writer:
+        writer.write(records(4))
+    assert export_csv(tmp_path / "embeddings.csv", path) == 4
+    assert import_csv(tmp_path / "embeddings.csv", tmp_path / "copy") == 4
+    np.testing.assert_array_equal(read_embeddings(tmp_path / "copy")[0], read_embeddings(path)[0])
+    assert read_embeddings(tmp_path / "copy")[1] == read_embeddings(path)[1]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from models.evaluation import (
+    all_pairs_histogram,
+    eer,
+    evaluate,
+    min_dcf,
+    pairwise_trials,
+    roc,
+    score_trials,
+    threshold_at_far,
+    threshold_sweep,
+)
+
+
+def cohort(speakers=12, per_speaker=6, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((speakers, dim))
+    labels = np.repeat(np.arange(speakers), per_speaker)
+    return (centres[labels] + 0.9 * rng.standard_normal((len(labels), dim))).astype(np.float32), labels
+
+
+def brute_force(scores, is_target):
+    # Per-threshold loops over every distinct score.
+    rates = []
+    for threshold in np.unique(scores):
+        far = np.mean(scores[~is_target] >= threshold)
+        frr = np.mean(scores[is_target] < threshold)
+        rates.append((threshold, far, frr))
+    return rates
+
+
+def test_blocked_scores_match_full_matrix():
+    embeddings, labels = cohort()
+    # A tiny budget forces one row per block.
+    scores, is_target = pairwise_trials(embeddings, labels, memory_mb=0)
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    upper = np.triu_indices(len(labels), k=1)
+    np.testing.assert_allclose(scores, (normed @ normed.T)[upper], atol=1e-6)
+    np.testing.assert_array_equal(is_target, labels[upper[0]] == labels[upper[1]])
+
+    half, _ = pairwise_trials(embeddings, labels, dtype=np.float16)
+    np.testing.assert_allclose(half, scores, atol=2e-3)
+
+    trials = score_trials(embeddings, upper[0], upper[1], memory_mb=0)
+    np.testing.assert_allclose(trials, scores, atol=1e-6)
+
+
+def test_min_dcf_and_far_threshold_match_brute_force():
+    scores, is_target = pairwise_trials(*cohort())
+    rates = brute_force(scores, is_target)
+    p = 0.05
+    costs = [(p * frr + (1 - p) * far) / min(p, 1 - p) for _, far, frr in rates]
+    assert min_dcf(scores, is_target, p_target=p)[0] == pytest.approx(min(min(costs), 1.0))
+
+    threshold, frr = threshold_at_far(scores, is_target, far=0.01)
+    allowed = [(t, r) for t, f, r in rates if f <= 0.01]
+    assert (threshold, frr) == pytest.approx(min(allowed))
+
+    far, frr = threshold_sweep(scores, is_target, [t for t, _, _ in rates])
+    np.testing.assert_allclose(far, [f for _, f, _ in rates])
+    np.testing.assert_allclose(frr, [r for _, _, r in rates])
+
+
+def test_eer_edge_cases_and_ties():
+    assert eer([0.9, 0.8, 0.1, 0.2], [True, True, False, False])[0] == 0.0
+    assert eer([0.1, 0.2, 0.9, 0.8], [True, True, False, False])[0] == 1.0
+    # Identical scores are one operating point: nothing separates them.
+    assert eer([0.5] * 6, [True] * 3 + [False] * 3)[0] == pytest.approx(0.5)
+    curve = roc([0.5, 0.5, 0.7], [True, False, True])
+    assert list(curve.thresholds) == [np.inf, 0.7, 0.5]
+
+
+def test_histogram_matches_exact_scores():
+    embeddings, labels = cohort(speakers=20, per_speaker=8)
+    scores, is_target = pairwise_trials(embeddings, labels)
+    exact = evaluate(scores, is_target)
+    approximate = evaluate(all_pairs_histogram(embeddings, labels, memory_mb=0).roc())
+
+    assert approximate["targets"] == exact["targets"]
+    assert approximate["nontargets"] == exact["nontargets"]
+    assert approximate["eer"] == pytest.approx(exact["eer"], abs=2e-3)
+    assert approximate["min_dcf"] == pytest.approx(exact["min_dcf"], abs=2e-3)
+    assert approximate["eer_threshold"] == pytest.approx(exact["eer_threshold"], abs=1e-3)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import torch
+
+from conftest import speech_like
+from models.training_evaluation import (
+    TARGET_SAMPLE_RATE,
+    preprocess_batch,
+    preprocess_options,
+    preprocess_waveform,
+    preprocessing_signature,
+)
+
+
+def with_pauses(seed=0):
+    # 0.5 s noise, 1 s speech, 1 s noise, 1 s speech, 0.5 s noise.
+    rng = np.random.default_rng(seed)
+    silence = lambda seconds: np.zeros(int(seconds * TARGET_SAMPLE_RATE), dtype=np.float32)
+    samples = np.concatenate([
+        silence(0.5), speech_like(1.0, seed=seed), silence(1.0), speech_like(1.0, seed=seed + 1), silence(0.5),
+    ])
+    return torch.from_numpy((samples + 0.003 * rng.standard_normal(len(samples))).astype(np.float32))
+
+
+def test_fast_vad_trims_both_ends_and_drops_pauses():
+    waveform = with_pauses()
+    reference = preprocess_waveform(waveform, TARGET_SAMPLE_RATE, preprocessor="reference")
+    fast = preprocess_waveform(waveform, TARGET_SAMPLE_RATE, preprocessor="fast")
+
+    # 2 s of speech plus hangover, against the 4 s input; the sox VAD only
+    # trims the leading half second.
+    assert fast.shape[1] < 2.6 * TARGET_SAMPLE_RATE
+    assert fast.shape[1] < reference.shape[1]
+    assert fast.abs().max() == pytest.approx(1.0)
+
+
+def test_fast_batch_matches_one_at_a_time():
+    items = [(with_pauses(seed)[: int(length * TARGET_SAMPLE_RATE)], TARGET_SAMPLE_RATE)
+             for seed, length in enumerate([1.3, 4.0, 2.2, 3.1])]
+    batched = preprocess_batch(items, preprocessor="fast")
+    for item, waveform in zip(items, batched):
+        single = preprocess_waveform(*item, preprocessor="fast")
+        assert torch.equal(single, waveform)
+
+
+def test_stages_can_be_switched_off():
+    waveform = with_pauses()
+    untouched = preprocess_waveform(waveform, TARGET_SAMPLE_RATE, preprocessor="fast", denoise=False, vad=False)
+    assert untouched.shape[1] == waveform.numel()
+    vad_only = preprocess_waveform(waveform, TARGET_SAMPLE_RATE, preprocessor="fast", denoise=False)
+    assert vad_only.shape[1] < waveform.numel()
+
+
+def test_silence_is_rejected():
+    with pytest.raises(ValueError):
+        preprocess_waveform(torch.zeros(TARGET_SAMPLE_RATE), TARGET_SAMPLE_RATE, preprocessor="fast")
+    assert preprocess_batch([(torch.zeros(TARGET_SAMPLE_RATE), TARGET_SAMPLE_RATE)], preprocessor="fast") == [None]
+
+
+def test_signature_covers_preprocessing_options():
+    signatures = {
+        preprocessing_signature(preprocess_options(preprocessor, denoise, vad))
+        for preprocessor in ("reference", "fast") for denoise in (True, False) for vad in (True, False)
+    }
+    assert len(signatures) == 8
+    with pytest.raises(ValueError):
+        preprocess_options(preprocessor="nope")
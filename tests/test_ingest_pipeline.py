@@ -0,0 +1,56 @@
+from conftest import speech_like, write_wav
+from models.embedding_cache import get_embedding_cache
+from models.ingest_pipeline import MemorySink, run_ingest_pipeline
+from models.training_evaluation import embedding_cache_key, load_audio
+
+
+def test_worker_cache_keys_use_the_parent_model(tmp_path, stub_model, cache_dir):
+    # Workers are spawned with the environment default model; the keys they
+    # compute must still name the model the parent embeds with.
+    paths = [write_wav(tmp_path / f"spk{i}.wav", speech_like(seed=i)) for i in range(3)]
+    sink = MemorySink()
+    stats = run_ingest_pipeline(paths, sink, workers=2, batch_size=2, progress=None)
+    assert stats.embedded == 3 and stats.failed == 0
+
+    cache = get_embedding_cache()
+    for path in paths:
+        assert cache.get(embedding_cache_key(*load_audio(path))) is not None
+
+    rerun = run_ingest_pipeline(paths, MemorySink(), workers=2, batch_size=2, progress=None)
+    assert rerun.cache_hits == 3
+
+
+def test_incremental_rerun_keeps_full_store_and_results(tmp_path, monkeypatch, stub_model, cache_dir):
+    from models import training_evaluation
+    from models.embedding_store import read_embeddings
+    from models.ingest_manifest import vector_id_for
+    from models.training_evaluation import init_pinecone, process_audio_directory
+
+    audio = tmp_path / "audio"
+    audio.mkdir()
+    paths = [write_wav(audio / f"spk{i}.wav", speech_like(seed=i)) for i in range(3)]
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(training_evaluation, "VECTOR_STORE", "local")
+    monkeypatch.setattr(training_evaluation, "LOCAL_INDEX_PATH", str(tmp_path / "index"))
+    monkeypatch.setattr(training_evaluation, "_index_handles", {})
+
+    def run():
+        return process_audio_directory(str(audio), str(tmp_path / "wav"), workers=1, return_embeddings=True,
+                                       manifest_path=str(tmp_path / "manifest.json"))
+
+    def logged_upserts():
+        with open(tmp_path / "index" / "log.jsonl") as f:
+            return sum('"upsert"' in line for line in f)
+
+    expected_ids = sorted(vector_id_for(path) for path in paths)
+    for _ in range(2):
+        embeddings, ids, _ = run()
+        assert sorted(ids) == expected_ids and len(embeddings) == 3
+        stored, stored_ids, _ = read_embeddings(tmp_path / "data" / "embeddings")
+        assert sorted(stored_ids) == expected_ids and stored.shape == (3, embeddings.shape[1])
+        assert logged_upserts() == 3
+
+    write_wav(paths[0], speech_like(seed=7))
+    run()
+    assert logged_upserts() == 4
+    assert init_pinecone().describe_index_stats()["total_vector_count"] == 3
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from conftest import speech_like, write_wav
+from models.ingest_pipeline import MemorySink, run_ingest_pipeline
+from models.metrics import InstrumentedIndex, record_failure, stage_timer
+from models.training_evaluation import TARGET_SAMPLE_RATE, waveform_to_embedding
+from models.vector_store import LocalVectorStore
+
+
+def series(sink, name, **labels):
+    return [s for s in sink.snapshot().get(name, []) if all(s["labels"].get(k) == v for k, v in labels.items())]
+
+
+def test_histograms_and_prometheus_text(metrics):
+    for value in (0.002, 0.02, 0.2):
+        metrics.observe("vb_stage_seconds", value, {"stage": "decode"})
+    metrics.observe("vb_stage_seconds", 0.03, {"stage": "encode"}, count=4)
+    metrics.increment("vb_failures_total", {"stage": "vad", "reason": "NoSpeechError"})
+
+    decode, = series(metrics, "vb_stage_seconds", stage="decode")
+    assert decode["count"] == 3 and decode["sum"] == pytest.approx(0.222)
+    assert 0.01 < decode["p50"] <= 0.025
+    encode, = series(metrics, "vb_stage_seconds", stage="encode")
+    assert encode["count"] == 4 and encode["p99"] <= 0.05
+
+    text = metrics.prometheus_text()
+    assert "# TYPE vb_stage_seconds histogram" in text
+    assert 'vb_stage_seconds_bucket{stage="decode",le="0.005"} 1' in text
+    assert 'vb_stage_seconds_bucket{stage="decode",le="+Inf"} 3' in text
+    assert 'vb_stage_seconds_count{stage="encode"} 4' in text
+    assert 'vb_failures_total{reason="NoSpeechError",stage="vad"} 1' in text
+
+
+def test_failures_are_counted_by_stage_and_reason(metrics):
+    with pytest.raises(KeyError) as raised:
+        with stage_timer("resample"):
+            raise KeyError("rate")
+    assert record_failure(raised.value, "preprocess").startswith("resample/KeyError")
+    assert series(metrics, "vb_failures_total", stage="resample", reason="KeyError")[0]["value"] == 1
+    assert not series(metrics, "vb_stage_seconds", stage="resample")
+
+
+def test_embedding_records_every_stage(metrics, stub_model, cache_dir):
+    audio = speech_like(2.0, sample_rate=22050)
+    assert waveform_to_embedding(audio, 22050) is not None
+    stages = {s["labels"]["stage"] for s in metrics.snapshot()["vb_stage_seconds"]}
+    assert {"gain", "resample", "denoise", "vad", "encode"} <= stages
+    assert series(metrics, "vb_audio_seconds")[0]["sum"] == pytest.approx(2.0)
+    assert series(metrics, "vb_real_time_factor")[0]["count"] == 1
+
+    assert waveform_to_embedding(np.zeros(TARGET_SAMPLE_RATE, dtype=np.float32), TARGET_SAMPLE_RATE) is None
+    assert series(metrics, "vb_failures_total", stage="vad", reason="NoSpeechError")[0]["value"] == 1
+
+
+def test_worker_metrics_reach_the_parent(tmp_path, metrics, stub_model, cache_dir):
+    paths = [write_wav(tmp_path / f"spk{i}.wav", speech_like(seed=i)) for i in range(2)]
+    broken = tmp_path / "broken.wav"
+    broken.write_bytes(b"not audio")
+    stats = run_ingest_pipeline(paths + [str(broken)], MemorySink(), workers=2, progress=None)
+    assert stats.embedded == 2 and stats.failed == 1
+
+    assert series(metrics, "vb_stage_seconds", stage="vad")[0]["count"] == 2
+    assert series(metrics, "vb_stage_seconds", stage="encode")[0]["count"] == 2
+    assert series(metrics, "vb_failures_total", stage="decode")[0]["value"] == 1
+    assert series(metrics, "vb_real_time_factor")[0]["count"] == 2
+
+
+def test_vector_store_round_trips_are_timed(tmp_path, metrics):
+    index = InstrumentedIndex(LocalVectorStore(str(tmp_path / "index"), 4))
+    index.upsert([("a", [1.0, 0.0, 0.0, 0.0], {})])
+    assert index.query(vector=[1.0, 0.0, 0.0, 0.0], top_k=1)["matches"][0]["id"] == "a"
+    ops = {s["labels"]["op"] for s in series(metrics, "vb_stage_seconds", stage="vector_store")}
+    assert ops == {"upsert", "query"}
@@ -0,0 +1,34 @@
+import threading
+
+import torch
+
+from models import model_registry
+from models.model_registry import get_model, register_model, unload
+
+
+def test_loader_can_load_another_model():
+    # Exported backends load the base model from inside their own loader.
+    register_model("test-base", lambda: "base")
+    register_model("test-derived", lambda: ("derived", get_model("test-base")))
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(model=get_model("test-derived")), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    # No cleanup on failure: unload() would block on the held lock too.
+    assert not worker.is_alive(), "get_model deadlocked on a nested load"
+    assert result["model"] == ("derived", "base")
+    unload("test-derived")
+    unload("test-base")
+
+
+def test_thread_env_is_applied_on_first_load(monkeypatch):
+    previous = torch.get_num_threads()
+    monkeypatch.setitem(model_registry._threads, "intra_op", 1)
+    monkeypatch.setattr(model_registry, "_threads_applied", False)
+    register_model("test-threads", lambda: torch.get_num_threads())
+    try:
+        assert get_model("test-threads") == 1
+        assert model_registry._threads_applied
+    finally:
+        unload("test-threads")
+        torch.set_num_threads(previous)
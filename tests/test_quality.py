@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+
+from conftest import speech_like, write_wav
+from models.ingest_pipeline import MemorySink, run_ingest_pipeline
+from models.quality import QualityMeter, assess_quality
+
+
+def test_clean_speech_passes_and_bad_audio_is_rejected_with_reasons():
+    speech = speech_like(3.0)
+    report = assess_quality(speech, 16000)
+    assert report.accepted and not report.reasons
+    assert 1.0 < report.speech_seconds < 2.5 and report.snr_db > 20
+
+    assert assess_quality(np.zeros(0, dtype=np.float32), 16000).reasons == ["empty"]
+    silence = assess_quality(np.zeros(16000 * 3, dtype=np.float32), 16000)
+    assert silence.reasons == ["too_quiet", "too_short"]
+    noise = assess_quality(0.05 * np.random.default_rng(0).standard_normal(16000 * 3), 16000)
+    assert "too_short" in noise.reasons
+    assert assess_quality(speech[:4000], 16000).reasons == ["too_short"]
+    assert "clipped" in assess_quality(np.clip(10 * speech, -1, 1), 16000).reasons
+
+    noisy = speech + 0.08 * np.random.default_rng(1).standard_normal(len(speech)).astype(np.float32)
+    assert "noisy" in assess_quality(noisy, 16000).warnings
+
+
+def test_streamed_chunks_match_one_shot_and_int16_stereo():
+    speech = speech_like(3.0, sample_rate=48000)
+    pcm = (np.stack([speech, speech]) * 32767).astype(np.int16)
+    one_shot = assess_quality(pcm, 48000)
+    meter = QualityMeter()
+    for start in range(0, pcm.shape[1], 960):
+        meter.add(pcm[:, start:start + 960], 48000)
+    streamed = meter.report()
+    assert streamed.reasons == one_shot.reasons
+    assert streamed.speech_seconds == one_shot.speech_seconds
+    assert abs(streamed.snr_db - one_shot.snr_db) < 1e-6
+
+    start = time.perf_counter()
+    assess_quality(speech_like(10.0), 16000)
+    assert time.perf_counter() - start < 0.05
+
+
+def test_ingest_rejects_bad_recordings_before_preprocessing(tmp_path, stub_model, cache_dir, metrics):
+    good = write_wav(tmp_path / "good.wav", speech_like(seed=1))
+    silent = write_wav(tmp_path / "silent.wav", np.zeros(32000, dtype=np.float32))
+    sink = MemorySink()
+    stats = run_ingest_pipeline([good, silent], sink, workers=1, progress=None)
+    assert stats.embedded == 1 and stats.failed == 1
+    assert [meta["file_name"] for meta in sink.metadata] == ["good.wav"]
+
+    failures = metrics.snapshot()["vb_failures_total"]
+    assert failures == [{"labels": {"reason": "too_quiet", "stage": "quality"}, "value": 1}]
+    stages = {entry["labels"]["stage"] for entry in metrics.snapshot()["vb_stage_seconds"]}
+    assert "quality" in stages
+
+    stats = run_ingest_pipeline([silent], MemorySink(), workers=1, progress=None, quality_gate=False)
+    assert stats.failed == 1
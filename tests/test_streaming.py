@@ -0,0 +1,59 @@
+import numpy as np
+import torch
+
+from conftest import speech_like
+from models.streaming import EnergyVad, RingBuffer, StreamResampler, StreamingVerification
+from models.training_evaluation import TARGET_SAMPLE_RATE, get_resampler
+
+
+class _Verifier:
+    # Accepts everything; enough to drive a session without an index.
+    threshold = 0.25
+    cohort = None
+
+    def enrollment_vector(self, user_id):
+        return np.ones(192, dtype=np.float32)
+
+    def score(self, user_id, embedding, enrollment=None):
+        return {"score": 1.0, "threshold": self.threshold}
+
+
+def test_ring_buffer_counts_oversized_writes():
+    ring = RingBuffer(10)
+    ring.write(np.arange(25, dtype=np.float32))
+    assert ring.total == 25 and len(ring) == 10
+    np.testing.assert_array_equal(ring.latest(10), np.arange(15, 25))
+
+
+def test_resampler_chunks_and_flush_match_one_shot():
+    signal = np.random.default_rng(0).standard_normal(44100 + 123).astype(np.float32)
+    resampler = StreamResampler(44100)
+    pieces = [resampler.process(signal[i:i + 441]) for i in range(0, len(signal), 441)]
+    pieces.append(resampler.flush())
+    streamed = np.concatenate(pieces)
+    one_shot = get_resampler(44100)(torch.from_numpy(signal).unsqueeze(0))[0].numpy()
+    assert len(streamed) == len(one_shot)
+    # Away from the very end, where one-shot pads differently.
+    np.testing.assert_allclose(streamed[:-50], one_shot[:-50], atol=1e-4)
+
+
+def test_vad_flush_keeps_a_loud_partial_frame():
+    vad = EnergyVad()
+    loud = np.full(vad.frame + 100, 0.5, dtype=np.float32)
+    assert len(vad.process(loud)) == vad.frame
+    assert len(vad.flush()) == 100
+    assert len(vad.flush()) == 0
+
+
+def test_finish_scores_audio_still_held_back(stub_model):
+    speech = speech_like(seconds=2.0, sample_rate=44100)
+    session = StreamingVerification("alice", _Verifier(), background=False)
+    for i in range(0, len(speech), 441):
+        session.feed(speech[i:i + 441], 44100)
+    before = session.speech_samples
+    result = session.finish()
+    assert result["reason"] == "final" and result["accepted"]
+    assert session.speech_samples > before
+    assert session.speech_samples <= 2 * TARGET_SAMPLE_RATE
+    session.feed(speech, 44100)
+    assert session.speech_samples == result["speech_seconds"] * TARGET_SAMPLE_RATE
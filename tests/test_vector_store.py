@@ -0,0 +1,70 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from models.vector_store import LocalVectorStore, VectorStore
+
+DIM = 8
+
+
+def _vector(seed):
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+def _write_range(path, start, count):
+    store = LocalVectorStore(path, DIM)
+    for i in range(start, start + count):
+        store.upsert([(f"id-{i}", _vector(i).tolist(), {"i": i})])
+
+
+def _assert_consistent(store, seeds):
+    vectors = store.fetch([f"id-{i}" for i in seeds])["vectors"]
+    assert sorted(vectors) == sorted(f"id-{i}" for i in seeds)
+    for i in seeds:
+        np.testing.assert_array_equal(vectors[f"id-{i}"]["values"], _vector(i))
+        assert store.query(_vector(i), top_k=1)["matches"][0]["id"] == f"id-{i}"
+
+
+def test_vector_store_is_abstract():
+    with pytest.raises(TypeError):
+        VectorStore()
+
+
+def test_two_handles_do_not_overwrite_each_other(tmp_path):
+    a = LocalVectorStore(str(tmp_path), DIM)
+    b = LocalVectorStore(str(tmp_path), DIM)
+    a.upsert([("id-1", _vector(1).tolist())])
+    b.upsert([("id-2", _vector(2).tolist())])
+    a.upsert([("id-3", _vector(3).tolist())])
+    _assert_consistent(LocalVectorStore(str(tmp_path), DIM), [1, 2, 3])
+    _assert_consistent(a, [1, 2, 3])
+    _assert_consistent(b, [1, 2, 3])
+
+
+def test_handles_see_deletes_reupserts_and_compaction(tmp_path):
+    a = LocalVectorStore(str(tmp_path), DIM)
+    b = LocalVectorStore(str(tmp_path), DIM)
+    a.upsert([(f"id-{i}", _vector(i).tolist()) for i in range(5)])
+    b.delete(ids=["id-0"])
+    b.upsert([("id-1", _vector(11).tolist())])
+    assert a.describe_index_stats()["total_vector_count"] == 4
+    np.testing.assert_array_equal(a.fetch(["id-1"])["vectors"]["id-1"]["values"], _vector(11))
+
+    b.compact()
+    a.upsert([("id-9", _vector(9).tolist())])
+    _assert_consistent(b, [2, 3, 4, 9])
+    assert b.describe_index_stats()["total_vector_count"] == 5
+
+
+def test_concurrent_writer_processes(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_write_range, args=(str(tmp_path), w * 25, 25)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=120)
+        assert worker.exitcode == 0
+    store = LocalVectorStore(str(tmp_path), DIM)
+    assert store.describe_index_stats()["total_vector_count"] == 100
+    _assert_consistent(store, range(100))
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+
+from models.vector_store import LocalVectorStore
+from models.verification import COSINE_THRESHOLD, MIN_COHORT_SIZE, Cohort, Verifier
+
+DIM = 192
+
+
+def _embeddings(n, seed):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def _verifier(tmp_path, cohort):
+    verifier = Verifier(LocalVectorStore(str(tmp_path), DIM), cohort)
+    enrollment = _embeddings(1, 0)[0]
+    verifier.enroll("alice", enrollment)
+    return verifier, enrollment
+
+
+def test_as_norm_with_a_full_cohort(tmp_path):
+    cohort = Cohort(_embeddings(50, 1), [f"spk{i}" for i in range(50)])
+    verifier, enrollment = _verifier(tmp_path, cohort)
+    result = verifier.score("alice", enrollment + 0.1 * _embeddings(1, 2)[0])
+    assert result["normalization"] == "as-norm"
+    assert result["accepted"]
+    assert verifier.score("alice", _embeddings(1, 3)[0])["reason"] == "below_threshold"
+
+
+def test_cohort_of_only_the_claimed_speaker_falls_back_to_cosine(tmp_path):
+    cohort = Cohort(_embeddings(5, 1), ["alice"] * 5)
+    verifier, enrollment = _verifier(tmp_path, cohort)
+    result = verifier.score("alice", enrollment)
+    assert result["normalization"] == "none"
+    assert result["threshold"] == COSINE_THRESHOLD
+    assert result["accepted"] and np.isfinite(result["score"])
+    json.dumps(result)
+
+
+def test_small_cohort_after_exclusion_falls_back(tmp_path):
+    ids = ["alice"] * 20 + [f"spk{i}" for i in range(MIN_COHORT_SIZE - 1)]
+    cohort = Cohort(_embeddings(len(ids), 1), ids)
+    verifier, enrollment = _verifier(tmp_path, cohort)
+    assert verifier.score("alice", enrollment)["normalization"] == "none"
+    assert cohort.stats(enrollment, exclude_id="bob") is not None
+
+
+def test_not_enrolled(tmp_path):
+    verifier, _ = _verifier(tmp_path, None)
+    assert verifier.score("bob", _embeddings(1, 0)[0])["reason"] == "not_enrolled"
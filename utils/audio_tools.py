@@ -0,0 +1,210 @@
+import os
+import wave
+import time
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Bulk conversion to canonical WAV: 16 kHz, mono, 16-bit PCM, which is what
+# the embedding pipeline resamples everything to anyway. Loading a canonical
+# file skips the downmix and resample.
+#
+# Files are decoded across a process pool (ffmpeg through pydub for
+# compressed formats). An output that is newer than its source and already
+# canonical is skipped, so re-running over a growing archive only converts
+# new or changed files. Outputs are written to a temporary file and renamed,
+# so an interrupted run never leaves a truncated WAV that looks up to date.
+# Nothing is printed: every file gets a ConversionResult in the returned
+# ConversionReport.
+#
+#   python -m utils.audio_tools input_folder output_folder --workers 8
+
+TARGET_SAMPLE_RATE = 16000
+SOURCE_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".aac", ".ogg")
+# Files handed to a worker at a time.
+CHUNK_SIZE = 4
+
+ConversionResult = namedtuple("ConversionResult", ["source", "output", "status", "error"])
+
+
+class ConversionReport:
+    # status is "converted", "skipped" (up to date) or "failed".
+    def __init__(self, results=(), elapsed=0.0):
+        self.results = list(results)
+        self.elapsed = elapsed
+
+    def _with_status(self, status):
+        return [result for result in self.results if result.status == status]
+
+    @property
+    def converted(self):
+        return self._with_status("converted")
+
+    @property
+    def skipped(self):
+        return self._with_status("skipped")
+
+    @property
+    def failed(self):
+        return self._with_status("failed")
+
+    def summary(self):
+        return {
+            "converted": len(self.converted),
+            "skipped": len(self.skipped),
+            "failed": len(self.failed),
+            "elapsed": self.elapsed,
+            "errors": [{"source": r.source, "error": r.error} for r in self.failed],
+        }
+
+
+def wav_output_path(source, output_folder):
+    return os.path.join(output_folder, os.path.splitext(os.path.basename(source))[0] + ".wav")
+
+
+def is_canonical_wav(path):
+    try:
+        with wave.open(path, "rb") as f:
+            return (f.getframerate(), f.getnchannels(), f.getsampwidth()) == (TARGET_SAMPLE_RATE, 1, 2)
+    except (OSError, EOFError, wave.Error):
+        return False
+
+
+def is_up_to_date(source, output):
+    return (
+        os.path.exists(output)
+        and os.path.getmtime(output) >= os.path.getmtime(source)
+        and is_canonical_wav(output)
+    )
+
+
+def to_canonical_pcm(samples, sample_rate):
+    # samples: (channels, T) or (T,) float PCM in [-1, 1]. Downmixes, then
+    # resamples with the same torchaudio kernel as the embedding pipeline.
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=0)
+    if sample_rate != TARGET_SAMPLE_RATE:
+        import torch
+        import torchaudio
+        samples = torchaudio.functional.resample(
+            torch.from_numpy(np.ascontiguousarray(samples)), sample_rate, TARGET_SAMPLE_RATE
+        ).numpy()
+    return np.clip(np.round(samples * 32768.0), -32768, 32767).astype(np.int16)
+
+
+def write_canonical_wav(path, samples, sample_rate):
+    # Writes float PCM at any rate and channel count as a canonical WAV.
+    pcm = to_canonical_pcm(samples, sample_rate)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with wave.open(tmp_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(TARGET_SAMPLE_RATE)
+            f.writeframes(pcm.tobytes())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def decode_audio(path):
+    # (channels, T) float32 samples and the sample rate.
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(path)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    samples = samples.reshape(-1, audio.channels).T / float(1 << (8 * audio.sample_width - 1))
+    return samples, audio.frame_rate
+
+
+def convert_file(source, output):
+    try:
+        write_canonical_wav(output, *decode_audio(source))
+        return ConversionResult(source, output, "converted", None)
+    except Exception as e:
+        return ConversionResult(source, output, "failed", f"{type(e).__name__}: {e}")
+
+
+def _convert_pair(pair):
+    return convert_file(*pair)
+
+
+def _init_worker():
+    # One file per task: intra-op threads would only oversubscribe the pool.
+    import torch
+    torch.set_num_threads(1)
+
+
+def convert_files(sources, output_folder, workers=None, force=False):
+    # Converts each source to output_folder/<name>.wav and returns a
+    # ConversionReport, in the order of sources. force=True converts files
+    # that are already up to date. Two sources with the same name would
+    # overwrite one output; the later one fails instead.
+    start = time.perf_counter()
+    os.makedirs(output_folder, exist_ok=True)
+    results = {}
+    pending = []
+    seen = set()
+    for source in sources:
+        output = wav_output_path(source, output_folder)
+        if output in seen:
+            results[source] = ConversionResult(source, output, "failed", f"duplicate output name {output}")
+            continue
+        seen.add(output)
+        if not force and is_up_to_date(source, output):
+            results[source] = ConversionResult(source, output, "skipped", None)
+        else:
+            pending.append((source, output))
+
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    if workers <= 1:
+        converted = map(_convert_pair, pending)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker)
+        converted = pool.map(_convert_pair, pending, chunksize=CHUNK_SIZE)
+    try:
+        for result in converted:
+            results[result.source] = result
+    finally:
+        if workers > 1:
+            pool.shutdown()
+    return ConversionReport([results[source] for source in sources], time.perf_counter() - start)
+
+
+def list_source_files(input_folder, extensions=SOURCE_EXTENSIONS):
+    return sorted(
+        os.path.join(input_folder, name) for name in os.listdir(input_folder)
+        if name.lower().endswith(extensions)
+    )
+
+
+def convert_folder(input_folder, output_folder, workers=None, force=False, extensions=SOURCE_EXTENSIONS):
+    return convert_files(list_source_files(input_folder, extensions), output_folder, workers, force)
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a folder of audio to 16 kHz mono PCM16 WAV.")
+    parser.add_argument("input_folder")
+    parser.add_argument("output_folder")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--force", action="store_true", help="convert files that are already up to date")
+    parser.add_argument("--report", help="write the per-file report as JSON")
+    args = parser.parse_args()
+
+    report = convert_folder(args.input_folder, args.output_folder, args.workers, args.force)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump([result._asdict() for result in report.results], f, indent=2)
+    summary = report.summary()
+    print(f"✅ {summary['converted']} converted, {summary['skipped']} up to date, "
+          f"{summary['failed']} failed in {summary['elapsed']:.1f}s")
+    for error in summary["errors"]:
+        print(f"[❌ ERROR] {error['source']}: {error['error']}")